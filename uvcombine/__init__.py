@@ -4,7 +4,13 @@ from .version import version as __version__
 
 # For egg_info test builds to pass, put package imports here.
 from .uvcombine import (feather_plot, feather_simple, feather_compare,
-                        fourier_combine_cubes, feather_simple_cube)
+                        feather_compare_cube, fourier_combine_cubes,
+                        feather_simple_cube)
+from .feather_plan import FeatherPlan
+from .feather_session import FeatherSession
+from .cost_estimate import estimate_feather_cost
 
 __all__ = ['feather_plot', 'feather_simple', 'feather_compare',
-           'fourier_combine_cubes', 'feather_simple_cube']
+           'feather_compare_cube', 'fourier_combine_cubes',
+           'feather_simple_cube', 'FeatherPlan', 'FeatherSession',
+           'estimate_feather_cost']
@@ -0,0 +1,147 @@
+"""
+Radial binning of fftshifted 2D Fourier transforms, shared by the
+Fourier-space diagnostics (e.g., `~uvcombine.feather_plot` and
+`~uvcombine.feather_compare`).
+"""
+
+import numpy as np
+from astropy import units as u
+
+from .cache import ArrayCache
+
+__all__ = ['AnnulusIndex', 'annulus_cache']
+
+# Cache of the radial grids, shared by all `AnnulusIndex` objects
+annulus_cache = ArrayCache(max_bytes=128 * 2**20)
+
+
+def _annulus_arrays(nax2, nax1, pixscale):
+
+    # Radius of each pixel from the centre of the fftshifted grid, in
+    # pixels of the Fourier plane
+    yy, xx = np.indices([nax2, nax1])
+    rr = ((xx-(nax1-1)/2.)**2 + (yy-(nax2-1)/2.)**2)**0.5
+
+    with np.errstate(divide='ignore'):
+        angscales = nax1/rr * pixscale
+
+    # Annuli of one pixel width
+    bin_ids = np.floor(rr).astype(np.intp)
+    counts = np.bincount(bin_ids.ravel())
+
+    return bin_ids, counts, angscales
+
+
+class AnnulusIndex(object):
+    '''
+    Annuli of one pixel width around the zero frequency of an fftshifted 2D
+    Fourier transform, and the angular scale of each pixel.
+
+    The grids only depend on the shape and the pixel scale. They are kept in
+    `annulus_cache` and shared by all indices with the same geometry.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the images ``(nax2, nax1)``.
+    pixscale : `~astropy.units.Quantity` or float
+        Pixel scale of the images. Floats are taken to be in degrees.
+
+    Attributes
+    ----------
+    bin_ids : `~numpy.ndarray`
+        The annulus of each pixel.
+    counts : `~numpy.ndarray`
+        The number of pixels in each annulus.
+    angscales : `~astropy.units.Quantity`
+        The angular scale of each pixel, in units of ``pixscale``.
+    '''
+
+    def __init__(self, shape, pixscale):
+
+        if not hasattr(pixscale, 'unit'):
+            pixscale = u.Quantity(pixscale, u.deg)
+
+        self.shape = tuple(shape)
+        self.pixscale = pixscale
+
+        nax2, nax1 = self.shape
+        key = ('annulus_index', nax2, nax1, float(pixscale.value),
+               pixscale.unit.to_string())
+        self.bin_ids, self.counts, angscales = \
+            annulus_cache.get(key, lambda: _annulus_arrays(nax2, nax1,
+                                                           pixscale.value))
+
+        self.angscales = u.Quantity(angscales, pixscale.unit, copy=False)
+
+    @property
+    def nbins(self):
+        '''
+        Number of annuli.
+        '''
+        return self.counts.size
+
+    @property
+    def radii(self):
+        '''
+        Radius of the centre of each annulus, in pixels of the Fourier plane.
+        '''
+        return np.arange(self.nbins) + 0.5
+
+    @property
+    def radial_angscales(self):
+        '''
+        Angular scale of the centre of each annulus.
+        '''
+        return self.shape[1] / self.radii * self.pixscale
+
+    def azimuthal_average(self, *images):
+        '''
+        Average each image over the annuli. All of the images are averaged
+        together with a single `~numpy.bincount`. Non-finite values are
+        ignored, and annuli without finite values are NaN.
+
+        Parameters
+        ----------
+        images : `~numpy.ndarray`
+            fftshifted images with the shape of the index.
+
+        Returns
+        -------
+        radii : `~numpy.ndarray`
+            The radius of each annulus (see `AnnulusIndex.radii`).
+        averages : `~numpy.ndarray`
+            The azimuthal average of each image, with shape
+            ``(len(images), nbins)``, or ``(nbins,)`` for a single image.
+        '''
+
+        for image in images:
+            if np.shape(image) != self.shape:
+                raise ValueError("The images must have the shape {0} of the"
+                                 " index, not {1}.".format(self.shape,
+                                                           np.shape(image)))
+
+        nimages = len(images)
+        values = np.empty((nimages,) + self.shape)
+        for value, image in zip(values, images):
+            value[...] = image
+        values = values.reshape(nimages, -1)
+
+        # Offset the annuli of each image so they are binned together
+        ids = (self.bin_ids.reshape(1, -1) +
+               self.nbins * np.arange(nimages)[:, np.newaxis])
+
+        finite = np.isfinite(values)
+        ids = ids[finite]
+
+        sums = np.bincount(ids, weights=values[finite],
+                           minlength=nimages * self.nbins)
+        counts = np.bincount(ids, minlength=nimages * self.nbins)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averages = (sums / counts).reshape(nimages, self.nbins)
+
+        if nimages == 1:
+            averages = averages[0]
+
+        return self.radii, averages
@@ -0,0 +1,132 @@
+"""
+Bounded cache for arrays that are expensive to rebuild, such as the feather
+kernels returned by `~uvcombine.uvcombine.feather_kernel`.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+__all__ = ['ArrayCache', 'kernel_cache']
+
+
+class ArrayCache(object):
+    '''
+    Least-recently-used cache of read-only arrays, bounded by their total size
+    in bytes.
+
+    Each entry is a tuple of arrays. The arrays are made read-only before
+    being stored so that they can be shared between callers safely.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum total size of the cached arrays. The least recently used
+        entries are evicted when this is exceeded. Entries larger than
+        ``max_bytes`` are not cached.
+    '''
+
+    def __init__(self, max_bytes=256 * 2**20):
+
+        self.max_bytes = int(max_bytes)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, factory):
+        '''
+        Return the arrays stored under ``key``, calling ``factory()`` to create
+        and store them when missing.
+
+        Parameters
+        ----------
+        key : hashable
+            The cache key.
+        factory : callable
+            Function with no arguments returning a tuple of arrays.
+
+        Returns
+        -------
+        arrays : tuple of `~numpy.ndarray`
+            The read-only cached arrays.
+        '''
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            self.misses += 1
+
+        arrays = tuple(factory())
+        for arr in arrays:
+            arr.setflags(write=False)
+
+        nbytes = sum(arr.nbytes for arr in arrays)
+
+        with self._lock:
+            if nbytes > self.max_bytes or key in self._entries:
+                return arrays
+
+            self._entries[key] = arrays
+            self.nbytes += nbytes
+            self._evict()
+
+        return arrays
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._entries:
+            _, arrays = self._entries.popitem(last=False)
+            self.nbytes -= sum(arr.nbytes for arr in arrays)
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        '''
+        Change the maximum size of the cache, evicting entries if needed.
+        '''
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def clear(self):
+        '''
+        Remove all entries and reset the statistics.
+        '''
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        '''
+        Return the hit and miss counts, the number of evictions, and the
+        number and total size of the entries.
+        '''
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries),
+                    'nbytes': self.nbytes,
+                    'max_bytes': self.max_bytes}
+
+
+# Cache shared by all calls to `~uvcombine.uvcombine.feather_kernel`. Only the
+# low-resolution kernel is stored, so 1 GB fits the full-plane float64 kernel
+# of an 8192 x 8192 mosaic twice over.
+kernel_cache = ArrayCache(max_bytes=2**30)
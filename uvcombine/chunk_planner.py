@@ -0,0 +1,220 @@
+"""
+Choose how many channels to feather at once, and with how many workers, to
+stay within a memory budget.
+"""
+
+import os
+
+import numpy as np
+from astropy import units as u
+
+__all__ = ['DEFAULT_MEMORY_LIMIT', 'ChunkPlan', 'bytes_per_channel',
+           'memory_limit_bytes', 'plan_feather_chunks']
+
+# Default memory budget, in bytes, when none is given.
+DEFAULT_MEMORY_LIMIT = 256 * 2**20
+
+
+def memory_limit_bytes(memory_limit):
+    '''
+    Convert a memory limit given as a number of bytes, a
+    `~astropy.units.Quantity` or a string (e.g., '2 GB') to bytes.
+    ``None`` gives ``DEFAULT_MEMORY_LIMIT``.
+    '''
+
+    if memory_limit is None:
+        return DEFAULT_MEMORY_LIMIT
+
+    if isinstance(memory_limit, str):
+        memory_limit = u.Quantity(memory_limit)
+
+    if isinstance(memory_limit, u.Quantity):
+        memory_limit = memory_limit.to(u.byte).value
+
+    if memory_limit <= 0:
+        raise ValueError("memory_limit must be positive.")
+
+    return int(memory_limit)
+
+
+def bytes_per_channel(shape, dtype=float, use_rfft=True, shape_lo=None):
+    '''
+    Peak memory used to feather one channel with `~uvcombine.fftmerge`.
+
+    The arrays live at the peak are:
+
+    * the high- and low-resolution input planes,
+    * their scaled and NaN-filled work buffers passed to the FFTs,
+    * the two forward spectra, which are weighted and combined in place,
+    * the inverse transform (complex without ``use_rfft``) and the real
+      output plane.
+
+    Parameters
+    ----------
+    shape : tuple
+        Spatial shape of the high-resolution planes.
+    dtype : `~numpy.dtype`, optional
+        Real data type of the feathering (see `~uvcombine.fftmerge`).
+    use_rfft : bool, optional
+        Whether the half-plane real-input transforms are used.
+    shape_lo : tuple, optional
+        Spatial shape of the low-resolution planes when they are regridded
+        onto the high-resolution grid while feathering.
+
+    Returns
+    -------
+    nbytes : int
+        Number of bytes per channel.
+    '''
+
+    itemsize = np.dtype(dtype).itemsize
+    nax2, nax1 = shape
+
+    real_plane = nax2 * nax1 * itemsize
+    if use_rfft:
+        spectrum = nax2 * (nax1 // 2 + 1) * 2 * itemsize
+    else:
+        spectrum = nax2 * nax1 * 2 * itemsize
+
+    # inputs, filled copies and the output
+    nbytes = 5 * real_plane
+    # two forward spectra, combined in place
+    nbytes += 2 * spectrum
+    # the full-plane inverse is complex
+    if not use_rfft:
+        nbytes += spectrum
+
+    if shape_lo is not None:
+        nbytes += int(np.prod(shape_lo)) * itemsize
+
+    return int(nbytes)
+
+
+class ChunkPlan(object):
+    '''
+    The number of channels per chunk and workers chosen by
+    `plan_feather_chunks`.
+
+    Attributes
+    ----------
+    nchan : int
+        Number of channels in the cube.
+    channels_per_chunk : int
+        Number of channels feathered together by each worker.
+    n_workers : int
+        Number of workers feathering chunks at the same time.
+    bytes_per_channel : int
+        Peak memory needed to feather one channel.
+    memory_limit : int
+        The memory budget in bytes.
+    '''
+
+    def __init__(self, nchan, channels_per_chunk, n_workers,
+                 bytes_per_channel, memory_limit):
+        self.nchan = nchan
+        self.channels_per_chunk = channels_per_chunk
+        self.n_workers = n_workers
+        self.bytes_per_channel = bytes_per_channel
+        self.memory_limit = memory_limit
+
+    @property
+    def nchunks(self):
+        '''
+        Number of chunks along the spectral axis.
+        '''
+        return -(-self.nchan // self.channels_per_chunk)
+
+    @property
+    def peak_bytes(self):
+        '''
+        Estimated peak memory when all of the workers are busy.
+        '''
+        return self.n_workers * self.channels_per_chunk * self.bytes_per_channel
+
+    def __repr__(self):
+        return ("ChunkPlan(nchan={0}, channels_per_chunk={1}, n_workers={2},"
+                " peak={3:.1f} MB, memory_limit={4:.1f} MB)"
+                .format(self.nchan, self.channels_per_chunk, self.n_workers,
+                        self.peak_bytes / 2**20, self.memory_limit / 2**20))
+
+    def summary(self):
+        '''
+        Return a multi-line description of the plan.
+        '''
+        lines = ["Feather chunk plan",
+                 "  channels:            {0}".format(self.nchan),
+                 "  channels per chunk:  {0}".format(self.channels_per_chunk),
+                 "  chunks:              {0}".format(self.nchunks),
+                 "  workers:             {0}".format(self.n_workers),
+                 "  memory per channel:  {0:.2f} MB".format(self.bytes_per_channel / 2**20),
+                 "  estimated peak:      {0:.2f} MB".format(self.peak_bytes / 2**20),
+                 "  memory limit:        {0:.2f} MB".format(self.memory_limit / 2**20)]
+        return "\n".join(lines)
+
+
+def plan_feather_chunks(shape, dtype=float, memory_limit=None, n_workers=None,
+                        use_rfft=True, shape_lo=None, strict=True):
+    '''
+    Choose the number of channels per chunk and the number of workers so that
+    feathering a cube stays within ``memory_limit``.
+
+    The number of workers is reduced if even one channel per worker does not
+    fit in the budget. The chunks are made small enough that every worker
+    gets at least one. Without a ``memory_limit``, at least one channel is
+    feathered at a time, even when it needs more than the default budget.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the high-resolution cube ``(nchan, nax2, nax1)``.
+    dtype : `~numpy.dtype`, optional
+        Real data type of the feathering.
+    memory_limit : int, str or `~astropy.units.Quantity`, optional
+        Total memory budget in bytes, or a quantity with information units
+        (e.g., ``'8 GB'``). Defaults to ``DEFAULT_MEMORY_LIMIT``. A
+        ValueError is raised when a given limit cannot fit one channel,
+        unless ``strict`` is disabled.
+    n_workers : int, optional
+        Maximum number of workers. Defaults to the number of CPUs.
+    use_rfft : bool, optional
+        Whether the half-plane real-input transforms are used.
+    shape_lo : tuple, optional
+        Spatial shape of the low-resolution planes, when they are regridded
+        while feathering.
+    strict : bool, optional
+        Raise a ValueError when ``memory_limit`` cannot fit one channel.
+        When False, one channel is feathered at a time and the plan's
+        ``peak_bytes`` exceeds the limit.
+
+    Returns
+    -------
+    plan : `ChunkPlan`
+        The chosen chunking.
+    '''
+
+    nchan = shape[0]
+    limit = memory_limit_bytes(memory_limit)
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers < 1:
+        raise ValueError("n_workers must be at least 1.")
+
+    per_channel = bytes_per_channel(shape[1:], dtype=dtype, use_rfft=use_rfft,
+                                    shape_lo=shape_lo)
+
+    max_channels = limit // per_channel
+    if max_channels < 1 and (memory_limit is None or not strict):
+        max_channels = 1
+    elif max_channels < 1:
+        raise ValueError("memory_limit of {0:.1f} MB is too small to feather a"
+                         " single channel, which needs {1:.1f} MB."
+                         .format(limit / 2**20, per_channel / 2**20))
+
+    n_workers = int(min(n_workers, max_channels, max(nchan, 1)))
+
+    channels_per_chunk = int(max_channels // n_workers)
+    # Keep all of the workers busy
+    channels_per_chunk = max(1, min(channels_per_chunk, -(-nchan // n_workers)))
+
+    return ChunkPlan(nchan, channels_per_chunk, n_workers, per_channel, limit)
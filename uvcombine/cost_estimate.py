@@ -0,0 +1,464 @@
+"""
+Estimate the memory and run time of `~uvcombine.feather_simple_cube` before
+running it.
+
+Only the headers, shapes, beams and chunking of the cubes are inspected; no
+data is read. The run time is extrapolated from short timings of an FFT and of
+a memory copy on the current machine.
+"""
+
+import os
+import time
+
+import numpy as np
+from astropy import units as u
+from spectral_cube import SpectralCube, DaskSpectralCube
+
+from .chunk_planner import (ChunkPlan, bytes_per_channel, memory_limit_bytes,
+                            plan_feather_chunks)
+from .fft_backend import rfft2, irfft2, fft2, ifft2
+
+__all__ = ['FeatherStage', 'FeatherCost', 'benchmark_fft',
+           'benchmark_bandwidth', 'estimate_feather_cost']
+
+# Approximate size, in bytes per output pixel, of the sparse matrix used by
+# `~uvcombine.reproject_map.ReprojectionMap`.
+_REPROJECTION_BYTES_PER_PIXEL = 48
+
+
+def benchmark_fft(shape, dtype=float, use_rfft=True, repeat=3,
+                  max_pixels=2**20):
+    '''
+    Time a forward and an inverse 2D FFT of one plane with the current FFT
+    backend (see `~uvcombine.fft_backend`).
+
+    Planes with more than ``max_pixels`` pixels are not transformed. The time
+    of a smaller plane is scaled by :math:`N \\log N` instead.
+
+    Parameters
+    ----------
+    shape : tuple
+        Spatial shape of the planes.
+    dtype : `~numpy.dtype`, optional
+        Real data type of the planes.
+    use_rfft : bool, optional
+        Time the half-plane real-input transforms.
+    repeat : int, optional
+        The fastest of ``repeat`` timings is used.
+    max_pixels : int, optional
+        Largest plane to transform.
+
+    Returns
+    -------
+    seconds : float
+        The mean time of one transform of a plane of ``shape``.
+    '''
+
+    npix = int(np.prod(shape))
+
+    bench_shape = tuple(shape)
+    if npix > max_pixels:
+        scale = np.sqrt(max_pixels / npix)
+        bench_shape = tuple(max(int(nn * scale), 2) for nn in shape)
+
+    plane = np.random.default_rng(0).normal(size=bench_shape).astype(dtype)
+
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        if use_rfft:
+            irfft2(rfft2(plane), s=bench_shape)
+        else:
+            ifft2(fft2(plane))
+        best = min(best, time.perf_counter() - t0)
+
+    bench_npix = int(np.prod(bench_shape))
+    scale = (npix * np.log2(npix)) / (bench_npix * np.log2(bench_npix))
+
+    return 0.5 * best * scale
+
+
+def benchmark_bandwidth(nbytes=32 * 2**20, repeat=3):
+    '''
+    Measure the memory bandwidth by copying an array of ``nbytes``.
+
+    Returns
+    -------
+    bandwidth : float
+        Bytes read and written per second.
+    '''
+
+    src = np.ones(nbytes // 8)
+    dst = np.empty_like(src)
+
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        np.copyto(dst, src)
+        best = min(best, time.perf_counter() - t0)
+
+    return 2 * src.nbytes / max(best, 1e-9)
+
+
+class FeatherStage(object):
+    '''
+    One step of feathering a cube.
+
+    Attributes
+    ----------
+    name : str
+        Name of the stage.
+    runs : bool
+        Whether the stage is needed for these cubes.
+    nbytes : int
+        Bytes read and written by the stage.
+    nfft : int
+        Number of 2D FFTs computed by the stage.
+    seconds : float or None
+        Estimated run time, when benchmarked.
+    note : str
+        Why the stage runs or is skipped.
+    '''
+
+    def __init__(self, name, runs, nbytes=0, nfft=0, note=''):
+        self.name = name
+        self.runs = runs
+        self.nbytes = int(nbytes) if runs else 0
+        self.nfft = int(nfft) if runs else 0
+        self.note = note
+        self.seconds = None
+
+    def __repr__(self):
+        return ("FeatherStage(name={0!r}, runs={1}, nbytes={2:.1f} MB,"
+                " nfft={3})".format(self.name, self.runs,
+                                    self.nbytes / 2**20, self.nfft))
+
+
+class FeatherCost(object):
+    '''
+    Estimated cost of `~uvcombine.feather_simple_cube`, returned by
+    `estimate_feather_cost`.
+
+    Attributes
+    ----------
+    stages : list of `FeatherStage`
+        The stages, in the order they run.
+    chunk_plan : `~uvcombine.chunk_planner.ChunkPlan`
+        The channels feathered at once and the number of workers.
+    peak_bytes : int
+        Estimated peak memory.
+    use_dask : bool
+        Whether the dask implementation is used.
+    '''
+
+    def __init__(self, stages, chunk_plan, peak_bytes, use_dask):
+        self.stages = stages
+        self.chunk_plan = chunk_plan
+        self.peak_bytes = int(peak_bytes)
+        self.use_dask = use_dask
+
+    def __getitem__(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    @property
+    def nbytes(self):
+        '''
+        Total bytes read and written by the stages that run.
+        '''
+        return sum(stage.nbytes for stage in self.stages)
+
+    @property
+    def seconds(self):
+        '''
+        Estimated total run time, or None when not benchmarked.
+        '''
+        times = [stage.seconds for stage in self.stages if stage.runs]
+        if any(tt is None for tt in times):
+            return None
+        return sum(times)
+
+    def fits_in(self, memory_limit):
+        '''
+        Whether the estimated peak memory is within ``memory_limit`` (in bytes,
+        or a quantity or string such as ``'8 GB'``).
+        '''
+        return self.peak_bytes <= memory_limit_bytes(memory_limit)
+
+    def __repr__(self):
+        seconds = self.seconds
+        seconds = "None" if seconds is None else "{0:.2f} s".format(seconds)
+        return ("FeatherCost(stages={0}, nbytes={1:.1f} MB, peak={2:.1f} MB,"
+                " seconds={3})".format([stage.name for stage in self.stages
+                                        if stage.runs],
+                                       self.nbytes / 2**20,
+                                       self.peak_bytes / 2**20, seconds))
+
+    def summary(self):
+        '''
+        Return a multi-line description of the estimate.
+        '''
+        lines = ["Feather cost estimate ({0})"
+                 .format("dask" if self.use_dask else "in memory")]
+
+        for stage in self.stages:
+            if stage.runs:
+                line = "  {0:<22s} {1:10.1f} MB".format(stage.name,
+                                                        stage.nbytes / 2**20)
+                if stage.nfft:
+                    line += " {0:8d} FFTs".format(stage.nfft)
+                if stage.seconds is not None:
+                    line += " {0:10.2f} s".format(stage.seconds)
+            else:
+                line = "  {0:<22s} skipped".format(stage.name)
+            if stage.note:
+                line += " ({0})".format(stage.note)
+            lines.append(line)
+
+        lines.append("  channels per chunk:    {0}"
+                     .format(self.chunk_plan.channels_per_chunk))
+        lines.append("  workers:               {0}"
+                     .format(self.chunk_plan.n_workers))
+        lines.append("  estimated peak:        {0:.2f} MB"
+                     .format(self.peak_bytes / 2**20))
+        if self.seconds is not None:
+            lines.append("  estimated time:        {0:.2f} s"
+                         .format(self.seconds))
+
+        return "\n".join(lines)
+
+
+def estimate_feather_cost(cube_hi, cube_lo,
+                          allow_spectral_resample=True,
+                          use_memmap=True,
+                          use_dask=False,
+                          force_spatial_rechunk=True,
+                          channels_per_chunk='auto',
+                          allow_lo_reproj=True,
+                          memory_limit=None,
+                          n_workers=1,
+                          dtype=float,
+                          beam_tolerance=0.,
+                          use_rfft=True,
+                          match_units=True,
+                          benchmark=True):
+    '''
+    Estimate the stages, bytes moved, peak memory and run time of
+    `~uvcombine.feather_simple_cube` without reading the data.
+
+    The arguments are those of `~uvcombine.feather_simple_cube`. The dask
+    implementation is assumed when both cubes are
+    `~spectral_cube.DaskSpectralCube`.
+
+    The estimate is approximate: the bytes of each stage are those read and
+    written once, and the peak memory uses
+    `~uvcombine.chunk_planner.bytes_per_channel` for the feathering. The
+    run time is the number of FFTs times the time of one FFT (see
+    `benchmark_fft`) split between the workers, plus the bytes moved divided
+    by the memory bandwidth (see `benchmark_bandwidth`). Reading the cubes
+    from disk is not included.
+
+    The estimate is returned even when a channel does not fit in
+    ``memory_limit``; the chunk plan then uses one channel per chunk. Use
+    `FeatherCost.fits_in` to check the peak against a budget.
+
+    Parameters
+    ----------
+    cube_hi : '~spectral_cube.SpectralCube' or str
+        The high-resolution spectral-cube or name of FITS file.
+    cube_lo : '~spectral_cube.SpectralCube' or str
+        The low-resolution spectral-cube or name of FITS file.
+    benchmark : bool, optional
+        Time an FFT and a memory copy to estimate the run time. When False,
+        the times are None.
+
+    Returns
+    -------
+    cost : `FeatherCost`
+        The estimate.
+    '''
+
+    if not hasattr(cube_hi, 'shape'):
+        cube_hi = SpectralCube.read(cube_hi, use_dask=use_dask)
+    if not hasattr(cube_lo, 'shape'):
+        cube_lo = SpectralCube.read(cube_lo, use_dask=use_dask)
+
+    use_dask = (isinstance(cube_hi, DaskSpectralCube) and
+                isinstance(cube_lo, DaskSpectralCube))
+
+    nchan = cube_hi.shape[0]
+    shape_hi = cube_hi.shape[1:]
+    shape_lo = cube_lo.shape[1:]
+
+    npix_hi = int(np.prod(shape_hi))
+    npix_lo = int(np.prod(shape_lo))
+
+    # Intermediate cubes are in double precision
+    itemsize = np.dtype(float).itemsize
+    itemsize_lo = cube_lo._data.dtype.itemsize
+    itemsize_out = np.dtype(dtype).itemsize
+
+    stages = []
+
+    # Spectral interpolation
+    if cube_lo.shape[0] == nchan:
+        is_spec_matched = np.isclose(cube_lo.spectral_axis,
+                                     cube_hi.spectral_axis).all()
+    else:
+        is_spec_matched = False
+
+    if not is_spec_matched and not allow_spectral_resample:
+        raise ValueError("Spectral axes do not match. Enable `allow_spectrum_resample` to "
+                         "spectrally match the low resolution to high resolution data.")
+
+    stages.append(FeatherStage('spectral_interpolate', not is_spec_matched,
+                               nbytes=(cube_lo.size * itemsize_lo +
+                                       nchan * npix_lo * itemsize),
+                               note=("{0} to {1} channels".format(cube_lo.shape[0], nchan)
+                                     if not is_spec_matched else
+                                     "spectral axes match")))
+
+    # Celestial reprojection
+    is_wcs_eq = cube_hi.wcs.celestial.wcs.compare(cube_lo.wcs.celestial.wcs)
+    needs_regrid = not (is_wcs_eq and shape_hi == shape_lo)
+
+    if needs_regrid and use_dask and not allow_lo_reproj:
+        raise ValueError("The cube_lo array shape does not match the cube_hi"
+                         " shape. Enable `allow_lo_reproj` or reproject cube_lo"
+                         " before feathering.")
+
+    stages.append(FeatherStage('reproject', needs_regrid,
+                               nbytes=nchan * (npix_lo + npix_hi) * itemsize,
+                               note=("{0} to {1}".format(shape_lo, shape_hi)
+                                     if needs_regrid else "pixel grids match")))
+
+    # Brightness unit conversion
+    jybm_unit = u.Jy / u.beam
+    rescale_jybm = match_units and cube_hi.unit.is_equivalent(jybm_unit)
+    convert_units = match_units and (cube_lo.unit != cube_hi.unit or rescale_jybm)
+
+    if not convert_units:
+        unit_note = "units match"
+    elif use_dask:
+        unit_note = "{0} to {1}".format(cube_lo.unit, cube_hi.unit)
+    else:
+        unit_note = "applied to each slab of channels"
+
+    stages.append(FeatherStage('unit_conversion', convert_units,
+                               nbytes=2 * nchan * npix_hi * itemsize,
+                               note=unit_note))
+
+    # Number of kernels
+    if hasattr(cube_lo, 'beams'):
+        from .feather_plan import group_channels_by_beam
+
+        group_beams, _ = group_channels_by_beam(cube_lo.beams,
+                                                tolerance=beam_tolerance)
+        nkernels = len(group_beams)
+    else:
+        nkernels = 1
+
+    if use_rfft:
+        kernel_bytes = 2 * shape_hi[0] * (shape_hi[1] // 2 + 1) * itemsize_out
+    else:
+        kernel_bytes = 2 * npix_hi * itemsize_out
+
+    per_channel = bytes_per_channel(shape_hi, dtype=dtype, use_rfft=use_rfft)
+
+    if use_dask:
+        import dask
+        from dask.array.core import normalize_chunks
+
+        if n_workers > 1:
+            dask_workers = n_workers
+        else:
+            dask_workers = dask.config.get('num_workers', None) or os.cpu_count() or 1
+
+        if memory_limit is not None and channels_per_chunk == 'auto':
+            chunk_plan = plan_feather_chunks(cube_hi.shape, dtype=dtype,
+                                             memory_limit=memory_limit,
+                                             n_workers=dask_workers,
+                                             use_rfft=use_rfft,
+                                             strict=False)
+        else:
+            current_chunks = cube_hi._data.chunksize
+            if force_spatial_rechunk:
+                chunks = normalize_chunks((channels_per_chunk, -1, -1),
+                                          shape=cube_hi.shape,
+                                          dtype=cube_hi._data.dtype)
+                nchunk = chunks[0][0]
+            else:
+                nchunk = current_chunks[0]
+
+            chunk_plan = ChunkPlan(nchan, nchunk, min(dask_workers, -(-nchan // nchunk)),
+                                   per_channel, memory_limit_bytes(memory_limit))
+
+        target_chunks = (chunk_plan.channels_per_chunk,) + shape_hi
+
+        # The reprojected cube is created with the chunks of cube_hi
+        rechunk_bytes = 0
+        if force_spatial_rechunk:
+            if cube_hi._data.chunksize != target_chunks:
+                rechunk_bytes += 2 * cube_hi.size * cube_hi._data.dtype.itemsize
+            if not needs_regrid and cube_lo._data.chunksize != target_chunks:
+                rechunk_bytes += 2 * nchan * npix_hi * itemsize
+
+        if not force_spatial_rechunk:
+            rechunk_note = "force_spatial_rechunk=False"
+        elif rechunk_bytes > 0:
+            rechunk_note = "to chunks of {0}".format(target_chunks)
+        else:
+            rechunk_note = "chunks match"
+
+        stages.append(FeatherStage('rechunk', rechunk_bytes > 0,
+                                   nbytes=rechunk_bytes, note=rechunk_note))
+
+        # Every worker holds its chunks of both cubes and the FFT temporaries
+        peak_bytes = chunk_plan.peak_bytes
+        # The lazy spectral interpolation and reprojection hold a chunk of
+        # the low resolution cube on its own grid.
+        if needs_regrid or not is_spec_matched:
+            peak_bytes += (chunk_plan.n_workers * chunk_plan.channels_per_chunk *
+                           npix_lo * (itemsize_lo + itemsize))
+
+    else:
+        chunk_plan = plan_feather_chunks(cube_hi.shape, dtype=dtype,
+                                         memory_limit=memory_limit,
+                                         n_workers=n_workers,
+                                         use_rfft=use_rfft,
+                                         shape_lo=shape_lo if needs_regrid else None,
+                                         strict=False)
+
+        stages.append(FeatherStage('rechunk', False,
+                                   note="only used with dask"))
+
+        peak_bytes = chunk_plan.peak_bytes
+        # The output cube is in memory without use_memmap
+        if not use_memmap:
+            peak_bytes += nchan * npix_hi * itemsize_out
+        # spectral_interpolate returns an in-memory cube
+        if not is_spec_matched:
+            peak_bytes += nchan * npix_lo * itemsize
+
+    if needs_regrid:
+        peak_bytes += _REPROJECTION_BYTES_PER_PIXEL * npix_hi
+    peak_bytes += nkernels * kernel_bytes
+
+    # Two forward transforms and one inverse per channel
+    stages.append(FeatherStage('feather', True,
+                               nbytes=nchan * npix_hi * 3 * itemsize_out,
+                               nfft=3 * nchan,
+                               note="{0} kernel(s)".format(nkernels)))
+
+    if benchmark:
+        bandwidth = benchmark_bandwidth()
+        fft_seconds = benchmark_fft(shape_hi, dtype=dtype, use_rfft=use_rfft)
+
+        for stage in stages:
+            stage.seconds = stage.nbytes / bandwidth
+            if stage.nfft:
+                stage.seconds += stage.nfft * fft_seconds / chunk_plan.n_workers
+
+    return FeatherCost(stages, chunk_plan, peak_bytes, use_dask)
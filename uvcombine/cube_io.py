@@ -0,0 +1,371 @@
+"""
+Write feathered cubes directly into their output files, and record which
+channels have been written so an interrupted run can be resumed.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+from astropy.io import fits
+
+__all__ = ['create_fits_cube', 'open_fits_cube', 'feather_params_hash',
+           'FeatherCheckpoint', 'is_zarr_path', 'zarr_chunks_for_spectra',
+           'write_zarr_cube', 'read_zarr_cube']
+
+# Target size of the chunks of zarr outputs, in bytes
+ZARR_CHUNK_BYTES = 64 * 2**20
+
+
+def create_fits_cube(filename, header, shape, dtype=float, overwrite=False):
+    '''
+    Preallocate a FITS file for a cube and return its data section as a
+    writable memory-mapped array.
+
+    Only the header is written; the data section is allocated by extending
+    the file to its final size, so no data is copied. Values written to the
+    returned array go straight into the file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the FITS file to create.
+    header : `~astropy.io.fits.Header`
+        Header of the cube. The BITPIX and NAXIS keywords are set from
+        ``shape`` and ``dtype``.
+    shape : tuple
+        Shape of the cube.
+    dtype : `~numpy.dtype`, optional
+        Floating point type of the data, ``np.float32`` or ``np.float64``.
+    overwrite : bool, optional
+        Replace ``filename`` if it exists.
+
+    Returns
+    -------
+    data : `~numpy.memmap`
+        The (big-endian) data section of the file.
+    '''
+
+    dtype = np.dtype(dtype)
+    if dtype.kind != 'f':
+        raise TypeError("dtype must be a floating point type, not {0}."
+                        .format(dtype))
+
+    # Create the header from a stub array of the same type and number of
+    # dimensions, then give it the full shape.
+    stub = np.zeros((1,) * len(shape), dtype=dtype)
+    hdu = fits.PrimaryHDU(data=stub, header=header.copy())
+    for ii, nn in enumerate(shape[::-1]):
+        hdu.header['NAXIS{0}'.format(ii + 1)] = nn
+
+    header_bytes = len(hdu.header.tostring())
+    data_bytes = int(np.prod(shape)) * dtype.itemsize
+    # The data section is padded to a multiple of the FITS block size
+    padded_bytes = -(-data_bytes // 2880) * 2880
+
+    hdu.header.tofile(filename, overwrite=overwrite)
+
+    with open(filename, 'rb+') as fobj:
+        fobj.seek(header_bytes + padded_bytes - 1)
+        fobj.write(b'\0')
+
+    return np.memmap(filename, dtype=dtype.newbyteorder('>'), mode='r+',
+                     offset=header_bytes, shape=tuple(shape))
+
+
+def open_fits_cube(filename, mode='r+'):
+    '''
+    Memory-map the data section of a FITS cube, such as one created by
+    `create_fits_cube`.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the FITS file.
+    mode : str, optional
+        Mode passed to `~numpy.memmap`.
+
+    Returns
+    -------
+    data : `~numpy.memmap`
+        The data of the primary HDU.
+    '''
+
+    with fits.open(filename) as hdulist:
+        header = hdulist[0].header
+        offset = hdulist.fileinfo(0)['datLoc']
+
+    bitpix_dtypes = {-32: '>f4', -64: '>f8'}
+    if header['BITPIX'] not in bitpix_dtypes:
+        raise TypeError("{0} does not contain floating point data (BITPIX={1})."
+                        .format(filename, header['BITPIX']))
+
+    shape = tuple(header['NAXIS{0}'.format(ii)]
+                  for ii in range(header['NAXIS'], 0, -1))
+
+    return np.memmap(filename, dtype=bitpix_dtypes[header['BITPIX']],
+                     mode=mode, offset=offset, shape=shape)
+
+
+def feather_params_hash(cube_hi, cube_lo, **params):
+    '''
+    Hash of the headers and beams of two cubes and of the feathering
+    parameters, used to check that a run is resumed with the same inputs.
+
+    The data are not read. Array parameters (e.g., ``weights``) are compared
+    by value and other parameters through their `repr`.
+    '''
+
+    sha = hashlib.sha256()
+
+    for cube in (cube_hi, cube_lo):
+        sha.update(repr(cube.shape).encode())
+        sha.update(cube.header.tostring().encode())
+        if hasattr(cube, 'beams'):
+            sha.update(np.ascontiguousarray(cube.beams.major.value).tobytes())
+            sha.update(np.ascontiguousarray(cube.beams.minor.value).tobytes())
+            sha.update(np.ascontiguousarray(cube.beams.pa.value).tobytes())
+
+    for key in sorted(params):
+        value = params[key]
+        if isinstance(value, np.ndarray) and value.ndim > 0:
+            sha.update("{0}={1!r}{2};".format(key, value.dtype, value.shape).encode())
+            sha.update(np.ascontiguousarray(value).tobytes())
+        else:
+            sha.update("{0}={1!r};".format(key, value).encode())
+
+    return sha.hexdigest()
+
+
+class FeatherCheckpoint(object):
+    '''
+    Record of the channels written to an output cube, kept in a small JSON
+    file next to it (``<filename>.progress.json``).
+
+    The ranges of completed channels are stored with a hash of the inputs
+    and parameters (see `feather_params_hash`), so the record is only reused
+    by a run with the same inputs.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the output cube.
+    params_hash : str
+        Hash of the inputs and parameters of the run.
+    nchan : int
+        Number of channels in the output cube.
+    '''
+
+    def __init__(self, filename, params_hash, nchan):
+        self.filename = "{0}.progress.json".format(filename)
+        self.params_hash = params_hash
+        self.nchan = nchan
+        self.completed = []
+
+    def exists(self):
+        '''
+        Whether the progress file exists.
+        '''
+        return os.path.exists(self.filename)
+
+    def load(self):
+        '''
+        Read the completed channels from the progress file.
+        '''
+
+        with open(self.filename) as fobj:
+            state = json.load(fobj)
+
+        if state['params_hash'] != self.params_hash or state['nchan'] != self.nchan:
+            raise ValueError("{0} was written for different inputs or"
+                             " feathering parameters. Use overwrite=True to"
+                             " start again.".format(self.filename))
+
+        self.completed = [tuple(rng) for rng in state['completed']]
+
+    def save(self):
+        '''
+        Write the progress file. The file is replaced atomically so an
+        interruption never leaves a partial record.
+        '''
+
+        state = {'params_hash': self.params_hash,
+                 'nchan': self.nchan,
+                 'completed': [list(rng) for rng in self.completed]}
+
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, 'w') as fobj:
+            json.dump(state, fobj)
+        os.replace(tmp_filename, self.filename)
+
+    def record(self, chans):
+        '''
+        Add a slice of completed channels and save the progress file.
+        '''
+
+        ranges = sorted(self.completed + [(int(chans.start), int(chans.stop))])
+
+        # Merge overlapping and adjacent ranges
+        merged = [ranges[0]]
+        for start, stop in ranges[1:]:
+            if start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+            else:
+                merged.append((start, stop))
+
+        self.completed = merged
+        self.save()
+
+    def missing(self):
+        '''
+        Return the indices of the channels that have not been completed.
+        '''
+
+        done = np.zeros(self.nchan, dtype=bool)
+        for start, stop in self.completed:
+            done[start:stop] = True
+
+        return np.flatnonzero(~done)
+
+    @property
+    def is_complete(self):
+        return self.missing().size == 0
+
+
+def is_zarr_path(filename):
+    '''
+    Whether ``filename`` names a zarr store (i.e., ends with ``.zarr``).
+    '''
+    return str(filename).rstrip('/').endswith('.zarr')
+
+
+def zarr_chunks_for_spectra(shape, dtype=float, chunk_bytes=ZARR_CHUNK_BYTES):
+    '''
+    Chunks holding whole spectra over square spatial tiles of about
+    ``chunk_bytes``, so that reading the spectrum of one pixel touches a
+    single chunk.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the cube.
+    dtype : `~numpy.dtype`, optional
+        Data type of the cube.
+    chunk_bytes : int, optional
+        Target size of the chunks.
+
+    Returns
+    -------
+    chunks : tuple
+        Chunk shape ``(nchan, ny, nx)``.
+    '''
+
+    nchan, nax2, nax1 = shape
+
+    spectrum_bytes = nchan * np.dtype(dtype).itemsize
+    tile = max(1, int(np.sqrt(chunk_bytes / spectrum_bytes)))
+
+    return (nchan, min(tile, nax2), min(tile, nax1))
+
+
+def write_zarr_cube(cube, store, header=None, chunks='spectral',
+                    compressor='default', overwrite=False):
+    '''
+    Compute a `~spectral_cube.DaskSpectralCube` into a zarr store. The chunks
+    are written in parallel with the scheduler of the cube.
+
+    Parameters
+    ----------
+    cube : `~spectral_cube.DaskSpectralCube`
+        The cube to write. Masked values are written as NaN.
+    store : str
+        Path of the zarr store.
+    header : `~astropy.io.fits.Header`, optional
+        Header stored in the attributes of the zarr array, used by
+        `read_zarr_cube`. Defaults to the header of ``cube``.
+    chunks : {'spectral', 'spatial'} or tuple, optional
+        Chunks of the store. 'spectral' (default) stores whole spectra over
+        spatial tiles (see `zarr_chunks_for_spectra`), for fast access to
+        spectra. 'spatial' keeps the chunks of ``cube``, which avoids
+        rechunking. A tuple sets the chunk shape.
+    compressor : zarr codec or None, optional
+        Compression of the chunks. 'default' uses the zarr default and None
+        disables compression.
+    overwrite : bool, optional
+        Replace ``store`` if it exists.
+
+    Returns
+    -------
+    cube : `~spectral_cube.DaskSpectralCube`
+        The cube read back from the store.
+    '''
+
+    import dask
+    import zarr
+
+    if header is None:
+        header = cube.header
+
+    data = cube._get_filled_data(fill=np.nan)
+
+    if isinstance(chunks, str):
+        if chunks == 'spectral':
+            chunks = zarr_chunks_for_spectra(data.shape, dtype=data.dtype)
+        elif chunks == 'spatial':
+            chunks = data.chunksize
+        else:
+            raise ValueError("chunks must be 'spectral', 'spatial' or a tuple,"
+                             " not {0}.".format(chunks))
+
+    # Chunks must be aligned with the store so they can be written in
+    # parallel without locking.
+    data = data.rechunk(chunks)
+
+    zarr_kwargs = {}
+    if compressor != 'default':
+        if int(zarr.__version__.split('.')[0]) >= 3:
+            zarr_kwargs['compressors'] = None if compressor is None else [compressor]
+        else:
+            zarr_kwargs['compressor'] = compressor
+
+    with dask.config.set(**cube._scheduler_kwargs):
+        data.to_zarr(str(store), mode='w' if overwrite else 'w-',
+                     **zarr_kwargs)
+
+    zarr_array = zarr.open_array(str(store), mode='r+')
+    zarr_array.attrs['fits_header'] = header.tostring()
+
+    return read_zarr_cube(store)
+
+
+def read_zarr_cube(store):
+    '''
+    Open a cube written by `write_zarr_cube` as a
+    `~spectral_cube.DaskSpectralCube`.
+    '''
+
+    import zarr
+    import dask.array as da
+    from astropy.wcs import WCS
+    from spectral_cube import DaskSpectralCube
+    from spectral_cube.masks import LazyMask
+
+    zarr_array = zarr.open_array(str(store), mode='r')
+
+    if 'fits_header' not in zarr_array.attrs:
+        raise ValueError("{0} has no FITS header attribute. Was it written"
+                         " with write_zarr_cube?".format(store))
+
+    header = fits.Header.fromstring(zarr_array.attrs['fits_header'])
+
+    meta = {}
+    if 'BUNIT' in header:
+        meta['BUNIT'] = header['BUNIT']
+
+    data = da.from_zarr(str(store))
+    wcs = WCS(header)
+
+    return DaskSpectralCube(data, wcs,
+                            mask=LazyMask(np.isfinite, data=data, wcs=wcs),
+                            meta=meta, header=header)
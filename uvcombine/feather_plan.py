@@ -0,0 +1,642 @@
+"""
+Precomputed feathering setup that can be reused for many planes sharing the
+same high- and low-resolution pixel grids (e.g., the channels of a cube).
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+import numpy as np
+import radio_beam
+from astropy import units as u
+from astropy import wcs
+from spectral_cube import Projection
+from spectral_cube.cube_utils import bunit_converters
+
+from .uvcombine import feather_kernel, _fftmerge_planes, _prepare_planes
+from .reproject_map import ReprojectionMap
+from .chunk_planner import (bytes_per_channel, memory_limit_bytes,
+                            plan_feather_chunks)
+
+
+def _header_frequencies(header):
+    '''
+    Return the frequencies of the spectral axis described by ``header``. For
+    headers without a spectral axis, the rest frequency is used, as is done
+    by `~spectral_cube.Projection.to`. Returns None when neither is defined.
+    '''
+
+    mywcs = wcs.WCS(header)
+
+    if mywcs.wcs.spec >= 0:
+        nchan = header['NAXIS{0}'.format(mywcs.wcs.spec + 1)]
+        specwcs = mywcs.sub([wcs.WCSSUB_SPECTRAL])
+        return u.Quantity(specwcs.pixel_to_world(np.arange(nchan)).to(u.Hz))
+
+    for key in ('RESTFRQ', 'RESTFREQ'):
+        if key in header:
+            return header[key] * u.Hz
+
+    return None
+
+
+def group_channels_by_beam(beams, tolerance=0.):
+    '''
+    Group the channels of a varying-resolution cube that have the same beam,
+    so that the channels in each group can be feathered with one kernel.
+
+    Parameters
+    ----------
+    beams : `~radio_beam.Beams`
+        The beam of each channel.
+    tolerance : float, optional
+        Maximum fractional difference of the major and minor axes from the
+        first beam in a group for a channel to join the group. With the
+        default of 0, only identical beams are grouped.
+
+    Returns
+    -------
+    group_beams : list of `~radio_beam.Beam`
+        The beam used for each group.
+    group_ids : `~numpy.ndarray`
+        The group index of each channel.
+    '''
+
+    if tolerance < 0:
+        raise ValueError("tolerance must be non-negative.")
+
+    major = beams.major.to(u.deg).value
+    minor = beams.minor.to(u.deg).value
+
+    group_beams = []
+    group_ids = np.empty(len(beams), dtype=int)
+
+    # After sorting, each group is a run of similar beams
+    for idx in np.lexsort((minor, major)):
+
+        if group_beams:
+            ref = group_beams[-1]
+            ref_major = ref.major.to(u.deg).value
+            ref_minor = ref.minor.to(u.deg).value
+
+            if (abs(major[idx] - ref_major) <= tolerance * ref_major and
+                    abs(minor[idx] - ref_minor) <= tolerance * ref_minor):
+                group_ids[idx] = len(group_beams) - 1
+                continue
+
+        group_beams.append(beams[idx])
+        group_ids[idx] = len(group_beams) - 1
+
+    return group_beams, group_ids
+
+
+def _channel_slabs(channels, nslab):
+    '''
+    Split channel indices into slices of consecutive channels with at most
+    ``nslab`` channels each.
+    '''
+
+    channels = np.unique(channels)
+
+    # Start a new slice wherever the channels are not consecutive
+    breaks = np.flatnonzero(np.diff(channels) != 1) + 1
+
+    slabs = []
+    for run in np.split(channels, breaks):
+        if run.size == 0:
+            continue
+        for start in range(run[0], run[-1] + 1, nslab):
+            slabs.append(slice(int(start), int(min(start + nslab, run[-1] + 1))))
+
+    return slabs
+
+
+def _beam_from_header(header):
+    if 'BMAJ' not in header:
+        return None
+    return radio_beam.Beam.from_fits_header(header)
+
+
+class FeatherPlan(object):
+    """
+    Everything needed to feather planes that does not change between them.
+
+    The plan computes the weighting kernels, the unit conversion factors of
+    the low-resolution data and the regridding onto the high-resolution grid
+    once. Feathering a plane with `FeatherPlan.apply` then only requires the
+    FFTs and, when the grids differ, a sparse matrix product for the
+    regridding (see `~uvcombine.reproject_map.ReprojectionMap`). This is
+    used by `~uvcombine.feather_simple_cube` to avoid repeating the setup for
+    every spectral channel.
+
+    Parameters
+    ----------
+    header_hi : `~astropy.io.fits.Header`
+        Header of the high-resolution image or cube. The output is on this
+        pixel grid and in these brightness units.
+    header_lo : `~astropy.io.fits.Header`
+        Header of the low-resolution image or cube.
+    beam_hi : `~radio_beam.Beam`, optional
+        The high-resolution beam. Read from ``header_hi`` when not given.
+    beam_lo : `~radio_beam.Beam`, optional
+        The low-resolution beam. Read from ``header_lo`` when not given.
+    highresscalefactor : float
+    lowresscalefactor : float
+    pbresponse : `~numpy.ndarray`, optional
+    lowresfwhm : `~astropy.units.Quantity`, optional
+    lowpassfilterSD : bool
+    replace_hires : float or False
+    deconvSD : bool
+    match_units : bool
+    weights : `~numpy.ndarray`, optional
+        See `~uvcombine.feather_simple`.
+    use_rfft : bool
+        Use the real-input FFTs. See `~uvcombine.fftmerge`.
+    dtype : `~numpy.dtype`
+        Precision of the kernels, the transforms and the output. See
+        `~uvcombine.fftmerge`.
+    fft_backend : str, optional
+        FFT backend of the transforms. Defaults to the global backend (see
+        `~uvcombine.fft_backend.set_fft_backend`). Plans with their own
+        backend can be used at the same time, including from threads.
+    fft_workers : int, optional
+        Number of threads used by each transform with ``fft_backend``.
+    """
+
+    def __init__(self, header_hi, header_lo,
+                 beam_hi=None,
+                 beam_lo=None,
+                 highresscalefactor=1.0,
+                 lowresscalefactor=1.0,
+                 pbresponse=None,
+                 lowresfwhm=None,
+                 lowpassfilterSD=False,
+                 replace_hires=False,
+                 deconvSD=False,
+                 match_units=True,
+                 weights=None,
+                 use_rfft=True,
+                 dtype=float,
+                 fft_backend=None,
+                 fft_workers=None,
+                 ):
+
+        self.highresscalefactor = highresscalefactor
+        self.lowresscalefactor = lowresscalefactor
+        self.lowpassfilterSD = lowpassfilterSD
+        self.replace_hires = replace_hires
+        self.deconvSD = deconvSD
+        self.use_rfft = use_rfft
+        self.dtype = np.dtype(dtype)
+        self.fft_backend = fft_backend
+        self.fft_workers = fft_workers
+
+        self.wcs_hi = wcs.WCS(header_hi).celestial
+        self.wcs_lo = wcs.WCS(header_lo).celestial
+        self.shape = (header_hi['NAXIS2'], header_hi['NAXIS1'])
+        self.shape_lo = (header_lo['NAXIS2'], header_lo['NAXIS1'])
+
+        if beam_hi is None:
+            beam_hi = _beam_from_header(header_hi)
+        if beam_lo is None:
+            beam_lo = _beam_from_header(header_lo)
+        self.beam_hi = beam_hi
+        self.beam_lo = beam_lo
+
+        self.unit = u.Unit(header_hi.get('BUNIT', ''))
+        unit_lo = u.Unit(header_lo.get('BUNIT', ''))
+
+        if lowresfwhm is None:
+            if beam_lo is None:
+                raise ValueError("The low-resolution beam could not be read"
+                                 " from the header. Give `beam_lo` or"
+                                 " `lowresfwhm`.")
+            lowresfwhm = beam_lo.major
+        self.lowresfwhm = lowresfwhm
+
+        # If weights are given, they must match the shape of the hires data
+        if weights is not None:
+            if not weights.shape == self.shape:
+                raise ValueError("weights must be an array with the same shape as"
+                                 " the high-res data.")
+        else:
+            weights = 1.
+        self.weights = weights
+
+        if pbresponse is not None:
+            if not pbresponse.shape == self.shape:
+                raise ValueError("pbresponse must be an array with the same"
+                                 " shape as the high-res data.")
+        self.pbresponse = pbresponse
+
+        # The scaling and weighting of each image, applied in the same pass
+        # that replaces the NaNs before the FFTs.
+        self._scale_hi = highresscalefactor * weights
+        self._scale_lo = lowresscalefactor * weights
+        if pbresponse is not None:
+            self._scale_lo = self._scale_lo * pbresponse
+
+        # Work arrays of each thread, see `FeatherPlan._work_buffers`
+        self._buffers = threading.local()
+
+        # Multiplicative factors converting the low-resolution data to the
+        # units of the high-resolution data. This is per channel when the
+        # conversion depends on frequency.
+        if match_units and unit_lo != self.unit:
+            proj_lo = Projection(np.zeros((1, 1)), unit=unit_lo,
+                                 wcs=self.wcs_lo, beam=beam_lo)
+            factor = bunit_converters(proj_lo, self.unit,
+                                      freq=_header_frequencies(header_lo))
+            self.lowres_unit_factor = np.atleast_1d(np.asarray(factor,
+                                                               dtype=float))
+            unit_lo = self.unit
+        else:
+            self.lowres_unit_factor = np.ones(1)
+
+        if match_units:
+            # When in a per-beam unit, we need to scale the low res to the
+            # Jy / beam for the HIRES beam.
+            jybm_unit = u.Jy / u.beam
+            if self.unit.is_equivalent(jybm_unit):
+                self.lowres_unit_factor = self.lowres_unit_factor * \
+                    (beam_hi.sr / beam_lo.sr).decompose().value
+
+        # Add check that the units are compatible
+        equiv_units = unit_lo.is_equivalent(self.unit)
+        if not equiv_units:
+            raise ValueError("Brightness units are not equivalent: "
+                             f"hires: {self.unit}; lowres: {unit_lo}")
+
+        is_wcs_eq = self.wcs_hi.wcs.compare(self.wcs_lo.wcs)
+        is_eq_shape = self.shape_lo == self.shape
+        self.needs_regrid = not is_wcs_eq or not is_eq_shape
+
+        # The celestial grids are the same for every channel, so the
+        # interpolation onto the high-resolution grid is computed once.
+        if self.needs_regrid:
+            self.reprojection = ReprojectionMap(self.wcs_lo, self.shape_lo,
+                                                self.wcs_hi, self.shape,
+                                                dtype=self.dtype)
+        else:
+            self.reprojection = None
+
+        self.pixscale = wcs.utils.proj_plane_pixel_scales(self.wcs_hi)[0]
+        nax2, nax1 = self.shape
+        self.kfft, self.ikfft = feather_kernel(nax2, nax1, lowresfwhm,
+                                               self.pixscale,
+                                               use_rfft=use_rfft,
+                                               dtype=self.dtype)
+
+        # Number of channels not transformed by the last `apply_cube`
+        self.nskipped = 0
+
+    @classmethod
+    def from_cubes(cls, cube_hi, cube_lo, **kwargs):
+        """
+        Create a plan from two spectral cubes (or two
+        `~spectral_cube.Projection` objects) using their headers and beams.
+
+        Parameters
+        ----------
+        cube_hi : `~spectral_cube.SpectralCube`
+            The high-resolution cube.
+        cube_lo : `~spectral_cube.SpectralCube`
+            The low-resolution cube.
+        kwargs : Passed to `FeatherPlan`.
+        """
+
+        if hasattr(cube_lo, 'beams'):
+            raise TypeError("FeatherPlan requires a single low-resolution"
+                            " beam. For varying resolution cubes, create a"
+                            " plan for each group of channels from"
+                            " `group_channels_by_beam`.")
+
+        beam_hi = getattr(cube_hi, 'beam', None)
+        beam_lo = getattr(cube_lo, 'beam', None)
+
+        return cls(cube_hi.header, cube_lo.header,
+                   beam_hi=beam_hi, beam_lo=beam_lo, **kwargs)
+
+    def __getstate__(self):
+        # The work arrays are not sent to other processes
+        state = self.__dict__.copy()
+        del state['_buffers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffers = threading.local()
+
+    @property
+    def nchan(self):
+        '''
+        Number of channels with a distinct unit conversion factor. This is
+        1 when the factor does not depend on frequency.
+        '''
+        return self.lowres_unit_factor.size
+
+    def regrid(self, plane_lo):
+        '''
+        Regrid a low-resolution plane, or a stack of planes, onto the
+        high-resolution pixel grid. This is equivalent to
+        `~reproject.reproject_interp` with bilinear interpolation.
+        '''
+        if not self.needs_regrid:
+            return plane_lo
+
+        return self.reprojection(plane_lo)
+
+    def _lowres_factor(self, channel):
+        if self.lowres_unit_factor.size == 1:
+            return self.lowres_unit_factor[0]
+
+        factor = self.lowres_unit_factor[channel]
+        if np.ndim(factor) > 0:
+            # Broadcast over the spatial axes of a slab
+            factor = factor[:, np.newaxis, np.newaxis]
+        return factor
+
+    def _work_buffers(self, nplanes):
+        '''
+        Arrays holding the prepared high- and low-resolution planes. They
+        are reused by all calls from the same thread, and only grow when a
+        larger slab is feathered.
+        '''
+
+        buffers = getattr(self._buffers, 'arrays', None)
+        if buffers is None or len(buffers[0]) < nplanes:
+            buffers = tuple(np.empty((nplanes,) + self.shape, dtype=self.dtype)
+                            for _ in range(2))
+            self._buffers.arrays = buffers
+
+        return buffers[0][:nplanes], buffers[1][:nplanes]
+
+    def slab_size(self, memory_limit=None):
+        '''
+        Number of channels to feather together in `FeatherPlan.apply_cube`
+        while staying within ``memory_limit``.
+
+        Parameters
+        ----------
+        memory_limit : int, str or `~astropy.units.Quantity`, optional
+            Memory budget in bytes, or a quantity with information units
+            (e.g., ``'2 GB'``). Defaults to
+            `~uvcombine.chunk_planner.DEFAULT_MEMORY_LIMIT`.
+
+        Returns
+        -------
+        nslab : int
+            The number of channels per slab. At least 1.
+        '''
+
+        limit = memory_limit_bytes(memory_limit)
+
+        return max(1, int(limit // self.bytes_per_channel))
+
+    @property
+    def bytes_per_channel(self):
+        '''
+        Peak memory used to feather one channel. See
+        `~uvcombine.chunk_planner.bytes_per_channel`.
+        '''
+        shape_lo = self.shape_lo if self.needs_regrid else None
+        return bytes_per_channel(self.shape, dtype=self.dtype,
+                                 use_rfft=self.use_rfft, shape_lo=shape_lo)
+
+    def apply(self, plane_hi, plane_lo, channel=0):
+        '''
+        Feather a high- and low-resolution plane, or a slab of planes.
+
+        Parameters
+        ----------
+        plane_hi : `~numpy.ndarray`
+            The high-resolution plane on the high-resolution grid. A 3D array
+            is treated as a slab of channels that are feathered together.
+        plane_lo : `~numpy.ndarray`
+            The low-resolution plane on the low-resolution grid, with the
+            same number of channels as ``plane_hi``.
+        channel : int or slice, optional
+            The spectral channel(s) of the planes. Used to select the unit
+            conversion factor when it varies with frequency.
+
+        Returns
+        -------
+        combo : `~numpy.ndarray`
+            The real feathered plane(s).
+        '''
+
+        return self._apply(plane_hi, plane_lo, channel=channel)[0]
+
+    def prepare(self, plane_hi, plane_lo, channel=0):
+        '''
+        Return the planes that are Fourier transformed when feathering.
+
+        The high-resolution planes are scaled and weighted. The
+        low-resolution planes are regridded, converted to the units of the
+        high-resolution data, scaled, weighted and multiplied by the
+        ``pbresponse``. NaNs are replaced by zeros in both.
+
+        Parameters
+        ----------
+        plane_hi : `~numpy.ndarray`
+            The high-resolution plane, or a slab of planes.
+        plane_lo : `~numpy.ndarray`
+            The low-resolution plane(s) on the low-resolution grid.
+        channel : int or slice, optional
+            The spectral channel(s) of the planes. See `FeatherPlan.apply`.
+
+        Returns
+        -------
+        plane_hi, plane_lo : `~numpy.ndarray`
+            The prepared planes on the high-resolution grid. These are work
+            arrays of the calling thread, which are overwritten by its next
+            call to `FeatherPlan.prepare` or `FeatherPlan.apply`.
+        empty : `~numpy.ndarray` or bool
+            Whether each plane is entirely NaN in both inputs.
+        '''
+
+        plane_hi = getattr(plane_hi, 'value', plane_hi)
+        plane_lo = getattr(plane_lo, 'value', plane_lo)
+
+        if np.ndim(plane_hi) == 2:
+            buffer_hi, buffer_lo = [buf[0] for buf in self._work_buffers(1)]
+        else:
+            buffer_hi, buffer_lo = self._work_buffers(len(plane_hi))
+
+        # Scale, weight and fill the NaNs of the planes in the work arrays.
+        # The pbresponse is applied to the regridded low-resolution data.
+        plane_hi, empty_hi = _prepare_planes(plane_hi, buffer_hi,
+                                             self._scale_hi)
+        plane_lo, empty_lo = _prepare_planes(self.regrid(plane_lo), buffer_lo,
+                                             self._lowres_factor(channel),
+                                             self._scale_lo)
+
+        return plane_hi, plane_lo, empty_hi & empty_lo
+
+    def _apply(self, plane_hi, plane_lo, channel=0):
+        '''
+        `FeatherPlan.apply`, also returning the number of planes that were
+        constant or empty and so were not transformed.
+        '''
+
+        plane_hi, plane_lo, empty = self.prepare(plane_hi, plane_lo,
+                                                 channel=channel)
+
+        combo, nskipped = _fftmerge_planes(self.kfft, self.ikfft,
+                                           plane_hi, plane_lo,
+                                           empty=empty,
+                                           replace_hires=self.replace_hires,
+                                           lowpassfilterSD=self.lowpassfilterSD,
+                                           deconvSD=self.deconvSD,
+                                           use_rfft=self.use_rfft,
+                                           fft_backend=self.fft_backend,
+                                           fft_workers=self.fft_workers,
+                                           )
+
+        # Divide by the PB response
+        if self.pbresponse is not None:
+            combo /= self.pbresponse
+
+        return combo, nskipped
+
+    def apply_cube(self, cube_hi, cube_lo, out=None, progressbar=True,
+                   memory_limit=None, n_workers=1, use_processes=False,
+                   channels=None, callback=None):
+        '''
+        Feather every channel of two cubes.
+
+        The channels are read, transformed and written in slabs of several
+        channels at a time. The slab size is set by ``memory_limit`` (see
+        `FeatherPlan.slab_size`). With ``n_workers > 1``, the slabs are
+        feathered in a thread pool. The FFTs and array operations release the
+        GIL, and each slab is written to its own part of ``out``, so the
+        result does not depend on the number of workers. With
+        ``use_processes=True``, a pool of processes is used instead (see
+        `~uvcombine.parallel.feather_slabs_in_processes`).
+
+        Channels that are constant or empty (all NaN or zero) in both cubes
+        are written without computing their FFTs; empty channels are NaN in
+        the output. The number of such channels is stored in
+        ``FeatherPlan.nskipped``.
+
+        Parameters
+        ----------
+        cube_hi : `~spectral_cube.SpectralCube` or `~numpy.ndarray`
+            The high-resolution cube.
+        cube_lo : `~spectral_cube.SpectralCube` or `~numpy.ndarray`
+            The low-resolution cube, spectrally matched to ``cube_hi``.
+        out : `~numpy.ndarray`, optional
+            Array to write the feathered cube into (e.g., a memory-mapped
+            array). A new array is created when not given.
+        progressbar : bool, optional
+            Show a progress bar.
+        memory_limit : int, str or `~astropy.units.Quantity`, optional
+            Memory budget for the working arrays. This is shared between the
+            workers. See `~uvcombine.chunk_planner.plan_feather_chunks`.
+        n_workers : int, optional
+            Number of threads, or processes, used to feather slabs in
+            parallel.
+        use_processes : bool, optional
+            Use a pool of processes rather than threads. The cubes and the
+            output are shared with the workers through shared memory, or
+            through their files for memory-mapped arrays.
+        channels : array-like, optional
+            Indices of the channels to feather. The other channels of ``out``
+            are not changed. All channels are feathered by default.
+        callback : callable, optional
+            Function called with the slice of channels of each slab once it
+            has been written to ``out`` (e.g., to record progress). It is
+            called from the calling thread, in the order of the slabs.
+
+        Returns
+        -------
+        out : `~numpy.ndarray`
+            The feathered cube.
+        '''
+
+        nchan = cube_hi.shape[0]
+
+        if cube_lo.shape[0] != nchan:
+            raise ValueError("The cubes must have the same number of spectral"
+                             " channels.")
+        if self.nchan > 1 and self.nchan != nchan:
+            raise ValueError("The plan has unit conversion factors for {0}"
+                             " channels but the cubes have {1} channels."
+                             .format(self.nchan, nchan))
+
+        if out is None:
+            out = np.empty((nchan,) + self.shape, dtype=self.dtype)
+
+        data_hi = getattr(cube_hi, 'unitless_filled_data', cube_hi)
+        data_lo = getattr(cube_lo, 'unitless_filled_data', cube_lo)
+
+        if n_workers < 1:
+            raise ValueError("n_workers must be at least 1.")
+
+        if channels is None:
+            channels = np.arange(nchan)
+        else:
+            channels = np.asarray(channels, dtype=int)
+            if channels.size and (channels.min() < 0 or channels.max() >= nchan):
+                raise ValueError("channels must be between 0 and {0}."
+                                 .format(nchan - 1))
+        nfeather = np.unique(channels).size
+
+        # Every worker holds one slab in memory at a time. Fewer workers are
+        # used if the budget cannot fit a channel for each of them.
+        shape_lo = self.shape_lo if self.needs_regrid else None
+        chunk_plan = plan_feather_chunks((nfeather,) + self.shape,
+                                         dtype=self.dtype,
+                                         memory_limit=memory_limit,
+                                         n_workers=n_workers,
+                                         use_rfft=self.use_rfft,
+                                         shape_lo=shape_lo)
+        nslab = chunk_plan.channels_per_chunk
+        n_workers = chunk_plan.n_workers
+
+        slabs = _channel_slabs(channels, nslab)
+
+        # The input cubes may not be safe to read from several threads
+        read_lock = threading.Lock()
+
+        def feather_slab(chans):
+            with read_lock:
+                slab_hi = np.asarray(data_hi[chans])
+                slab_lo = np.asarray(data_lo[chans])
+
+            out[chans], nskipped = self._apply(slab_hi, slab_lo, channel=chans)
+
+            return nskipped
+
+        if progressbar:
+            pb = tqdm(total=nfeather)
+        else:
+            pb = None
+
+        # The progress bar is closed even if feathering fails
+        try:
+            if use_processes:
+                from .parallel import feather_slabs_in_processes
+
+                out, self.nskipped = feather_slabs_in_processes(self, data_hi, data_lo,
+                                                                out, slabs, n_workers,
+                                                                progressbar=pb,
+                                                                callback=callback)
+                return out
+
+            self.nskipped = 0
+
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                for chans, nskipped in zip(slabs, executor.map(feather_slab, slabs)):
+                    self.nskipped += nskipped
+                    if pb is not None:
+                        pb.update(chans.stop - chans.start)
+                    if callback is not None:
+                        callback(chans)
+        finally:
+            if pb is not None:
+                pb.close()
+
+        return out
@@ -0,0 +1,177 @@
+"""
+Feather the same pair of images repeatedly, e.g., while tuning the scale
+factors, without repeating the regridding and the forward FFTs.
+"""
+
+import numpy as np
+from astropy import wcs
+from astropy.io import fits
+
+from .uvcombine import (feather_kernel, _feather_inputs, _prepare_planes,
+                        _combine_spectra)
+from .fft_backend import fft2, ifft2, rfft2, irfft2
+
+
+class FeatherSession(object):
+    """
+    The forward Fourier transforms of two images, kept to feather them many
+    times with different parameters.
+
+    Creating the session loads the images, matches their units, regrids the
+    low-resolution image and computes both forward FFTs, as in
+    `~uvcombine.feather_simple`. Each call to `FeatherSession.feather` then
+    only weights the stored spectra and computes one inverse FFT. The scale
+    factors, the filtering of the low-resolution data, the ``replace_hires``
+    threshold and the low-resolution FWHM can all change between calls.
+
+    Parameters
+    ----------
+    hires : str, `~astropy.io.fits.PrimaryHDU` or `~spectral_cube.Projection`
+        The high-resolution image.
+    lores : str, `~astropy.io.fits.PrimaryHDU` or `~spectral_cube.Projection`
+        The low-resolution (single-dish) image.
+    highresextnum : int, optional
+        The extension number to use from the high-res FITS file.
+    lowresextnum : int, optional
+        The extension number to use from the low-res FITS file.
+    pbresponse : `~numpy.ndarray`, optional
+        The primary beam response of the high-resolution data. See
+        `~uvcombine.feather_simple`.
+    lowresfwhm : `~astropy.units.Quantity`, optional
+        The FWHM of the low-resolution beam. Defaults to the major axis of
+        the beam of ``lores``.
+    match_units : bool, optional
+        Convert the low-resolution image to the units of the high-resolution
+        image. See `~uvcombine.feather_simple`.
+    weights : `~numpy.ndarray`, optional
+        Weights applied to both images. See `~uvcombine.feather_simple`.
+    use_rfft : bool, optional
+        Use the real-input FFTs. The feathered image is then real.
+    dtype : `~numpy.dtype`, optional
+        Precision of the transforms (see `~uvcombine.fftmerge`).
+
+    Notes
+    -----
+    The session reuses work buffers between calls, so one session should not
+    be used from several threads at once.
+    """
+
+    def __init__(self, hires, lores, highresextnum=0, lowresextnum=0,
+                 pbresponse=None, lowresfwhm=None, match_units=True,
+                 weights=None, use_rfft=False, dtype=float):
+
+        proj_hi, proj_lo, proj_lo_regrid, lowresfwhm, weights = \
+            _feather_inputs(hires, lores,
+                            highresextnum=highresextnum,
+                            lowresextnum=lowresextnum,
+                            lowresfwhm=lowresfwhm,
+                            weights=weights,
+                            pbresponse=pbresponse,
+                            match_units=match_units)
+
+        self.header = proj_hi.header
+        self.shape = proj_hi.shape
+        self.lowresfwhm = lowresfwhm
+        self.pixscale = wcs.utils.proj_plane_pixel_scales(proj_hi.wcs.celestial)[0]
+        self.pbresponse = pbresponse
+        self.use_rfft = use_rfft
+        self.dtype = np.dtype(dtype)
+
+        # The scale factors are applied to the spectra when feathering. The
+        # pbresponse is applied to the regridded low-resolution data.
+        scale_lo = weights
+        if pbresponse is not None:
+            scale_lo = scale_lo * pbresponse
+
+        im_hi = _prepare_planes(proj_hi.value, np.empty(self.shape, dtype=self.dtype),
+                                weights)[0]
+        im_lo = _prepare_planes(proj_lo_regrid.value, np.empty(self.shape, dtype=self.dtype),
+                                scale_lo)[0]
+
+        if use_rfft:
+            self.fft_hi = rfft2(im_hi)
+            self.fft_lo = rfft2(im_lo)
+        else:
+            self.fft_hi = fft2(im_hi)
+            self.fft_lo = fft2(im_lo)
+
+        # The stored spectra are never modified
+        self.fft_hi.setflags(write=False)
+        self.fft_lo.setflags(write=False)
+
+        self._work_hi = np.empty_like(self.fft_hi)
+        self._work_lo = np.empty_like(self.fft_lo)
+
+    def kernels(self, lowresfwhm=None):
+        '''
+        Return the weighting kernels for ``lowresfwhm`` (defaults to the FWHM
+        of the session). See `~uvcombine.feather_kernel`.
+        '''
+
+        if lowresfwhm is None:
+            lowresfwhm = self.lowresfwhm
+
+        nax2, nax1 = self.shape
+        return feather_kernel(nax2, nax1, lowresfwhm, self.pixscale,
+                              use_rfft=self.use_rfft, dtype=self.dtype)
+
+    def feather(self, highresscalefactor=1.0, lowresscalefactor=1.0,
+                lowpassfilterSD=False, replace_hires=False, deconvSD=False,
+                min_beam_fraction=0.1, lowresfwhm=None, return_hdu=False):
+        '''
+        Feather the images with the given parameters, reusing the stored
+        forward FFTs.
+
+        Parameters
+        ----------
+        highresscalefactor : float, optional
+            Factor multiplying the high-resolution data.
+        lowresscalefactor : float, optional
+            Factor multiplying the low-resolution data.
+        lowpassfilterSD : bool, optional
+            See `~uvcombine.feather_simple`.
+        replace_hires : float or False, optional
+            See `~uvcombine.feather_simple`.
+        deconvSD : bool, optional
+            See `~uvcombine.feather_simple`.
+        min_beam_fraction : float, optional
+            See `~uvcombine.fftmerge`.
+        lowresfwhm : `~astropy.units.Quantity`, optional
+            Use a different low-resolution FWHM than the session's.
+        return_hdu : bool, optional
+            Return a `~astropy.io.fits.PrimaryHDU` with the real part of the
+            feathered image.
+
+        Returns
+        -------
+        combo : `~numpy.ndarray` or `~astropy.io.fits.PrimaryHDU`
+            The feathered image. It is complex unless ``use_rfft`` was set,
+            as for `~uvcombine.feather_simple`.
+        '''
+
+        kfft, ikfft = self.kernels(lowresfwhm)
+
+        # The transform is linear, so the scale factors can be applied to
+        # the spectra
+        np.multiply(self.fft_hi, highresscalefactor, out=self._work_hi)
+        np.multiply(self.fft_lo, lowresscalefactor, out=self._work_lo)
+
+        fftsum = _combine_spectra(kfft, ikfft, self._work_hi, self._work_lo,
+                                  lowpassfilterSD=lowpassfilterSD,
+                                  replace_hires=replace_hires,
+                                  deconvSD=deconvSD,
+                                  min_beam_fraction=min_beam_fraction)
+
+        if self.use_rfft:
+            combo = irfft2(fftsum, s=self.shape)
+        else:
+            combo = ifft2(fftsum)
+
+        # Divide by the PB response
+        if self.pbresponse is not None:
+            combo /= self.pbresponse
+
+        if return_hdu:
+            return fits.PrimaryHDU(data=combo.real, header=self.header)
+
+        return combo
@@ -0,0 +1,241 @@
+"""
+Selectable FFT implementation used for all of the transforms in uvcombine.
+
+The backend is set for the whole package with `set_fft_backend`, or
+temporarily with the `use_fft_backend` context manager::
+
+    >>> from uvcombine.fft_backend import set_fft_backend, use_fft_backend
+    >>> set_fft_backend('scipy', workers=8)  # doctest: +SKIP
+    >>> with use_fft_backend('pyfftw', workers=-1):  # doctest: +SKIP
+    ...     feathered = feather_simple(hires, lores)
+
+Available backends are ``'numpy'`` (the default), ``'scipy'``, and, when
+installed, ``'pyfftw'`` and ``'mkl_fft'``. ``workers`` sets the number of
+threads used by a single transform (``-1`` uses all cores) and is ignored by
+the numpy backend.
+
+The global backend is shared by every thread. When several feathering runs
+use different backends at the same time, pass ``fft_backend`` and
+``fft_workers`` to `~uvcombine.fftmerge`, `~uvcombine.feather_simple` or
+`~uvcombine.FeatherPlan` instead; these do not change the global setting.
+"""
+
+import os
+import json
+import base64
+from contextlib import contextmanager
+
+import numpy as np
+
+__all__ = ['available_fft_backends', 'get_fft_backend', 'set_fft_backend',
+           'use_fft_backend', 'fft2', 'ifft2', 'rfft2', 'irfft2',
+           'save_fftw_wisdom', 'load_fftw_wisdom']
+
+_config = {'backend': 'numpy', 'workers': None}
+
+_FUNCTIONS = ('fft2', 'ifft2', 'rfft2', 'irfft2')
+
+
+def _numpy_transform(name):
+    func = getattr(np.fft, name)
+
+    def transform(a, s=None, axes=(-2, -1), workers=None):
+        return func(a, s=s, axes=axes)
+
+    return transform
+
+
+def _scipy_transform(name):
+    import scipy.fft
+    func = getattr(scipy.fft, name)
+
+    def transform(a, s=None, axes=(-2, -1), workers=None):
+        return func(a, s=s, axes=axes, workers=workers)
+
+    return transform
+
+
+def _pyfftw_transform(name):
+    import pyfftw
+    import pyfftw.interfaces.numpy_fft
+
+    # Keep the FFTW plans of recently used shapes so repeated transforms of
+    # the same shape are not planned again.
+    pyfftw.interfaces.cache.enable()
+
+    func = getattr(pyfftw.interfaces.numpy_fft, name)
+
+    def transform(a, s=None, axes=(-2, -1), workers=None):
+        if workers is not None and workers < 0:
+            workers = os.cpu_count()
+        return func(a, s=s, axes=axes, threads=workers or 1)
+
+    return transform
+
+
+def _mkl_fft_transform(name):
+    import mkl_fft.interfaces.scipy_fft
+    func = getattr(mkl_fft.interfaces.scipy_fft, name)
+
+    def transform(a, s=None, axes=(-2, -1), workers=None):
+        return func(a, s=s, axes=axes, workers=workers)
+
+    return transform
+
+
+_BACKENDS = {'numpy': _numpy_transform,
+             'scipy': _scipy_transform,
+             'pyfftw': _pyfftw_transform,
+             'mkl_fft': _mkl_fft_transform}
+
+# Transforms of the backends that have been loaded
+_loaded = {}
+
+
+def _load_backend(backend):
+
+    if backend not in _BACKENDS:
+        raise ValueError("Unknown FFT backend {0}. Choose from: {1}"
+                         .format(backend, ", ".join(_BACKENDS)))
+
+    if backend not in _loaded:
+        try:
+            _loaded[backend] = {name: _BACKENDS[backend](name)
+                                for name in _FUNCTIONS}
+        except ImportError:
+            raise ImportError("The {0} FFT backend requires the {0} package"
+                              " to be installed.".format(backend))
+
+    return _loaded[backend]
+
+
+def available_fft_backends():
+    '''
+    Return the names of the FFT backends that can be used.
+    '''
+
+    available = []
+    for backend in _BACKENDS:
+        try:
+            _load_backend(backend)
+        except ImportError:
+            continue
+        available.append(backend)
+
+    return available
+
+
+def get_fft_backend():
+    '''
+    Return the current FFT backend and the number of workers.
+    '''
+    return _config['backend'], _config['workers']
+
+
+def set_fft_backend(backend='numpy', workers=None):
+    '''
+    Set the FFT backend used by uvcombine.
+
+    Parameters
+    ----------
+    backend : {'numpy', 'scipy', 'pyfftw', 'mkl_fft'}
+        Name of the backend.
+    workers : int, optional
+        Number of threads used by each transform. ``-1`` uses all cores.
+        Ignored by the numpy backend.
+    '''
+
+    _load_backend(backend)
+
+    _config['backend'] = backend
+    _config['workers'] = workers
+
+
+@contextmanager
+def use_fft_backend(backend, workers=None):
+    '''
+    Context manager that temporarily sets the FFT backend. See
+    `set_fft_backend`.
+    '''
+
+    previous = get_fft_backend()
+    set_fft_backend(backend, workers=workers)
+    try:
+        yield
+    finally:
+        set_fft_backend(*previous)
+
+
+def _transform(name, a, s, axes, backend, workers):
+
+    if backend is None:
+        backend = _config['backend']
+        if workers is None:
+            workers = _config['workers']
+
+    return _load_backend(backend)[name](a, s=s, axes=axes, workers=workers)
+
+
+def fft2(a, s=None, axes=(-2, -1), backend=None, workers=None):
+    '''
+    2D FFT, as `numpy.fft.fft2`, with the current or given backend.
+    '''
+    return _transform('fft2', a, s, axes, backend, workers)
+
+
+def ifft2(a, s=None, axes=(-2, -1), backend=None, workers=None):
+    '''
+    2D inverse FFT, as `numpy.fft.ifft2`, with the current or given backend.
+    '''
+    return _transform('ifft2', a, s, axes, backend, workers)
+
+
+def rfft2(a, s=None, axes=(-2, -1), backend=None, workers=None):
+    '''
+    2D real-input FFT, as `numpy.fft.rfft2`, with the current or given
+    backend.
+    '''
+    return _transform('rfft2', a, s, axes, backend, workers)
+
+
+def irfft2(a, s=None, axes=(-2, -1), backend=None, workers=None):
+    '''
+    2D inverse real-input FFT, as `numpy.fft.irfft2`, with the current or
+    given backend.
+    '''
+    return _transform('irfft2', a, s, axes, backend, workers)
+
+
+def save_fftw_wisdom(filename):
+    '''
+    Save the FFTW wisdom gathered by the pyfftw backend, so that later
+    sessions can skip planning the same transforms.
+
+    The wisdom of each precision is stored base64-encoded in a JSON file.
+    '''
+    import pyfftw
+
+    wisdom = [base64.b64encode(item).decode('ascii')
+              for item in pyfftw.export_wisdom()]
+
+    with open(filename, 'w') as fobj:
+        json.dump({'fftw_wisdom': wisdom}, fobj)
+
+
+def load_fftw_wisdom(filename):
+    '''
+    Load FFTW wisdom saved with `save_fftw_wisdom`.
+    '''
+    import pyfftw
+
+    with open(filename, 'r') as fobj:
+        contents = json.load(fobj)
+
+    if not isinstance(contents, dict) or 'fftw_wisdom' not in contents:
+        raise ValueError("{0} is not an FFTW wisdom file written by"
+                         " save_fftw_wisdom.".format(filename))
+
+    wisdom = tuple(base64.b64decode(item, validate=True)
+                   for item in contents['fftw_wisdom'])
+
+    pyfftw.import_wisdom(wisdom)
@@ -0,0 +1,272 @@
+"""
+Process-pool execution of `~uvcombine.FeatherPlan.apply_cube`.
+
+The channels of the input cubes and of the output array that are feathered
+are packed into shared memory, or the arrays are used directly when they are
+already file-backed memory-mapped arrays. The workers receive small
+descriptors of these buffers and map them, so no data is pickled when
+dispatching the channel ranges.
+"""
+
+import mmap
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .fft_backend import get_fft_backend, set_fft_backend
+
+
+class SharedArray(object):
+    '''
+    Picklable description of an array in shared memory or in a file.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the array.
+    dtype : `~numpy.dtype`
+        Data type of the array.
+    shm_name : str, optional
+        Name of the `~multiprocessing.shared_memory.SharedMemory` block
+        holding the array.
+    filename : str, optional
+        File holding the array, for arrays created with `~numpy.memmap`.
+    offset : int, optional
+        Offset of the array in ``filename`` in bytes.
+    '''
+
+    def __init__(self, shape, dtype, shm_name=None, filename=None, offset=0):
+
+        if (shm_name is None) == (filename is None):
+            raise ValueError("Give one of shm_name or filename.")
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.shm_name = shm_name
+        self.filename = filename
+        self.offset = offset
+
+    @classmethod
+    def create(cls, shape, dtype=float):
+        '''
+        Allocate a new shared memory block.
+
+        Returns
+        -------
+        desc : `SharedArray`
+            The descriptor of the block.
+        shm : `~multiprocessing.shared_memory.SharedMemory`
+            The block. The caller is responsible for closing and unlinking it.
+        '''
+
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+
+        return cls(shape, dtype, shm_name=shm.name), shm
+
+    @classmethod
+    def from_memmap(cls, array):
+        '''
+        Describe a file-backed `~numpy.memmap`. Returns None if ``array`` is
+        not the full, contiguous memory-mapped array (e.g., a slice of one).
+        '''
+
+        if not isinstance(array, np.memmap):
+            return None
+        if array.filename is None or not isinstance(array.base, mmap.mmap):
+            return None
+        if not array.flags.c_contiguous:
+            return None
+
+        return cls(array.shape, array.dtype, filename=array.filename,
+                   offset=array.offset)
+
+    def open(self, mode='r+'):
+        '''
+        Map the array.
+
+        Returns
+        -------
+        array : `~numpy.ndarray`
+            The array.
+        shm : `~multiprocessing.shared_memory.SharedMemory` or None
+            The shared memory block, which must be closed once ``array`` is no
+            longer used.
+        '''
+
+        if self.filename is not None:
+            array = np.memmap(self.filename, dtype=self.dtype, mode=mode,
+                              offset=self.offset, shape=self.shape)
+            return array, None
+
+        shm = shared_memory.SharedMemory(name=self.shm_name)
+        array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+        return array, shm
+
+
+# State of each worker process, set once by `_init_worker`.
+_worker_state = {}
+
+
+def _init_worker(plan, desc_hi, desc_lo, desc_out, fft_config):
+
+    # Use the same FFT backend as the parent process
+    set_fft_backend(*fft_config)
+
+    handles = []
+    arrays = []
+    packed = []
+    for desc, mode in ((desc_hi, 'r'), (desc_lo, 'r'), (desc_out, 'r+')):
+        array, shm = desc.open(mode=mode)
+        arrays.append(array)
+        # Shared memory blocks only hold the feathered channels
+        packed.append(shm is not None)
+        if shm is not None:
+            handles.append(shm)
+
+    _worker_state['plan'] = plan
+    _worker_state['arrays'] = arrays
+    _worker_state['packed'] = packed
+    # Keep the shared memory blocks open for the lifetime of the worker
+    _worker_state['handles'] = handles
+
+
+def _feather_slab(task):
+
+    chans, packed_chans = task
+
+    plan = _worker_state['plan']
+    data_hi, data_lo, out = [array[packed_chans if packed else chans]
+                             for array, packed in zip(_worker_state['arrays'],
+                                                      _worker_state['packed'])]
+
+    out[...], nskipped = plan._apply(data_hi, data_lo, channel=chans)
+
+    return nskipped
+
+
+def _packed_slabs(slabs):
+    '''
+    Positions of the slabs when their channels are stored one after the
+    other.
+    '''
+
+    packed = []
+    start = 0
+    for chans in slabs:
+        stop = start + chans.stop - chans.start
+        packed.append(slice(start, stop))
+        start = stop
+
+    return packed
+
+
+def feather_slabs_in_processes(plan, data_hi, data_lo, out, slabs,
+                               n_workers, progressbar=None, mp_context=None,
+                               callback=None):
+    '''
+    Feather slabs of channels with `~uvcombine.FeatherPlan.apply` in a pool
+    of processes.
+
+    Parameters
+    ----------
+    plan : `~uvcombine.FeatherPlan`
+        The feathering plan. It is sent once to each worker.
+    data_hi, data_lo : array-like
+        The high- and low-resolution cubes. File-backed `~numpy.memmap`
+        arrays are shared directly; other inputs are copied into shared
+        memory one slab at a time.
+    out : `~numpy.ndarray`
+        The output array. File-backed `~numpy.memmap` arrays are written to
+        directly by the workers; otherwise the result is computed in shared
+        memory and each slab is copied into ``out``. Channels outside of
+        ``slabs`` are not changed.
+    slabs : list of slice
+        The channel ranges to feather.
+    n_workers : int
+        The number of processes.
+    progressbar : `~tqdm.tqdm`, optional
+        Progress bar updated as slabs finish.
+    mp_context : `multiprocessing` context, optional
+        Context used to start the workers. Defaults to the platform default.
+    callback : callable, optional
+        Function called with each slab once it has been written to ``out``.
+        When ``out`` is not written to directly by the workers, this is once
+        the result has been copied into ``out``.
+
+    Returns
+    -------
+    out : `~numpy.ndarray`
+        The feathered cube.
+    nskipped : int
+        The number of constant or empty channels that were not transformed.
+    '''
+
+    if mp_context is None:
+        mp_context = multiprocessing.get_context()
+
+    handles = []
+    views = []
+    nskipped = 0
+
+    packed_slabs = _packed_slabs(slabs)
+    npacked = packed_slabs[-1].stop if packed_slabs else 0
+
+    def share(array, dtype):
+        desc = SharedArray.from_memmap(array)
+        if desc is not None:
+            return desc, None
+
+        # Only the feathered channels are placed in shared memory
+        shape = (npacked,) + tuple(array.shape[1:])
+        desc, shm = SharedArray.create(shape, dtype=dtype)
+        handles.append(shm)
+        view = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        views.append(view)
+        return desc, view
+
+    try:
+        desc_hi, shared_hi = share(data_hi, plan.dtype)
+        desc_lo, shared_lo = share(data_lo, plan.dtype)
+        desc_out, shared_out = share(out, out.dtype)
+
+        # Copy the inputs into shared memory without reading the whole cube
+        # at once.
+        for chans, packed_chans in zip(slabs, packed_slabs):
+            if shared_hi is not None:
+                shared_hi[packed_chans] = data_hi[chans]
+            if shared_lo is not None:
+                shared_lo[packed_chans] = data_lo[chans]
+
+        tasks = list(zip(slabs, packed_slabs))
+
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 mp_context=mp_context,
+                                 initializer=_init_worker,
+                                 initargs=(plan, desc_hi, desc_lo,
+                                           desc_out, get_fft_backend())
+                                 ) as executor:
+            for (chans, packed_chans), nskipped_slab in zip(tasks, executor.map(_feather_slab, tasks)):
+                nskipped += nskipped_slab
+                if progressbar is not None:
+                    progressbar.update(chans.stop - chans.start)
+
+                # The slabs are returned in order, so each one is copied back
+                # as soon as it is done
+                if shared_out is not None:
+                    out[chans] = shared_out[packed_chans]
+                if callback is not None:
+                    callback(chans)
+
+    finally:
+        # The views must be released before the blocks can be closed
+        del views[:]
+        shared_hi = shared_lo = shared_out = None
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+
+    return out, nskipped
@@ -1,5 +1,7 @@
 import numpy as np
-from .uvcombine import fftmerge, feather_kernel
+from .uvcombine import fftmerge_variants, feather_kernel
+from .fft_backend import fft2
+from .annulus import AnnulusIndex
 
 def compare_parameters_feather_simple(im, im_hi, im_low, lowresfwhm, pixscale,
                                       suffix="", replacement_threshold=0.5,
@@ -9,7 +11,6 @@ def compare_parameters_feather_simple(im, im_hi, im_low, lowresfwhm, pixscale,
     Create diagnostic plots for different simulated feathers
     """
 
-    from turbustat.statistics import psds
     import pylab as pl
 
     feathers = {}
@@ -21,46 +22,62 @@ def compare_parameters_feather_simple(im, im_hi, im_low, lowresfwhm, pixscale,
     fig3.clf()
 
 
+    lowresscalefactor=1
+    highresscalefactor=1
+
+    nax2,nax1 = im.shape
+    kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale,)
+
+    # All of the variants share the forward transforms and the kernels
+    keys = [(replace_hires, lowpassfilterSD, deconvSD)
+            for replace_hires in (replacement_threshold, False)
+            for lowpassfilterSD in (True, False)
+            for deconvSD in (True, False)]
+    fftsums, combos = fftmerge_variants(kfft, ikfft,
+                                        im_hi*highresscalefactor,
+                                        im_low*lowresscalefactor,
+                                        [dict(replace_hires=replace_hires,
+                                              lowpassfilterSD=lowpassfilterSD,
+                                              deconvSD=deconvSD)
+                                         for replace_hires, lowpassfilterSD, deconvSD in keys],
+                                       )
+    combos = combos.real
+    resids = im - combos
+
+    # The power spectra of all of the feathers, their residuals and the
+    # original image are averaged over the same annuli in one pass
+    annuli = AnnulusIndex((nax2, nax1), pixscale)
+    pfreq = annuli.radii / nax1
+    ppows = annuli.azimuthal_average(*np.abs(np.fft.fftshift(fftsums, axes=(-2, -1))),
+                                     *np.abs(np.fft.fftshift(fft2(resids), axes=(-2, -1))),
+                                     np.abs(np.fft.fftshift(fft2(im))))[1]
+
+    nvariants = len(keys)
+    ppows_resid = dict(zip(keys, ppows[nvariants:2 * nvariants]))
+    ppows = dict(zip(keys, ppows[:nvariants]), original=ppows[-1])
+    combos = dict(zip(keys, combos))
+    resids = dict(zip(keys, resids))
+
     plotnum = 1
     for replace_hires,ls in ((replacement_threshold, '--'),(False,':')):
         for lowpassfilterSD,lw in ((True,2),(False,1)):
             for deconvSD,color in ((True,'r'), (False, 'k')):
-                #im_hi = im_interferometered
-                #im_low = singledish_im
-                lowresscalefactor=1
-                highresscalefactor=1
-
-                nax1,nax2 = im.shape
-                kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale,)
-
-                fftsum, combo = fftmerge(kfft*1,
-                                         ikfft*1,
-                                         im_hi*highresscalefactor,
-                                         im_low*lowresscalefactor,
-                                         replace_hires=replace_hires,
-                                         lowpassfilterSD=lowpassfilterSD,
-                                         deconvSD=deconvSD,
-                                        )
-                combo = combo.real
+                combo = combos[replace_hires, lowpassfilterSD, deconvSD]
                 feathers[replace_hires, lowpassfilterSD, deconvSD] = combo
-                resid = im-combo
-
+                resid = resids[replace_hires, lowpassfilterSD, deconvSD]
 
-                pfreq, ppow = psds.pspec(np.fft.fftshift(np.abs(fftsum)))
+                ppow = ppows[replace_hires, lowpassfilterSD, deconvSD]
                 name = (("Replace < {}; ".format(replace_hires) if replace_hires else "") +
                         ("filterSD;" if lowpassfilterSD else "")+
                         ("deconvSD" if deconvSD else ""))
                 if name == "":
                     name = "CASA defaults"
-                pfreq = pfreq[np.isfinite(ppow)]
-                ppow = ppow[np.isfinite(ppow)]
-
-                pfreq_resid, ppow_resid = psds.pspec(np.fft.fftshift(np.abs(np.fft.fft2(resid))))
-                pfreq_resid = pfreq_resid[np.isfinite(ppow_resid)]
+                ppow_resid = ppows_resid[replace_hires, lowpassfilterSD, deconvSD]
+                pfreq_resid = pfreq[np.isfinite(ppow_resid)]
                 ppow_resid = ppow_resid[np.isfinite(ppow_resid)]
 
                 ax1 = fig1.add_subplot(3, 3, plotnum)
-                ax1.loglog(pfreq, ppow, label=name, linestyle=ls, linewidth=lw, color=color, alpha=0.75)
+                ax1.loglog(pfreq[np.isfinite(ppow)], ppow[np.isfinite(ppow)], label=name, linestyle=ls, linewidth=lw, color=color, alpha=0.75)
                 ax1.loglog(pfreq_resid, ppow_resid, linestyle=ls, linewidth=lw, color='b', alpha=0.75)
                 ax1.axis(psd_axlims)
                 ax1.set_title(name)
@@ -82,10 +99,8 @@ def compare_parameters_feather_simple(im, im_hi, im_low, lowresfwhm, pixscale,
 
 
     ax1 = fig1.add_subplot(3, 3, plotnum)
-    pfreq, ppow = psds.pspec(np.fft.fftshift(np.abs(np.fft.fft2(im))))
-    pfreq = pfreq[np.isfinite(ppow)]
-    ppow = ppow[np.isfinite(ppow)]
-    ax1.loglog(pfreq, ppow, linestyle='-', linewidth=4, color='g', alpha=1)
+    ppow = ppows['original']
+    ax1.loglog(pfreq[np.isfinite(ppow)], ppow[np.isfinite(ppow)], linestyle='-', linewidth=4, color='g', alpha=1)
     ax1.axis(psd_axlims)
     ax1.set_title("Original Image")
 
@@ -0,0 +1,153 @@
+"""
+Reusable celestial reprojection between two fixed pixel grids.
+"""
+
+import numpy as np
+from astropy import wcs
+from astropy.wcs.utils import pixel_to_pixel
+from scipy import sparse
+
+
+class ReprojectionMap(object):
+    """
+    Bilinear interpolation from one celestial pixel grid onto another.
+
+    The pixel to world to pixel transformation and the interpolation weights
+    are computed once and stored as a sparse matrix. Reprojecting an image,
+    or a stack of images sharing the same celestial WCS (e.g., the channels
+    of a cube), is then a single sparse matrix product. The results match
+    `~reproject.reproject_interp` with ``order='bilinear'``.
+
+    The matrix stores four weights per output pixel, so its size is roughly
+    48 bytes times the number of output pixels.
+
+    Parameters
+    ----------
+    wcs_in : `~astropy.wcs.WCS`
+        The celestial WCS of the input images.
+    shape_in : tuple
+        The spatial shape of the input images.
+    wcs_out : `~astropy.wcs.WCS`
+        The celestial WCS of the output images.
+    shape_out : tuple
+        The spatial shape of the output images.
+    dtype : `~numpy.dtype`, optional
+        Data type of the interpolation weights. ``np.float32`` keeps the
+        reprojection of single-precision data in single precision.
+    """
+
+    def __init__(self, wcs_in, shape_in, wcs_out, shape_out, dtype=float):
+
+        self.shape_in = tuple(shape_in)
+        self.shape_out = tuple(shape_out)
+
+        ny_in, nx_in = self.shape_in
+        ny_out, nx_out = self.shape_out
+
+        yy, xx = np.indices(self.shape_out, dtype=float)
+        xx = xx.ravel()
+        yy = yy.ravel()
+
+        x_in, y_in = pixel_to_pixel(wcs_out, wcs_in, xx, yy)
+        x_in = np.array(x_in, dtype=float)
+        y_in = np.array(y_in, dtype=float)
+
+        # Reject positions that do not round-trip to the same output pixel,
+        # as is done in reproject.
+        x_check, y_check = pixel_to_pixel(wcs_in, wcs_out, x_in, y_in)
+        bad = (np.abs(x_check - xx) > 1) | (np.abs(y_check - yy) > 1)
+        x_in[bad] = np.nan
+        y_in[bad] = np.nan
+
+        # Values are defined at the pixel centres, so positions in the outer
+        # half of the edge pixels take the edge value.
+        with np.errstate(invalid='ignore'):
+            inside = ((x_in >= -0.5) & (x_in < nx_in - 0.5) &
+                      (y_in >= -0.5) & (y_in < ny_in - 0.5))
+
+        self.outside = ~inside
+
+        x_in = np.clip(x_in[inside], 0, nx_in - 1)
+        y_in = np.clip(y_in[inside], 0, ny_in - 1)
+
+        x0 = np.floor(x_in).astype(np.intp)
+        y0 = np.floor(y_in).astype(np.intp)
+        x1 = np.minimum(x0 + 1, nx_in - 1)
+        y1 = np.minimum(y0 + 1, ny_in - 1)
+
+        fx = x_in - x0
+        fy = y_in - y0
+
+        rows = np.flatnonzero(inside)
+
+        row_idx = np.tile(rows, 4)
+        col_idx = np.concatenate([y0 * nx_in + x0,
+                                  y0 * nx_in + x1,
+                                  y1 * nx_in + x0,
+                                  y1 * nx_in + x1])
+        weights = np.concatenate([(1 - fx) * (1 - fy),
+                                  fx * (1 - fy),
+                                  (1 - fx) * fy,
+                                  fx * fy])
+
+        # Drop the zero weights so NaNs in unused neighbouring pixels do not
+        # propagate.
+        keep = weights != 0
+
+        self.matrix = sparse.csr_matrix((weights[keep].astype(dtype),
+                                         (row_idx[keep], col_idx[keep])),
+                                        shape=(ny_out * nx_out,
+                                               ny_in * nx_in))
+
+    @classmethod
+    def from_headers(cls, header_in, header_out):
+        """
+        Create the map from two FITS headers. Only the celestial part of the
+        headers is used.
+        """
+
+        shape_in = (header_in['NAXIS2'], header_in['NAXIS1'])
+        shape_out = (header_out['NAXIS2'], header_out['NAXIS1'])
+
+        return cls(wcs.WCS(header_in).celestial, shape_in,
+                   wcs.WCS(header_out).celestial, shape_out)
+
+    def __call__(self, data, out=None):
+        """
+        Reproject an image or a stack of images.
+
+        Parameters
+        ----------
+        data : `~numpy.ndarray`
+            Array with shape ``shape_in`` or ``(nplanes,) + shape_in``.
+        out : `~numpy.ndarray`, optional
+            Array to write the output into.
+
+        Returns
+        -------
+        out : `~numpy.ndarray`
+            Array with shape ``shape_out`` or ``(nplanes,) + shape_out``.
+            Pixels outside of the input image are NaN.
+        """
+
+        data = np.asarray(data)
+
+        if data.shape[-2:] != self.shape_in:
+            raise ValueError("The data shape {0} does not match the input"
+                             " shape of the map {1}."
+                             .format(data.shape[-2:], self.shape_in))
+
+        lead_shape = data.shape[:-2]
+
+        flat = data.reshape((-1, self.matrix.shape[1]))
+        result = np.asarray(self.matrix.dot(flat.T)).T
+
+        result[:, self.outside] = np.nan
+
+        result = result.reshape(lead_shape + self.shape_out)
+
+        if out is None:
+            return result
+
+        out[...] = result
+        return out
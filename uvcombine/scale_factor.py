@@ -13,7 +13,7 @@ from astropy import stats as astrostats
 from scipy import stats
 from astropy import log
 
-from .uvcombine import feather_compare
+from .uvcombine import _compare_spectra
 
 
 def find_effSDbeam(hires, lores,
@@ -31,6 +31,10 @@ def find_effSDbeam(hires, lores,
     See Sec. 3.2.1 in Stanimirovic (1999)
     https://ui.adsabs.harvard.edu/#abs/1999PhDT........21S/abstract
 
+    The images are regridded and Fourier transformed once, and every FWHM
+    is compared against the same spectra, so a sweep costs about as much as
+    a single `~uvcombine.feather_compare`.
+
     Parameters
     ----------
     hires : np.ndarray
@@ -61,21 +65,50 @@ def find_effSDbeam(hires, lores,
         interval region is set by `alpha`.
     '''
 
+    if np.any(LAS <= lowresfwhms):
+        raise ValueError("Must have LAS > lowresfwhms. Check the input parameters.")
+
+    # Only the kernel and the overlap region depend on the FWHM, so the
+    # images are regridded and transformed once.
+    fft_hi, fft_lo, angscales, pixscale = _compare_spectra(hires, lores)
+
+    nax2, nax1 = fft_hi.shape
+
+    # Keep the points within the overlap region of any of the FWHMs
+    angscales = angscales.to(u.arcsec).value
+    candidates = np.flatnonzero((angscales > lowresfwhms.min().to(u.arcsec).value) &
+                                (angscales < LAS.to(u.arcsec).value))
+
+    radii = (angscales.ravel()[candidates] * u.arcsec).to(u.karcsec).value
+    abs_hi = np.abs(fft_hi).ravel()[candidates]
+    abs_lo = np.abs(fft_lo).ravel()[candidates]
+
+    # Squared frequencies of the points, to evaluate the analytic kernel of
+    # `~uvcombine.feather_kernel` (on the fftshifted grid) at each FWHM
+    yy, xx = np.unravel_index(candidates, (nax2, nax1))
+    freq2 = (np.fft.fftshift(np.fft.fftfreq(nax2))[yy]**2 +
+             np.fft.fftshift(np.fft.fftfreq(nax1))[xx]**2)
+
+    sigmas = (lowresfwhms / np.sqrt(8 * np.log(2)) / pixscale).decompose().value
+
     slopes = np.empty(lowresfwhms.size)
     slopes_CI = np.empty((2, lowresfwhms.size))
 
-    for i, lowresfwhm in enumerate(tqdm(lowresfwhms)):
-        out = feather_compare(hires, lores,
-                              SAS=lowresfwhm,
-                              LAS=LAS,
-                              lowresfwhm=lowresfwhm,
-                              return_samples=True,
-                              doplot=False)
+    for i, (lowresfwhm, sigma) in enumerate(zip(tqdm(lowresfwhms), sigmas)):
+        kfft = np.exp(-2 * (np.pi * sigma)**2 * freq2)
+
+        # As in `~uvcombine.feather_compare` with SAS=lowresfwhm
+        mask = (radii > lowresfwhm.to(u.karcsec).value) & (kfft >= min_beam_fraction)
+
+        if mask.sum() == 0:
+            raise ValueError("No valid uv-overlap region found for a FWHM of"
+                             " {0}. Check the inputs for LAS.".format(lowresfwhm))
 
-        radii = out[0].to(u.karcsec)
-        ratios = out[1]
+        ratios = abs_hi[mask] / abs_lo[mask]
+        if beam_divide_lores:
+            ratios = ratios * kfft[mask]
 
-        fitted = stats.theilslopes(ratios, radii.value**2,
+        fitted = stats.theilslopes(ratios, radii[mask]**2,
                                    alpha=alpha)
 
         slopes[i] = fitted[0]
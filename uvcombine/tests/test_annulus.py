@@ -0,0 +1,65 @@
+import pytest
+
+import astropy.units as u
+import numpy.testing as npt
+import numpy as np
+
+from ..annulus import AnnulusIndex, annulus_cache
+
+
+@pytest.mark.parametrize('shape', [(64, 64), (48, 65)])
+def test_annulus_index(shape):
+
+    nax2, nax1 = shape
+    pixscale = 2 * u.arcsec
+
+    annuli = AnnulusIndex(shape, pixscale)
+
+    assert annuli.bin_ids.shape == shape
+    assert annuli.counts.sum() == nax2 * nax1
+    assert annuli.nbins == annuli.bin_ids.max() + 1
+
+    yy, xx = np.indices(shape)
+    rr = ((xx-(nax1-1)/2.)**2 + (yy-(nax2-1)/2.)**2)**0.5
+    with np.errstate(divide='ignore'):
+        npt.assert_allclose(annuli.angscales.to(u.arcsec).value,
+                            (nax1 / rr * pixscale).to(u.arcsec).value)
+
+    rng = np.random.default_rng(0)
+    images = [rng.random(shape) for _ in range(3)]
+    images[1][:5] = np.nan
+
+    radii, averages = annuli.azimuthal_average(*images)
+
+    assert averages.shape == (3, annuli.nbins)
+
+    # Compare with the average of each annulus
+    for image, average in zip(images, averages):
+        for ii in range(annuli.nbins):
+            values = image[annuli.bin_ids == ii]
+            values = values[np.isfinite(values)]
+            if values.size == 0:
+                assert np.isnan(average[ii])
+            else:
+                npt.assert_allclose(average[ii], values.mean())
+
+    npt.assert_allclose(annuli.azimuthal_average(images[0])[1], averages[0])
+
+    with pytest.raises(ValueError, match='shape'):
+        annuli.azimuthal_average(np.ones((4, 4)))
+
+
+def test_annulus_index_cache():
+
+    annulus_cache.clear()
+
+    annuli = AnnulusIndex((32, 32), 1 * u.arcsec)
+    annuli_same = AnnulusIndex((32, 32), 1 * u.arcsec)
+
+    assert annuli_same.bin_ids is annuli.bin_ids
+    assert annulus_cache.stats()['hits'] == 1
+
+    # A different pixel scale only changes the angular scales
+    annuli_coarse = AnnulusIndex((32, 32), 2 * u.arcsec)
+    npt.assert_array_equal(annuli_coarse.bin_ids, annuli.bin_ids)
+    npt.assert_allclose(annuli_coarse.radial_angscales, 2 * annuli.radial_angscales)
@@ -0,0 +1,91 @@
+import pytest
+
+import astropy.units as u
+import numpy.testing as npt
+import numpy as np
+
+from ..cache import ArrayCache, kernel_cache
+from ..uvcombine import feather_kernel
+
+
+def test_array_cache_eviction():
+
+    cache = ArrayCache(max_bytes=3 * 800)
+
+    for ii in range(3):
+        cache.get(ii, lambda: (np.zeros(100),))
+
+    assert cache.stats()['entries'] == 3
+    assert cache.nbytes == 3 * 800
+
+    # Use the first entry so the second is the least recently used
+    arrays = cache.get(0, lambda: (np.ones(100),))
+    npt.assert_array_equal(arrays[0], 0.)
+    assert not arrays[0].flags.writeable
+
+    cache.get(3, lambda: (np.zeros(100),))
+
+    assert 1 not in cache
+    assert 0 in cache and 3 in cache
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 4
+    assert stats['evictions'] == 1
+    assert stats['nbytes'] == 3 * 800
+
+    # Entries larger than the cache are returned but not stored
+    arrays = cache.get('big', lambda: (np.zeros(1000),))
+    assert arrays[0].size == 1000
+    assert 'big' not in cache
+
+    cache.resize(800)
+    assert len(cache) == 1
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()['misses'] == 0
+
+
+def test_feather_kernel_cache():
+
+    kernel_cache.clear()
+
+    pixscale = 3 * u.arcsec
+
+    kfft, ikfft = feather_kernel(64, 48, 25 * u.arcsec, pixscale)
+    assert kernel_cache.stats()['misses'] == 1
+
+    # The same beam in pixels reuses the kernel
+    kfft2, ikfft2 = feather_kernel(64, 48, 25 * u.arcsec,
+                                   pixscale.to(u.deg))
+    assert kfft2 is kfft
+    assert kernel_cache.stats()['hits'] == 1
+
+    with pytest.raises(ValueError):
+        kfft[0, 0] = 0.
+
+    # Only kfft is stored; ikfft is derived from it
+    assert kernel_cache.nbytes == kfft.nbytes
+    npt.assert_array_equal(ikfft2, 1 - kfft)
+    assert not ikfft2.flags.writeable
+
+    # Any change to the shape, beam, half-plane or dtype is a new kernel
+    feather_kernel(64, 48, 30 * u.arcsec, pixscale)
+    feather_kernel(64, 48, 25 * u.arcsec, pixscale, use_rfft=True)
+    feather_kernel(64, 48, 25 * u.arcsec, pixscale, dtype=np.float32)
+    assert kernel_cache.stats()['misses'] == 4
+
+    kfft_nocache, ikfft_nocache = feather_kernel(64, 48, 25 * u.arcsec,
+                                                 pixscale, use_cache=False)
+    assert kfft_nocache.flags.writeable
+    npt.assert_array_equal(kfft_nocache, kfft)
+    assert kernel_cache.stats()['misses'] == 4
+
+    kernel_cache.clear()
+
+
+def test_feather_kernel_cache_size():
+
+    # The full-plane float64 kernel of an 8192 x 8192 mosaic is cached
+    assert kernel_cache.max_bytes >= 8192 * 8192 * np.dtype(float).itemsize
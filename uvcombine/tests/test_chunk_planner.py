@@ -0,0 +1,84 @@
+import pytest
+
+import astropy.units as u
+import numpy as np
+
+from .. import chunk_planner
+from ..chunk_planner import (bytes_per_channel, memory_limit_bytes,
+                             plan_feather_chunks)
+
+
+def test_memory_limit_bytes():
+
+    assert memory_limit_bytes(1024) == 1024
+    assert memory_limit_bytes('1 MB') == 10**6
+    assert memory_limit_bytes(2 * u.kibibyte) == 2048
+
+    with pytest.raises(ValueError):
+        memory_limit_bytes(0)
+
+
+def test_bytes_per_channel():
+
+    shape = (64, 64)
+
+    nbytes = bytes_per_channel(shape)
+    nbytes_32 = bytes_per_channel(shape, dtype=np.float32)
+
+    assert nbytes_32 * 2 == nbytes
+    # The full-plane transforms need larger spectra
+    assert bytes_per_channel(shape, use_rfft=False) > nbytes
+    # Regridding keeps the low-resolution plane in memory
+    assert (bytes_per_channel(shape, shape_lo=(32, 32)) ==
+            nbytes + 32 * 32 * 8)
+
+
+def test_plan_feather_chunks():
+
+    shape = (100, 64, 64)
+    per_channel = bytes_per_channel(shape[1:])
+
+    plan = plan_feather_chunks(shape, memory_limit=40 * per_channel,
+                               n_workers=4)
+    assert plan.n_workers == 4
+    assert plan.channels_per_chunk == 10
+    assert plan.nchunks == 10
+    assert plan.peak_bytes <= plan.memory_limit
+    assert "channels per chunk:  10" in plan.summary()
+
+    # Every worker gets a chunk
+    plan = plan_feather_chunks(shape, memory_limit=10**4 * per_channel,
+                               n_workers=4)
+    assert plan.channels_per_chunk == 25
+
+    # Fewer workers when the budget only fits two channels
+    plan = plan_feather_chunks(shape, memory_limit=2 * per_channel,
+                               n_workers=4)
+    assert plan.n_workers == 2
+    assert plan.channels_per_chunk == 1
+
+    with pytest.raises(ValueError) as exc:
+        plan_feather_chunks(shape, memory_limit=per_channel // 2)
+    assert "too small to feather a single channel" in exc.value.args[0]
+
+
+def test_plan_feather_chunks_default_limit(monkeypatch):
+
+    shape = (10, 64, 64)
+    per_channel = bytes_per_channel(shape[1:])
+
+    # A channel larger than the default budget is still feathered on its own
+    monkeypatch.setattr(chunk_planner, 'DEFAULT_MEMORY_LIMIT', per_channel // 2)
+
+    plan = plan_feather_chunks(shape, n_workers=4)
+    assert plan.n_workers == 1
+    assert plan.channels_per_chunk == 1
+
+    # An explicit limit that is too small still raises
+    with pytest.raises(ValueError):
+        plan_feather_chunks(shape, memory_limit=per_channel // 2)
+
+    plan = plan_feather_chunks(shape, memory_limit=per_channel // 2,
+                               strict=False)
+    assert plan.channels_per_chunk == 1
+    assert plan.peak_bytes > plan.memory_limit
@@ -0,0 +1,120 @@
+import pytest
+
+import numpy as np
+from spectral_cube import SpectralCube
+
+from ..chunk_planner import bytes_per_channel
+from ..cost_estimate import estimate_feather_cost, benchmark_fft
+
+
+def test_benchmark_fft():
+
+    # Larger planes are extrapolated from a smaller transform
+    assert benchmark_fft((64, 64)) > 0
+    assert benchmark_fft((256, 256), max_pixels=64**2) > 0
+
+
+@pytest.mark.parametrize('use_dask', (False, True))
+def test_estimate_feather_cost(cube_data, use_dask):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname, use_dask=use_dask)
+    interf_cube = SpectralCube.read(interf_fname, use_dask=use_dask)
+
+    nchan = interf_cube.shape[0]
+    channel_bytes = bytes_per_channel(interf_cube.shape[1:])
+
+    cost = estimate_feather_cost(interf_cube, sd_cube,
+                                 memory_limit=2 * channel_bytes,
+                                 n_workers=2)
+
+    assert cost.use_dask == use_dask
+
+    # The cubes share the same grid and units
+    assert not cost['spectral_interpolate'].runs
+    assert not cost['reproject'].runs
+    assert not cost['unit_conversion'].runs
+
+    assert cost['feather'].nfft == 3 * nchan
+    assert cost.chunk_plan.channels_per_chunk == 1
+    assert cost.chunk_plan.n_workers == 2
+    assert cost.peak_bytes >= 2 * channel_bytes
+    assert cost.fits_in(2 * cost.peak_bytes)
+    assert not cost.fits_in(cost.peak_bytes // 2)
+
+    assert cost.seconds > 0
+    assert "feather" in cost.summary()
+
+    cost = estimate_feather_cost(interf_cube, sd_cube, benchmark=False)
+    assert cost.seconds is None
+
+
+@pytest.mark.parametrize('use_dask', (False, True))
+def test_estimate_feather_cost_small_limit(cube_data, use_dask, monkeypatch):
+
+    from .. import chunk_planner
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname, use_dask=use_dask)
+    interf_cube = SpectralCube.read(interf_fname, use_dask=use_dask)
+
+    channel_bytes = bytes_per_channel(interf_cube.shape[1:])
+
+    # A dry run reports the peak when a channel does not fit in the budget
+    cost = estimate_feather_cost(interf_cube, sd_cube,
+                                 memory_limit=channel_bytes // 2,
+                                 benchmark=False)
+    assert cost.chunk_plan.channels_per_chunk == 1
+    assert cost.peak_bytes >= channel_bytes
+    assert not cost.fits_in(channel_bytes // 2)
+
+    # Including the default budget
+    monkeypatch.setattr(chunk_planner, 'DEFAULT_MEMORY_LIMIT', channel_bytes // 2)
+
+    cost = estimate_feather_cost(interf_cube, sd_cube, benchmark=False)
+    if not use_dask:
+        assert cost.chunk_plan.channels_per_chunk == 1
+    assert not cost.fits_in(None)
+
+
+def test_estimate_feather_cost_regrid(cube_data, tmp_path):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+
+    header_lo = sd_cube.header.copy()
+    header_lo['CDELT1'] *= 2
+    header_lo['CDELT2'] *= 2
+    header_lo['CRPIX1'] = header_lo['CRPIX1'] / 2
+    header_lo['CRPIX2'] = header_lo['CRPIX2'] / 2
+    header_lo['NAXIS1'] = header_lo['NAXIS1'] // 2
+    header_lo['NAXIS2'] = header_lo['NAXIS2'] // 2
+
+    sd_coarse_fname = tmp_path / "sd_coarse.fits"
+    sd_cube.reproject(header_lo).write(sd_coarse_fname)
+
+    # Filenames are read lazily
+    cost = estimate_feather_cost(interf_fname, sd_coarse_fname,
+                                 benchmark=False)
+    assert cost['reproject'].runs
+    assert not cost['rechunk'].runs
+
+    cost_dask = estimate_feather_cost(interf_fname, sd_coarse_fname,
+                                      use_dask=True, channels_per_chunk=1,
+                                      benchmark=False)
+    assert cost_dask.use_dask
+    assert cost_dask['reproject'].runs
+    assert cost_dask['rechunk'].runs
+    assert cost_dask.chunk_plan.channels_per_chunk == 1
+
+    # Channels that do not match are interpolated first
+    sd_cube = SpectralCube.read(sd_fname)[:2]
+    cost = estimate_feather_cost(interf_fname, sd_cube, benchmark=False)
+    assert cost['spectral_interpolate'].runs
+
+    with pytest.raises(ValueError):
+        estimate_feather_cost(interf_fname, sd_cube,
+                              allow_spectral_resample=False)
@@ -1,8 +1,10 @@
 import pytest
 import os
+import json
 
 import astropy.units as u
 from astropy.io import fits
+from astropy import wcs
 import numpy.testing as npt
 import numpy as np
 from spectral_cube import Projection, SpectralCube, DaskSpectralCube
@@ -12,8 +14,12 @@ from skimage.metrics import structural_similarity, normalized_root_mse
 
 from . import path
 
-from ..uvcombine import (feather_simple, fourier_combine_cubes,
-                         feather_simple_cube)
+from ..uvcombine import (feather_simple, feather_plot, fourier_combine_cubes,
+                         feather_simple_cube, feather_compare, feather_compare_cube,
+                         feather_kernel, fftmerge, fftmerge_variants,
+                         _fftmerge_planes, _prepare_planes)
+from ..chunk_planner import bytes_per_channel
+from ..cube_io import read_zarr_cube
 
 
 def cube_and_raw(filename, use_dask=None):
@@ -37,6 +43,188 @@ def cube_and_raw(filename, use_dask=None):
     return c, d
 
 
+def _feather_kernel_imagespace(nax2, nax1, lowresfwhm, pixscale):
+    '''
+    The original construction of the feather kernel: FFT an image-space
+    Gaussian and normalize its amplitude.
+    '''
+    ygrid, xgrid = (np.indices([nax2, nax1]) -
+                    np.array([(nax2 - 1.) / 2, (nax1 - 1.) / 2.])[:, None, None])
+
+    sigma = (lowresfwhm / np.sqrt(8 * np.log(2)) / pixscale).decompose().value
+
+    kernel = np.fft.fftshift(np.exp(-(xgrid**2 + ygrid**2) / (2 * sigma**2)))
+    kfft = np.abs(np.fft.fft2(kernel))
+    kfft /= kfft.max()
+
+    return kfft, 1 - kfft
+
+
+# The image-space kernel is affected by aliasing when the beam is barely
+# sampled and by truncation when the beam is comparable to the image size. The
+# analytic kernel is free of both, so the tolerance is looser in those cases.
+@pytest.mark.parametrize(('nax2', 'nax1', 'lowresfwhm', 'atol'),
+                         ((512, 512, 25 * u.arcsec, 1e-10),
+                          (128, 200, 25 * u.arcsec, 1e-10),
+                          (127, 63, 20 * u.arcsec, 1e-10),
+                          (127, 63, 10 * u.arcsec, 1e-4),
+                          (64, 64, 60 * u.arcsec, 1e-3)))
+def test_feather_kernel_analytic(nax2, nax1, lowresfwhm, atol):
+
+    pixscale = 3 * u.arcsec
+
+    kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale)
+    kfft_ref, ikfft_ref = _feather_kernel_imagespace(nax2, nax1, lowresfwhm,
+                                                     pixscale)
+
+    assert kfft.shape == (nax2, nax1)
+    assert kfft.max() == 1.
+
+    npt.assert_allclose(kfft, kfft_ref, atol=atol)
+    npt.assert_allclose(ikfft, ikfft_ref, atol=atol)
+
+    # Pixel scale given as a float in deg
+    kfft_deg, _ = feather_kernel(nax2, nax1, lowresfwhm, pixscale.to(u.deg).value)
+    npt.assert_allclose(kfft, kfft_deg)
+
+
+@pytest.mark.parametrize(('replace_hires', 'lowpassfilterSD', 'deconvSD'),
+                         ((False, False, False),
+                          (False, True, False),
+                          (False, False, True),
+                          (0.5, False, False),
+                          (0.5, True, False),
+                          (0.5, False, True)))
+def test_fftmerge_rfft(plaw_test_data, replace_hires, lowpassfilterSD,
+                       deconvSD):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    # Use an odd-sized image to check the half-plane shape handling
+    im_hi = highres_hdu.data[:-1, :-2]
+    im_lo = lowres_hdu.data[:-1, :-2]
+    nax2, nax1 = im_hi.shape
+
+    merge_kwargs = dict(replace_hires=replace_hires,
+                        lowpassfilterSD=lowpassfilterSD,
+                        deconvSD=deconvSD)
+
+    kfft, ikfft = feather_kernel(nax2, nax1, 25 * u.arcsec, 3 * u.arcsec)
+    fftsum, combo = fftmerge(kfft, ikfft, im_hi, im_lo, **merge_kwargs)
+
+    kfft_r, ikfft_r = feather_kernel(nax2, nax1, 25 * u.arcsec, 3 * u.arcsec,
+                                     use_rfft=True)
+    assert kfft_r.shape == (nax2, nax1 // 2 + 1)
+    npt.assert_allclose(kfft_r, kfft[:, :nax1 // 2 + 1])
+
+    fftsum_r, combo_r = fftmerge(kfft_r, ikfft_r, im_hi, im_lo,
+                                 use_rfft=True, **merge_kwargs)
+
+    assert not np.iscomplexobj(combo_r)
+    assert combo_r.shape == im_hi.shape
+    npt.assert_allclose(fftsum_r, fftsum[:, :nax1 // 2 + 1])
+    npt.assert_allclose(combo_r, combo.real, rtol=1e-10,
+                        atol=1e-10 * np.abs(combo.real).max())
+
+    # Mixing a full-plane kernel with the real-input FFTs should fail
+    with pytest.raises(ValueError) as exc:
+        fftmerge(kfft, ikfft, im_hi, im_lo, use_rfft=True)
+    assert "does not match the shape" in exc.value.args[0]
+
+
+@pytest.mark.parametrize(('replace_hires', 'lowpassfilterSD', 'deconvSD'),
+                         ((False, False, False),
+                          (False, True, False),
+                          (False, False, True),
+                          (0.5, False, False)))
+@pytest.mark.parametrize('use_rfft', (False, True))
+def test_fftmerge_planes_skip(plaw_test_data, replace_hires, lowpassfilterSD,
+                              deconvSD, use_rfft):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    nax2, nax1 = highres_hdu.data.shape
+
+    merge_kwargs = dict(replace_hires=replace_hires,
+                        lowpassfilterSD=lowpassfilterSD,
+                        deconvSD=deconvSD,
+                        use_rfft=use_rfft)
+
+    # Planes with data, all NaN, all zero, constant, and NaN with a
+    # constant low-resolution plane
+    im_hi = np.empty((5, nax2, nax1))
+    im_lo = np.empty((5, nax2, nax1))
+    im_hi[0], im_lo[0] = highres_hdu.data, lowres_hdu.data
+    im_hi[1], im_lo[1] = np.nan, np.nan
+    im_hi[2], im_lo[2] = 0., 0.
+    im_hi[3], im_lo[3] = 2., 3.
+    im_hi[4], im_lo[4] = np.nan, 3.
+
+    kfft, ikfft = feather_kernel(nax2, nax1, 25 * u.arcsec, 3 * u.arcsec,
+                                 use_rfft=use_rfft)
+
+    fill_hi, empty_hi = _prepare_planes(im_hi, np.empty_like(im_hi), 1.)
+    fill_lo, empty_lo = _prepare_planes(im_lo, np.empty_like(im_lo), 1.)
+
+    npt.assert_equal(empty_hi, [False, True, False, False, True])
+    npt.assert_equal(empty_lo, [False, True, False, False, False])
+    assert np.isfinite(fill_hi).all()
+
+    combo, nskipped = _fftmerge_planes(kfft, ikfft, fill_hi, fill_lo,
+                                       empty=empty_hi & empty_lo,
+                                       **merge_kwargs)
+
+    assert nskipped == 4
+
+    fftsum, combo_fft = fftmerge(kfft, ikfft, im_hi, im_lo, **merge_kwargs)
+    combo_fft = combo_fft.real
+
+    # Planes without any data are blank
+    assert np.isnan(combo[1]).all()
+
+    for ii in (0, 2, 3, 4):
+        npt.assert_allclose(combo[ii], combo_fft[ii], rtol=1e-10,
+                            atol=1e-10 * max(np.abs(combo_fft[ii]).max(), 1.))
+
+
+@pytest.mark.parametrize('use_rfft', (False, True))
+def test_fftmerge_variants(plaw_test_data, use_rfft):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    nax2, nax1 = highres_hdu.data.shape
+
+    kfft, ikfft = feather_kernel(nax2, nax1, 25 * u.arcsec, 3 * u.arcsec,
+                                 use_rfft=use_rfft)
+
+    variants = [dict(replace_hires=replace_hires,
+                     lowpassfilterSD=lowpassfilterSD,
+                     deconvSD=deconvSD)
+                for replace_hires in (0.5, False)
+                for lowpassfilterSD in (True, False)
+                for deconvSD in (True, False)]
+
+    fftsums, combos = fftmerge_variants(kfft, ikfft, highres_hdu.data,
+                                        lowres_hdu.data, variants,
+                                        use_rfft=use_rfft)
+
+    assert combos.shape == (len(variants), nax2, nax1)
+
+    for fftsum, combo, variant in zip(fftsums, combos, variants):
+        fftsum_single, combo_single = fftmerge(kfft, ikfft, highres_hdu.data,
+                                               lowres_hdu.data,
+                                               use_rfft=use_rfft, **variant)
+
+        npt.assert_allclose(fftsum, fftsum_single, rtol=1e-12,
+                            atol=1e-12 * np.abs(fftsum_single).max())
+        npt.assert_allclose(combo, combo_single, rtol=1e-10,
+                            atol=1e-10 * np.abs(combo_single).max())
+
+    with pytest.raises(ValueError, match='Unknown fftmerge options'):
+        fftmerge_variants(kfft, ikfft, highres_hdu.data, lowres_hdu.data,
+                          [dict(lowpassfilter=True)], use_rfft=use_rfft)
+
+
 def test_feather_simple(plaw_test_data):
 
 
@@ -51,6 +239,10 @@ def test_feather_simple(plaw_test_data):
 
     combo = feather_simple(highres_proj, lowres_proj)
 
+    combo_rfft = feather_simple(highres_proj, lowres_proj, use_rfft=True)
+    assert not np.iscomplexobj(combo_rfft)
+    npt.assert_allclose(combo_rfft, combo.real, rtol=1e-10)
+
     # Assert the combined data is sufficiently close to the original
     orig_data = orig_hdu.data
 
@@ -74,6 +266,22 @@ def test_feather_simple(plaw_test_data):
     assert ssim > 0.99
 
 
+@pytest.mark.parametrize('use_rfft', (False, True))
+def test_feather_simple_float32(plaw_test_data, use_rfft):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    combo = feather_simple(highres_hdu, lowres_hdu, use_rfft=use_rfft)
+    combo32 = feather_simple(highres_hdu, lowres_hdu, use_rfft=use_rfft,
+                             dtype=np.float32)
+
+    assert combo32.dtype == (np.float32 if use_rfft else np.complex64)
+
+    # The documented accuracy of single precision relative to the peak
+    npt.assert_allclose(combo32.real, combo.real,
+                        atol=1e-6 * np.abs(combo.real).max())
+
+
 @pytest.mark.parametrize(('lounit', 'hiunit'),
                          ((u.K, u.Jy / u.beam),
                           (u.Jy / u.beam, u.K),
@@ -138,6 +346,69 @@ def test_fourier_combine_cubes(cube_data):
     npt.assert_allclose(0., frac_diff, atol=5e-3)
 
 
+@pytest.mark.parametrize('beam_divide_lores', (True, False))
+def test_feather_compare_cube(cube_data, beam_divide_lores):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+    interf_cube = SpectralCube.read(interf_fname)
+
+    SAS = 25 * u.arcsec
+    LAS = 56 * u.arcsec
+
+    # Read one channel at a time to check the slabs are put together
+    cube_stats, samples = feather_compare_cube(interf_cube, sd_cube, SAS, LAS,
+                                               beam_divide_lores=beam_divide_lores,
+                                               return_samples=True,
+                                               memory_limit=bytes_per_channel(interf_cube.shape[1:]),
+                                               progressbar=False)
+
+    radii, ratios, abs_hi, abs_lo = samples
+    assert ratios.shape == (interf_cube.shape[0], radii.size)
+
+    # Each channel should match the comparison of the single planes
+    for chan in range(interf_cube.shape[0]):
+        chan_stats = feather_compare(interf_cube[chan], sd_cube[chan], SAS, LAS,
+                                     lowresfwhm=sd_cube.beam.major,
+                                     beam_divide_lores=beam_divide_lores,
+                                     doplot=False)
+        chan_samples = feather_compare(interf_cube[chan], sd_cube[chan], SAS, LAS,
+                                       lowresfwhm=sd_cube.beam.major,
+                                       beam_divide_lores=beam_divide_lores,
+                                       doplot=False, return_samples=True)
+
+        npt.assert_allclose(radii, chan_samples[0])
+        npt.assert_allclose(ratios[chan], chan_samples[1], rtol=1e-6,
+                            atol=1e-10 * np.nanmax(ratios[chan]))
+
+        for key in chan_stats:
+            npt.assert_allclose(cube_stats[key][chan], chan_stats[key], rtol=1e-6,
+                                atol=1e-10 * np.nanmax(ratios[chan]))
+
+    assert (cube_stats['nsamples'] == radii.size).all()
+
+
+def test_feather_compare_cube_blank_channel(cube_data):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    # Blank the second channel of both cubes
+    for fname in (sd_fname, interf_fname):
+        with fits.open(fname, mode='update') as hdulist:
+            hdulist[0].data[1] = np.nan
+
+    cube_stats = feather_compare_cube(SpectralCube.read(interf_fname),
+                                      SpectralCube.read(sd_fname),
+                                      25 * u.arcsec, 56 * u.arcsec,
+                                      progressbar=False)
+
+    assert cube_stats['nsamples'][1] == 0
+    assert np.isnan(cube_stats['median'][1])
+    assert np.isnan(cube_stats['median_sc'][1])
+    assert np.isfinite(cube_stats['median'][[0, 2]]).all()
+
+
 def test_fourier_combine_cubes_diffunits(cube_data):
 
     orig_fname, sd_fname, interf_fname = cube_data
@@ -204,6 +475,164 @@ def test_feather_simple_cube(cube_data, use_dask, use_memmap):
         assert ssim > 0.99
 
 
+@pytest.mark.parametrize('use_dask', (False, True))
+def test_feather_simple_cube_float32(cube_data, use_dask, use_memmap):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = cube_and_raw(sd_fname, use_dask=use_dask)[0]
+    interf_cube = cube_and_raw(interf_fname, use_dask=use_dask)[0]
+
+    combo_cube = feather_simple_cube(interf_cube, sd_cube,
+                                     use_memmap=use_memmap)
+    combo_cube32 = feather_simple_cube(interf_cube, sd_cube,
+                                       use_memmap=use_memmap,
+                                       dtype=np.float32)
+
+    combo = combo_cube.unitless_filled_data[:]
+    combo32 = combo_cube32.unitless_filled_data[:]
+
+    assert combo32.dtype == np.float32
+
+    npt.assert_allclose(combo32, combo, atol=1e-6 * np.abs(combo).max())
+
+
+@pytest.mark.parametrize('dtype', (float, np.float32))
+def test_feather_simple_cube_output(cube_data, tmp_path, use_dask, dtype):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube, sd_data = cube_and_raw(sd_fname, use_dask=use_dask)
+    interf_cube, interf_data = cube_and_raw(interf_fname, use_dask=use_dask)
+
+    combo = feather_simple_cube(interf_cube, sd_cube, use_memmap=False,
+                                dtype=dtype).unitless_filled_data[:]
+
+    output = tmp_path / "feathered.fits"
+
+    combo_cube = feather_simple_cube(interf_cube, sd_cube, dtype=dtype,
+                                     output=output)
+
+    npt.assert_array_equal(combo_cube.unitless_filled_data[:], combo)
+
+    # The feathered cube is already in the file
+    with fits.open(output) as hdulist:
+        assert len(hdulist) == 1
+        assert hdulist[0].data.dtype == np.dtype(dtype).newbyteorder('>')
+        npt.assert_array_equal(hdulist[0].data, combo)
+        assert hdulist[0].header['BUNIT'] == interf_cube.header['BUNIT']
+
+    saved_cube = SpectralCube.read(output)
+    assert saved_cube.wcs.wcs.compare(interf_cube.wcs.wcs,
+                                      cmp=wcs.WCSCOMPARE_ANCILLARY,
+                                      tolerance=1e-10)
+    assert saved_cube.beam == interf_cube.beam
+
+    with pytest.raises(OSError):
+        feather_simple_cube(interf_cube, sd_cube, output=output)
+
+
+@pytest.mark.parametrize('zarr_chunks', ('spectral', 'spatial'))
+def test_feather_simple_cube_zarr_output(cube_data, tmp_path, zarr_chunks):
+
+    zarr = pytest.importorskip('zarr')
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube, sd_data = cube_and_raw(sd_fname, use_dask=True)
+    interf_cube, interf_data = cube_and_raw(interf_fname, use_dask=True)
+
+    combo = feather_simple_cube(interf_cube, sd_cube,
+                                channels_per_chunk=1).unitless_filled_data[:]
+
+    output = tmp_path / "feathered.zarr"
+
+    combo_cube = feather_simple_cube(interf_cube, sd_cube,
+                                     channels_per_chunk=1,
+                                     output=output,
+                                     zarr_chunks=zarr_chunks,
+                                     compressor=None)
+
+    assert combo_cube.unit == interf_cube.unit
+    assert combo_cube.beam == interf_cube.beam
+    npt.assert_array_equal(combo_cube.unitless_filled_data[:], combo)
+
+    if zarr_chunks == 'spectral':
+        chunks = (interf_cube.shape[0],) + interf_cube.shape[1:]
+    else:
+        chunks = (1,) + interf_cube.shape[1:]
+    assert zarr.open_array(str(output), mode='r').chunks == chunks
+
+    saved_cube = read_zarr_cube(output)
+    npt.assert_array_equal(saved_cube.unitless_filled_data[:], combo)
+
+    # The store is not replaced without overwrite
+    with pytest.raises(ValueError):
+        feather_simple_cube(interf_cube, sd_cube, output=output)
+
+    # A zarr output needs the dask implementation
+    sd_cube, sd_data = cube_and_raw(sd_fname, use_dask=False)
+    interf_cube, interf_data = cube_and_raw(interf_fname, use_dask=False)
+    with pytest.raises(ValueError) as exc:
+        feather_simple_cube(interf_cube, sd_cube, output=output,
+                            overwrite=True)
+    assert "Zarr output is only supported with dask" in exc.value.args[0]
+
+
+def test_feather_simple_cube_resume(cube_data, tmp_path):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube, sd_data = cube_and_raw(sd_fname, use_dask=False)
+    interf_cube, interf_data = cube_and_raw(interf_fname, use_dask=False)
+
+    combo = feather_simple_cube(interf_cube, sd_cube,
+                                use_memmap=False).unitless_filled_data[:]
+
+    output = tmp_path / "feathered.fits"
+    progress_file = tmp_path / "feathered.fits.progress.json"
+
+    # Feather one channel per slab
+    memory_limit = bytes_per_channel(interf_cube.shape[1:])
+
+    feather_simple_cube(interf_cube, sd_cube, output=output, resume=True,
+                        memory_limit=memory_limit)
+
+    with open(progress_file) as fobj:
+        progress = json.load(fobj)
+    assert progress['completed'] == [[0, interf_cube.shape[0]]]
+
+    # Pretend the run stopped before the last channel. The recorded
+    # channels are zeroed to check that they are not feathered again.
+    progress['completed'] = [[0, 2]]
+    with open(progress_file, 'w') as fobj:
+        json.dump(progress, fobj)
+
+    with fits.open(output, mode='update') as hdulist:
+        hdulist[0].data[:] = 0.
+
+    combo_cube = feather_simple_cube(interf_cube, sd_cube, output=output,
+                                     resume=True, memory_limit=memory_limit)
+
+    npt.assert_array_equal(combo_cube.unitless_filled_data[:2], 0.)
+    npt.assert_array_equal(combo_cube.unitless_filled_data[2], combo[2])
+
+    # Different parameters cannot resume from the same file
+    with pytest.raises(ValueError) as exc:
+        feather_simple_cube(interf_cube, sd_cube, output=output, resume=True,
+                            highresscalefactor=0.9)
+    assert "different inputs or feathering parameters" in exc.value.args[0]
+
+    # Start again
+    combo_cube = feather_simple_cube(interf_cube, sd_cube, output=output,
+                                     resume=True, overwrite=True)
+    npt.assert_array_equal(combo_cube.unitless_filled_data[:], combo)
+
+    with pytest.raises(ValueError) as exc:
+        feather_simple_cube(interf_cube, sd_cube, resume=True)
+    assert "An output file must be given" in exc.value.args[0]
+
+
 def test_feather_simple_cube_dask_consistency(cube_data):
 
     orig_fname, sd_fname, interf_fname = cube_data
@@ -318,6 +747,186 @@ def test_feather_simple_cube_dask_rechunk(cube_data):
     assert "Cubes must have a single chunk along the spatial axes." in exc.value.args[0]
 
 
+def test_feather_simple_cube_dask_memory_limit(cube_data):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube, sd_data = cube_and_raw(sd_fname, use_dask=True)
+    interf_cube, interf_data = cube_and_raw(interf_fname, use_dask=True)
+
+    channel_bytes = bytes_per_channel(interf_cube.shape[1:])
+
+    combo_cube = feather_simple_cube(interf_cube, sd_cube,
+                                     use_memmap=False,
+                                     memory_limit=2 * channel_bytes,
+                                     n_workers=2)
+
+    # The budget fits a single channel per worker
+    assert combo_cube._data.chunksize[0] == 1
+
+    combo_cube_ref = feather_simple_cube(interf_cube, sd_cube,
+                                         use_memmap=False)
+
+    npt.assert_allclose(combo_cube.unitless_filled_data[:],
+                        combo_cube_ref.unitless_filled_data[:])
+
+
+def test_feather_simple_cube_dask_kernel_once(cube_data):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = cube_and_raw(sd_fname, use_dask=True)[0]
+    interf_cube = cube_and_raw(interf_fname, use_dask=True)[0]
+
+    combo_cube = feather_simple_cube(interf_cube, sd_cube,
+                                     channels_per_chunk=1)
+
+    feath_data = combo_cube._data
+    assert feath_data.numblocks[0] == interf_cube.shape[0]
+
+    # A single task builds the kernels for all of the blocks
+    kernel_keys = [key for key in dict(feath_data.__dask_graph__())
+                   if str(key).startswith('feather_kernel')]
+    assert len(kernel_keys) == 1
+
+    sd_cube = cube_and_raw(sd_fname, use_dask=False)[0]
+    interf_cube = cube_and_raw(interf_fname, use_dask=False)[0]
+    combo = feather_simple_cube(interf_cube, sd_cube).unitless_filled_data[:]
+
+    npt.assert_allclose(combo_cube.unitless_filled_data[:], combo,
+                        rtol=1e-10, atol=1e-10 * np.abs(combo).max())
+
+
+def test_feather_simple_cube_dask_reproject(cube_data, tmp_path):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    # Put the low-resolution cube on a coarser grid
+    sd_cube = cube_and_raw(sd_fname, use_dask=False)[0]
+
+    header_lo = sd_cube.header.copy()
+    header_lo['CDELT1'] *= 2
+    header_lo['CDELT2'] *= 2
+    # Offset the grid so no pixel falls exactly on the edge of the coverage
+    header_lo['CRPIX1'] = header_lo['CRPIX1'] / 2 + 0.1
+    header_lo['CRPIX2'] = header_lo['CRPIX2'] / 2 + 0.1
+    header_lo['NAXIS1'] = header_lo['NAXIS1'] // 2
+    header_lo['NAXIS2'] = header_lo['NAXIS2'] // 2
+
+    sd_coarse_fname = tmp_path / "sd_coarse.fits"
+    sd_cube.reproject(header_lo).write(sd_coarse_fname)
+
+    sd_cube = cube_and_raw(sd_coarse_fname, use_dask=False)[0]
+    interf_cube = cube_and_raw(interf_fname, use_dask=False)[0]
+    combo = feather_simple_cube(interf_cube, sd_cube).unitless_filled_data[:]
+
+    sd_cube = cube_and_raw(sd_coarse_fname, use_dask=True)[0]
+    interf_cube = cube_and_raw(interf_fname, use_dask=True)[0]
+    combo_cube = feather_simple_cube(interf_cube, sd_cube,
+                                     channels_per_chunk=1)
+
+    assert combo_cube._data.chunksize == (1,) + interf_cube.shape[1:]
+
+    npt.assert_allclose(combo_cube.unitless_filled_data[:], combo,
+                        rtol=1e-10, atol=1e-10 * np.abs(combo).max())
+
+
+@pytest.mark.parametrize('use_dask', (False, True))
+def test_feather_simple_cube_varying_resolution(cube_data, tmp_path, use_dask):
+
+    from radio_beam import Beams
+    from spectral_cube import VaryingResolutionSpectralCube
+
+    from ..feather_plan import group_channels_by_beam
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = cube_and_raw(sd_fname, use_dask=False)[0]
+
+    # The first and last channels share a beam
+    beams = Beams(major=[25, 26, 25] * u.arcsec, minor=[25, 26, 25] * u.arcsec,
+                  pa=[0, 0, 0] * u.deg)
+
+    group_beams, group_ids = group_channels_by_beam(beams)
+    assert len(group_beams) == 2
+    npt.assert_array_equal(group_ids, [0, 1, 0])
+
+    group_beams, group_ids = group_channels_by_beam(beams, tolerance=0.05)
+    assert len(group_beams) == 1
+
+    sd_vrsc = VaryingResolutionSpectralCube(data=sd_cube.unitless_filled_data[:],
+                                            wcs=sd_cube.wcs, beams=beams,
+                                            meta={'BUNIT': 'K'})
+    sd_vrsc_fname = tmp_path / "sd_vrsc.fits"
+    sd_vrsc.write(sd_vrsc_fname)
+
+    sd_vrsc = cube_and_raw(sd_vrsc_fname, use_dask=use_dask)[0]
+    interf_cube = cube_and_raw(interf_fname, use_dask=use_dask)[0].to(u.Jy / u.beam)
+
+    combo_cube = feather_simple_cube(interf_cube, sd_vrsc, use_memmap=False)
+
+    assert combo_cube.unit == interf_cube.unit
+
+    combo = combo_cube.unitless_filled_data[:]
+
+    # Feather each channel with its own beam
+    sd_vrsc = cube_and_raw(sd_vrsc_fname, use_dask=False)[0]
+    interf_cube = cube_and_raw(interf_fname, use_dask=False)[0].to(u.Jy / u.beam)
+    sd_vrsc_conv = sd_vrsc.to(interf_cube.unit)
+
+    for ii in range(interf_cube.shape[0]):
+        sd_chan = sd_vrsc_conv[ii] * (interf_cube.beam.sr / beams[ii].sr).decompose().value
+        combo_chan = feather_simple(interf_cube[ii], sd_chan, use_rfft=True,
+                                    match_units=False)
+        npt.assert_allclose(combo[ii], combo_chan, rtol=1e-8,
+                            atol=1e-8 * np.abs(combo_chan).max())
+
+
+def test_feather_simple_cube_varying_resolution_processes(cube_data, tmp_path):
+
+    from radio_beam import Beams
+    from spectral_cube import VaryingResolutionSpectralCube
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = cube_and_raw(sd_fname, use_dask=False)[0]
+
+    # Two groups of channels are feathered one after the other
+    beams = Beams(major=[25, 25, 30] * u.arcsec, minor=[25, 25, 30] * u.arcsec,
+                  pa=[0, 0, 0] * u.deg)
+
+    sd_vrsc = VaryingResolutionSpectralCube(data=sd_cube.unitless_filled_data[:],
+                                            wcs=sd_cube.wcs, beams=beams,
+                                            meta={'BUNIT': 'K'})
+    sd_vrsc_fname = tmp_path / "sd_vrsc.fits"
+    sd_vrsc.write(sd_vrsc_fname)
+
+    sd_vrsc = cube_and_raw(sd_vrsc_fname, use_dask=False)[0]
+    interf_cube = cube_and_raw(interf_fname, use_dask=False)[0]
+
+    combo_cube = feather_simple_cube(interf_cube, sd_vrsc, use_memmap=False)
+    combo_cube_procs = feather_simple_cube(interf_cube, sd_vrsc,
+                                           use_memmap=False, n_workers=2,
+                                           use_processes=True)
+
+    # Each group must keep the channels feathered by the previous groups
+    npt.assert_array_equal(combo_cube_procs.unitless_filled_data[:],
+                           combo_cube.unitless_filled_data[:])
+
+
+@pytest.mark.parametrize('use_dask', [False, True])
+def test_feather_simple_cube_image_kwargs(cube_data, use_dask):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube, sd_data = cube_and_raw(sd_fname, use_dask=use_dask)
+    interf_cube, interf_data = cube_and_raw(interf_fname, use_dask=use_dask)
+
+    with pytest.raises(TypeError) as exc:
+        feather_simple_cube(interf_cube, sd_cube, return_hdu=True)
+    assert "return_hdu" in exc.value.args[0]
+
+
 def test_feather_simple_cube_dask_mismatchsize(cube_data):
 
     use_dask = True
@@ -387,3 +996,32 @@ def test_feather_simple_cube_dask_mismatchunit(cube_data):
                                             use_memmap=False,
                                             match_units=False)
     assert "Brightness units are not equivalent:" in exc.value.args[0]
+
+
+@pytest.mark.parametrize('xaxisunit', ['arcsec', 'lambda'])
+def test_feather_plot(plaw_test_data, xaxisunit):
+
+    pytest.importorskip('matplotlib')
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    out = feather_plot(highres_hdu, lowres_hdu, xaxisunit=xaxisunit)
+    plt.close('all')
+
+    # The radius is the spatial frequency in cycles per pixel
+    radius = out['radius']
+    assert radius.max() <= 1.
+    assert out['radius_as'].unit == u.arcsec
+    npt.assert_allclose(out['radius_as'].value,
+                        1 / radius * np.abs(highres_hdu.header['CDELT2']) * 3600)
+
+    for key in ('azimuthally_averaged_kernel',
+                'azimuthally_averaged_low_resolution',
+                'azimuthally_averaged_high_res_filtered'):
+        assert out[key].shape == radius.shape
+
+    # The low-resolution kernel peaks at the zero frequency
+    assert out['azimuthally_averaged_kernel'][0] > 0.99
@@ -0,0 +1,328 @@
+import pytest
+
+import astropy.units as u
+import numpy.testing as npt
+import numpy as np
+from spectral_cube import Projection, SpectralCube
+
+from ..uvcombine import feather_simple, feather_simple_cube
+from ..feather_plan import FeatherPlan
+
+
+@pytest.mark.parametrize(('lounit', 'hiunit'),
+                         ((u.K, u.K),
+                          (u.K, u.Jy / u.beam),
+                          (u.Jy / u.beam, u.MJy / u.sr)))
+def test_feather_plan_apply(plaw_test_data, lounit, hiunit):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    lowres_proj = Projection.from_hdu(lowres_hdu).to(lounit)
+    highres_proj = Projection.from_hdu(highres_hdu).to(hiunit)
+
+    # Taper the edges to check the weights are applied to both images
+    weights = np.ones(highres_proj.shape)
+    weights[:10] = 0.5
+
+    combo = feather_simple(highres_proj, lowres_proj, weights=weights,
+                           lowresscalefactor=1.1)
+
+    plan = FeatherPlan(highres_proj.header, lowres_proj.header,
+                       weights=weights, lowresscalefactor=1.1)
+
+    assert not plan.needs_regrid
+    assert plan.kfft.shape == (highres_proj.shape[0],
+                               highres_proj.shape[1] // 2 + 1)
+
+    combo_plan = plan.apply(highres_proj.value, lowres_proj.value)
+
+    npt.assert_allclose(combo_plan, combo.real, rtol=1e-8,
+                        atol=1e-10 * np.abs(combo.real).max())
+
+
+def test_feather_plan_prepare(plaw_test_data):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    weights = np.ones(highres_hdu.data.shape)
+    weights[:10] = 0.5
+
+    plan = FeatherPlan(highres_hdu.header, lowres_hdu.header,
+                       weights=weights, highresscalefactor=0.9,
+                       lowresscalefactor=1.1, match_units=False)
+
+    data_hi = highres_hdu.data.copy()
+    data_hi[0, 0] = np.nan
+
+    im_hi, im_lo, empty = plan.prepare(data_hi, lowres_hdu.data)
+
+    assert not empty
+    assert im_hi[0, 0] == 0.
+    npt.assert_allclose(im_hi[1:], 0.9 * weights[1:] * highres_hdu.data[1:])
+    npt.assert_allclose(im_lo, 1.1 * weights * lowres_hdu.data)
+
+    # A slab of blank planes is flagged as empty
+    blank = np.full((2,) + highres_hdu.data.shape, np.nan)
+    im_hi, im_lo, empty = plan.prepare(blank, blank, channel=slice(0, 2))
+
+    assert im_hi.shape == blank.shape
+    npt.assert_array_equal(empty, True)
+    npt.assert_array_equal(im_lo, 0.)
+
+
+def test_feather_plan_regrid(plaw_test_data):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    # Put the low-resolution image on a coarser grid
+    lowres_proj = Projection.from_hdu(lowres_hdu)
+    highres_proj = Projection.from_hdu(highres_hdu)
+
+    header_lo = lowres_proj.header.copy()
+    header_lo['CDELT1'] *= 2
+    header_lo['CDELT2'] *= 2
+    header_lo['CRPIX1'] = header_lo['CRPIX1'] / 2
+    header_lo['CRPIX2'] = header_lo['CRPIX2'] / 2
+    header_lo['NAXIS1'] = header_lo['NAXIS1'] // 2
+    header_lo['NAXIS2'] = header_lo['NAXIS2'] // 2
+    lowres_proj = lowres_proj.reproject(header_lo)
+
+    combo = feather_simple(highres_proj, lowres_proj)
+
+    plan = FeatherPlan(highres_proj.header, lowres_proj.header)
+
+    assert plan.needs_regrid
+
+    combo_plan = plan.apply(highres_proj.value, lowres_proj.value)
+
+    npt.assert_allclose(combo_plan, combo.real, rtol=1e-8,
+                        atol=1e-10 * np.abs(combo.real).max())
+
+
+def test_feather_plan_missing_beam(plaw_test_data):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    header_lo = lowres_hdu.header.copy()
+    del header_lo['BMAJ']
+
+    with pytest.raises(ValueError) as exc:
+        FeatherPlan(highres_hdu.header, header_lo)
+    assert "The low-resolution beam could not be read" in exc.value.args[0]
+
+    # Providing the FWHM is enough when the units do not require the beam
+    plan = FeatherPlan(highres_hdu.header, header_lo,
+                       lowresfwhm=25 * u.arcsec)
+    assert plan.lowresfwhm == 25 * u.arcsec
+
+
+def test_feather_plan_apply_cube(cube_data):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+    interf_cube = SpectralCube.read(interf_fname).to(u.Jy / u.beam)
+
+    plan = FeatherPlan.from_cubes(interf_cube, sd_cube)
+
+    # K -> Jy/beam depends on the frequency of each channel
+    assert plan.nchan == sd_cube.shape[0]
+
+    combo = plan.apply_cube(interf_cube, sd_cube, progressbar=False)
+
+    assert combo.shape == interf_cube.shape
+
+    sd_cube_conv = sd_cube.to(interf_cube.unit)
+    sd_cube_conv *= (interf_cube.beam.sr / sd_cube.beam.sr).decompose().value
+
+    for ii in range(interf_cube.shape[0]):
+        combo_chan = feather_simple(interf_cube[ii], sd_cube_conv[ii],
+                                    match_units=False)
+        npt.assert_allclose(combo[ii], combo_chan.real, rtol=1e-8,
+                            atol=1e-10 * np.abs(combo_chan.real).max())
+
+
+@pytest.mark.parametrize('use_processes', (False, True))
+def test_feather_plan_skip_empty(cube_data, use_processes):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+    interf_cube = SpectralCube.read(interf_fname)
+
+    plan = FeatherPlan.from_cubes(interf_cube, sd_cube)
+
+    combo = plan.apply_cube(interf_cube, sd_cube, progressbar=False)
+    assert plan.nskipped == 0
+
+    # Blank the first channel in both cubes and zero the second
+    data_hi = interf_cube.unitless_filled_data[:].copy()
+    data_lo = sd_cube.unitless_filled_data[:].copy()
+    data_hi[0] = data_lo[0] = np.nan
+    data_hi[1] = data_lo[1] = 0.
+
+    combo_skip = plan.apply_cube(data_hi, data_lo, progressbar=False,
+                                 n_workers=2, use_processes=use_processes)
+
+    assert plan.nskipped == 2
+    assert np.isnan(combo_skip[0]).all()
+    npt.assert_array_equal(combo_skip[1], 0.)
+    npt.assert_array_equal(combo_skip[2], combo[2])
+
+
+def test_feather_plan_slabs(cube_data):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+    interf_cube = SpectralCube.read(interf_fname).to(u.Jy / u.beam)
+
+    plan = FeatherPlan.from_cubes(interf_cube, sd_cube)
+
+    channel_bytes = plan.bytes_per_channel
+    assert plan.slab_size(1) == 1
+    assert plan.slab_size(100 * channel_bytes) == 100
+    assert plan.slab_size(100 * channel_bytes * u.byte) == 100
+    assert plan.slab_size('1 GB') == plan.slab_size(1e9)
+
+    with pytest.raises(ValueError):
+        plan.slab_size(-1)
+
+    # Feathering one channel at a time or all at once gives the same result
+    combo_single = plan.apply_cube(interf_cube, sd_cube, progressbar=False,
+                                   memory_limit=channel_bytes)
+
+    with pytest.raises(ValueError) as exc:
+        plan.apply_cube(interf_cube, sd_cube, progressbar=False,
+                        memory_limit=channel_bytes // 2)
+    assert "too small to feather a single channel" in exc.value.args[0]
+    # Slabs of 2 channels, with a shorter final slab
+    memory_limit = 2 * channel_bytes
+    assert plan.slab_size(memory_limit) == 2
+    finished = []
+    combo_slab = plan.apply_cube(interf_cube, sd_cube, progressbar=False,
+                                 memory_limit=memory_limit,
+                                 callback=finished.append)
+    assert finished == [slice(0, 2), slice(2, 3)]
+
+    npt.assert_allclose(combo_slab, combo_single, rtol=1e-10,
+                        atol=1e-12 * np.abs(combo_single).max())
+
+    # Threads write to separate slabs, so the result is identical
+    combo_threads = plan.apply_cube(interf_cube, sd_cube, progressbar=False,
+                                    memory_limit=memory_limit, n_workers=2)
+    npt.assert_array_equal(combo_threads, combo_slab)
+
+
+def test_feather_plan_apply_cube_progressbar(cube_data, monkeypatch):
+
+    from .. import feather_plan
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+    interf_cube = SpectralCube.read(interf_fname)
+
+    plan = FeatherPlan.from_cubes(interf_cube, sd_cube)
+
+    bars = []
+
+    class RecordingBar(object):
+        def __init__(self, total):
+            self.n = 0
+            self.closed = False
+            bars.append(self)
+
+        def update(self, n=1):
+            self.n += n
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(feather_plan, 'tqdm', RecordingBar)
+
+    plan.apply_cube(interf_cube, sd_cube)
+    assert bars[-1].closed
+    assert bars[-1].n == interf_cube.shape[0]
+
+    # The bar is also closed when feathering fails
+    def failing_apply(*args, **kwargs):
+        raise RuntimeError("feathering failed")
+
+    monkeypatch.setattr(plan, '_apply', failing_apply)
+
+    with pytest.raises(RuntimeError):
+        plan.apply_cube(interf_cube, sd_cube)
+    assert bars[-1].closed
+
+
+def test_feather_plan_apply_cube_default_limit(cube_data, monkeypatch):
+
+    from .. import chunk_planner
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+    interf_cube = SpectralCube.read(interf_fname).to(u.Jy / u.beam)
+
+    plan = FeatherPlan.from_cubes(interf_cube, sd_cube)
+
+    combo = plan.apply_cube(interf_cube, sd_cube, progressbar=False)
+
+    # Without a memory_limit, channels larger than the default budget are
+    # feathered one at a time rather than raising
+    monkeypatch.setattr(chunk_planner, 'DEFAULT_MEMORY_LIMIT',
+                        plan.bytes_per_channel // 2)
+
+    finished = []
+    combo_small = plan.apply_cube(interf_cube, sd_cube, progressbar=False,
+                                  callback=finished.append)
+    assert finished == [slice(0, 1), slice(1, 2), slice(2, 3)]
+
+    npt.assert_allclose(combo_small, combo, rtol=1e-10,
+                        atol=1e-12 * np.abs(combo).max())
+
+
+@pytest.mark.parametrize('use_processes', (False, True))
+def test_feather_plan_apply_cube_channels(cube_data, use_processes):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+    interf_cube = SpectralCube.read(interf_fname)
+
+    plan = FeatherPlan.from_cubes(interf_cube, sd_cube)
+
+    combo = plan.apply_cube(interf_cube, sd_cube, progressbar=False)
+
+    # The channels that are not feathered keep their values
+    out = np.full(interf_cube.shape, 7.)
+    finished = []
+    plan.apply_cube(interf_cube, sd_cube, out=out, progressbar=False,
+                    channels=[0, 2], memory_limit=plan.bytes_per_channel * 2,
+                    n_workers=2, use_processes=use_processes,
+                    callback=finished.append)
+
+    assert sorted(finished, key=lambda chans: chans.start) == [slice(0, 1), slice(2, 3)]
+    npt.assert_array_equal(out[1], 7.)
+    npt.assert_array_equal(out[[0, 2]], combo[[0, 2]])
+
+
+@pytest.mark.parametrize('use_memmap', (False, True))
+def test_feather_simple_cube_processes(cube_data, use_memmap):
+
+    orig_fname, sd_fname, interf_fname = cube_data
+
+    sd_cube = SpectralCube.read(sd_fname)
+    interf_cube = SpectralCube.read(interf_fname)
+
+    feathcube = feather_simple_cube(interf_cube, sd_cube,
+                                    use_memmap=use_memmap)
+
+    feathcube_procs = feather_simple_cube(interf_cube, sd_cube,
+                                          use_memmap=use_memmap,
+                                          n_workers=2,
+                                          use_processes=True)
+
+    npt.assert_array_equal(feathcube_procs.unitless_filled_data[:],
+                           feathcube.unitless_filled_data[:])
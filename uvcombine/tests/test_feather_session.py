@@ -0,0 +1,69 @@
+import pytest
+
+import astropy.units as u
+import numpy.testing as npt
+import numpy as np
+from spectral_cube import Projection
+
+from ..uvcombine import feather_simple
+from ..feather_session import FeatherSession
+
+
+@pytest.mark.parametrize('use_rfft', [False, True])
+@pytest.mark.parametrize('params',
+                         [dict(),
+                          dict(lowresscalefactor=1.2, highresscalefactor=0.9),
+                          dict(lowpassfilterSD=True),
+                          dict(deconvSD=True),
+                          dict(replace_hires=0.5, lowresscalefactor=1.1)])
+def test_feather_session(plaw_test_data, use_rfft, params):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    lowres_proj = Projection.from_hdu(lowres_hdu)
+    highres_proj = Projection.from_hdu(highres_hdu)
+
+    # Taper the edges to check the weights are applied to both images
+    weights = np.ones(highres_proj.shape)
+    weights[:10] = 0.5
+
+    session = FeatherSession(highres_proj, lowres_proj, weights=weights,
+                             use_rfft=use_rfft)
+
+    combo = feather_simple(highres_proj, lowres_proj, weights=weights,
+                           use_rfft=use_rfft, **params)
+
+    combo_session = session.feather(**params)
+
+    assert combo_session.dtype == combo.dtype
+
+    npt.assert_allclose(combo_session, combo, rtol=1e-8,
+                        atol=1e-10 * np.abs(combo).max())
+
+
+def test_feather_session_reuse(plaw_test_data):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    pbresponse = np.full(highres_hdu.data.shape, 0.8)
+
+    session = FeatherSession(highres_hdu, lowres_hdu, pbresponse=pbresponse,
+                             use_rfft=True)
+
+    combo = session.feather(lowresscalefactor=1.3)
+
+    # Other parameters do not change the stored spectra
+    session.feather(deconvSD=True, lowresfwhm=30 * u.arcsec)
+    npt.assert_array_equal(session.feather(lowresscalefactor=1.3), combo)
+
+    combo_fwhm = feather_simple(highres_hdu, lowres_hdu, pbresponse=pbresponse,
+                                lowresfwhm=30 * u.arcsec, use_rfft=True)
+    npt.assert_allclose(session.feather(lowresfwhm=30 * u.arcsec), combo_fwhm,
+                        rtol=1e-8, atol=1e-10 * np.abs(combo_fwhm).max())
+
+    hdu = session.feather(lowresscalefactor=1.3, return_hdu=True)
+    npt.assert_array_equal(hdu.data, combo)
+    assert hdu.header['NAXIS1'] == highres_hdu.header['NAXIS1']
+
+    with pytest.raises(ValueError, match='replace_hires'):
+        session.feather(replace_hires=True)
@@ -0,0 +1,109 @@
+import pytest
+
+import numpy.testing as npt
+import numpy as np
+
+from ..uvcombine import feather_simple
+from .. import fft_backend
+from ..fft_backend import (available_fft_backends, get_fft_backend,
+                           set_fft_backend, use_fft_backend)
+
+
+@pytest.mark.parametrize('backend', available_fft_backends())
+def test_fft_backend_transforms(backend):
+
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(3, 31, 40))
+
+    for workers in (None, 2):
+        npt.assert_allclose(fft_backend.fft2(data, backend=backend,
+                                             workers=workers),
+                            np.fft.fft2(data), atol=1e-10)
+        npt.assert_allclose(fft_backend.ifft2(data, backend=backend,
+                                              workers=workers),
+                            np.fft.ifft2(data), atol=1e-10)
+        npt.assert_allclose(fft_backend.rfft2(data, backend=backend,
+                                              workers=workers),
+                            np.fft.rfft2(data), atol=1e-10)
+
+        spec = np.fft.rfft2(data)
+        npt.assert_allclose(fft_backend.irfft2(spec, s=data.shape[-2:],
+                                               backend=backend,
+                                               workers=workers),
+                            data, atol=1e-10)
+
+
+def test_fft_backend_config(plaw_test_data):
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    assert get_fft_backend() == ('numpy', None)
+
+    with pytest.raises(ValueError) as exc:
+        set_fft_backend('not_a_backend')
+    assert "Unknown FFT backend" in exc.value.args[0]
+
+    combo = feather_simple(highres_hdu, lowres_hdu)
+
+    with use_fft_backend('scipy', workers=2):
+        assert get_fft_backend() == ('scipy', 2)
+        combo_scipy = feather_simple(highres_hdu, lowres_hdu)
+
+    assert get_fft_backend() == ('numpy', None)
+
+    npt.assert_allclose(combo_scipy, combo,
+                        atol=1e-10 * np.abs(combo).max())
+
+
+def test_fft_backend_argument(plaw_test_data):
+
+    from ..feather_plan import FeatherPlan
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    combo = feather_simple(highres_hdu, lowres_hdu)
+
+    # The backend of a call does not change the global backend
+    combo_scipy = feather_simple(highres_hdu, lowres_hdu,
+                                 fft_backend='scipy', fft_workers=2)
+    assert get_fft_backend() == ('numpy', None)
+
+    npt.assert_allclose(combo_scipy, combo,
+                        atol=1e-10 * np.abs(combo).max())
+
+    # The given backend is used rather than the global one
+    with pytest.raises(ValueError) as exc:
+        feather_simple(highres_hdu, lowres_hdu, fft_backend='not_a_backend')
+    assert "Unknown FFT backend" in exc.value.args[0]
+
+    plan = FeatherPlan(highres_hdu.header, lowres_hdu.header,
+                       fft_backend='not_a_backend')
+    with pytest.raises(ValueError) as exc:
+        plan.apply(highres_hdu.data, lowres_hdu.data)
+    assert "Unknown FFT backend" in exc.value.args[0]
+
+
+def test_fftw_wisdom_file(tmp_path, monkeypatch):
+
+    import sys
+    import types
+
+    # The wisdom is read and written as data, without pyfftw installed
+    wisdom = (b'(fftw-3.3.10 fftw_wisdom\n)\n', b'', b'\x00\xff')
+    imported = []
+
+    pyfftw = types.ModuleType('pyfftw')
+    pyfftw.export_wisdom = lambda: wisdom
+    pyfftw.import_wisdom = imported.append
+    monkeypatch.setitem(sys.modules, 'pyfftw', pyfftw)
+
+    filename = tmp_path / 'wisdom.json'
+    fft_backend.save_fftw_wisdom(filename)
+    fft_backend.load_fftw_wisdom(filename)
+
+    assert imported == [wisdom]
+
+    # Other files are rejected rather than executed
+    filename.write_text('[1, 2]')
+    with pytest.raises(ValueError):
+        fft_backend.load_fftw_wisdom(filename)
@@ -0,0 +1,60 @@
+import pytest
+
+import astropy.units as u
+import numpy.testing as npt
+import numpy as np
+from astropy import wcs
+from reproject import reproject_interp
+
+from ..reproject_map import ReprojectionMap
+from ..utils import generate_header
+
+
+def _headers():
+
+    header_in = generate_header(3 * u.arcsec, 25 * u.arcsec, 64, 100 * u.GHz)
+    header_in['NAXIS'] = 2
+    header_in['NAXIS1'] = 64
+    header_in['NAXIS2'] = 50
+
+    # Finer, shifted and rotated output grid that only partly overlaps
+    header_out = header_in.copy()
+    header_out['CDELT1'] *= 0.7
+    header_out['CDELT2'] *= 0.7
+    header_out['CRPIX1'] = 40
+    header_out['CRPIX2'] = 35.3
+    header_out['CROTA2'] = 10
+    header_out['NAXIS1'] = 90
+    header_out['NAXIS2'] = 80
+
+    return header_in, header_out
+
+
+@pytest.mark.parametrize('add_nan', (False, True))
+def test_reprojection_map(add_nan):
+
+    header_in, header_out = _headers()
+
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(50, 64))
+    if add_nan:
+        data[10, 10] = np.nan
+
+    ref = reproject_interp((data, wcs.WCS(header_in)), wcs.WCS(header_out),
+                           shape_out=(80, 90), return_footprint=False)
+
+    repmap = ReprojectionMap.from_headers(header_in, header_out)
+
+    result = repmap(data)
+
+    npt.assert_array_equal(np.isnan(result), np.isnan(ref))
+    npt.assert_allclose(result, ref, atol=1e-12)
+
+    # Stacks of planes are reprojected together
+    stack = repmap(np.stack([data, 2 * data]))
+    assert stack.shape == (2, 80, 90)
+    npt.assert_allclose(stack[1], 2 * result, atol=1e-12)
+
+    with pytest.raises(ValueError) as exc:
+        repmap(data[:-1])
+    assert "does not match the input shape" in exc.value.args[0]
@@ -4,8 +4,10 @@ import astropy.units as u
 from astropy.io import fits
 import numpy.testing as npt
 import numpy as np
+from scipy import stats
 
 from ..scale_factor import find_effSDbeam, find_scale_factor
+from ..uvcombine import feather_compare
 
 try:
     import statsmodels
@@ -82,3 +84,36 @@ def test_SDeff_beam(plaw_test_data):
     # large lowresfwhms
     # assert lowresfwhms[np.argmin(np.abs(slopes))].value == lowresfwhm.value
 
+
+
+@pytest.mark.parametrize('beam_divide_lores', [True, False])
+def test_SDeff_beam_matches_feather_compare(plaw_test_data, beam_divide_lores):
+
+    largest_scale = 56 * u.arcsec
+
+    orig_hdu, lowres_hdu, highres_hdu = plaw_test_data
+
+    lowresfwhms = np.array([20, 25, 30]) * u.arcsec
+
+    slopes, slopes_CI = \
+        find_effSDbeam(highres_hdu, lowres_hdu, largest_scale,
+                       lowresfwhms,
+                       beam_divide_lores=beam_divide_lores,
+                       alpha=0.99)
+
+    # The sweep over the cached spectra should give the same slopes as
+    # comparing each FWHM separately
+    for i, lowresfwhm in enumerate(lowresfwhms):
+        radii, ratios = feather_compare(highres_hdu, lowres_hdu,
+                                        SAS=lowresfwhm,
+                                        LAS=largest_scale,
+                                        lowresfwhm=lowresfwhm,
+                                        beam_divide_lores=beam_divide_lores,
+                                        return_samples=True,
+                                        doplot=False)[:2]
+
+        fitted = stats.theilslopes(ratios, radii.to(u.karcsec).value**2,
+                                   alpha=0.99)
+
+        npt.assert_allclose(slopes[i], fitted[0], rtol=1e-8)
+        npt.assert_allclose(slopes_CI[:, i], fitted[2:4], rtol=1e-8)
@@ -7,6 +7,8 @@ from astropy import units as u
 from spectral_cube import SpectralCube
 from radio_beam import Beam
 
+from .fft_backend import fft2, ifft2, irfft2
+
 
 from . import feather_compare
 
@@ -114,7 +116,7 @@ def make_extended(imsize, powerlaw=2.0,
 
         return np.fft.fftshift(full_powermap)
 
-    newmap = np.fft.irfft2(output)
+    newmap = irfft2(output)
 
     if make_positive:
         newmap -= 1.1 * newmap.min()
@@ -142,7 +144,7 @@ def make_extended(imsize, powerlaw=2.0,
 #                 np.random.randn(imsize2, imsize) * rr**(-powerlaw) * 1j)
 #     powermap[powermap!=powermap] = 0
 
-#     newmap = np.abs(np.fft.fftshift(np.fft.fft2(powermap)))
+#     newmap = np.abs(np.fft.fftshift(fft2(powermap)))
 
 #     return newmap
 
@@ -193,9 +195,9 @@ def interferometrically_observe_image(image, pixel_scale,
 
     # create the interferometric map by removing both large and small angular
     # scales in fourier space
-    imfft = np.fft.fft2(image)
+    imfft = fft2(image)
     imfft_interferometered = imfft * np.fft.fftshift(ring)
-    im_interferometered = np.fft.ifft2(imfft_interferometered)
+    im_interferometered = ifft2(imfft_interferometered)
 
     return im_interferometered, ring
 
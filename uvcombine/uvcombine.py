@@ -14,6 +14,12 @@ from astropy import stats
 from astropy.convolution import convolve_fft, Gaussian2DKernel
 from astropy.utils import deprecated
 from spectral_cube.dask_spectral_cube import DaskSpectralCube, DaskVaryingResolutionSpectralCube
+from spectral_cube.masks import BooleanArrayMask
+
+from .fft_backend import fft2, ifft2, rfft2, irfft2
+from .cache import kernel_cache
+from .reproject_map import ReprojectionMap
+from .annulus import AnnulusIndex
 
 
 @deprecated("2022")
@@ -237,7 +243,8 @@ def regrid(hd1, im1, im2raw, hd2):
     return rhdu, im2, nax1, nax2, pixscale
 
 
-def feather_kernel(nax2, nax1, lowresfwhm, pixscale):
+def feather_kernel(nax2, nax1, lowresfwhm, pixscale, use_rfft=False,
+                   dtype=float, use_cache=True):
     """
     Construct the weight kernels (image arrays) for the fourier transformed low
     resolution and high resolution images.  The kernels are the fourier transforms
@@ -251,6 +258,19 @@ def feather_kernel(nax2, nax1, lowresfwhm, pixscale):
        Angular resolution of the low resolution image (FWHM)
     pixscale : quantity (arcsec equivalent)
        pixel size in the input high resolution image.
+    use_rfft : bool, optional
+       Return the half-plane kernels matching the output of
+       `~numpy.fft.rfft2`, with shape ``(nax2, nax1 // 2 + 1)``. See
+       ``use_rfft`` in `fftmerge`.
+    dtype : `~numpy.dtype`, optional
+       Data type of the kernels. Use ``np.float32`` for single-precision
+       feathering (see ``dtype`` in `fftmerge`).
+    use_cache : bool, optional
+       Reuse kernels from previous calls with the same shape, beam, pixel
+       scale, ``use_rfft`` and ``dtype``. Only ``kfft`` is cached, and
+       ``ikfft`` is computed from it on each call. The returned kernels are
+       read-only; use ``use_cache=False`` to get new, writeable arrays. See
+       `uvcombine.cache.kernel_cache`.
 
     Return
     ----------
@@ -259,12 +279,15 @@ def feather_kernel(nax2, nax1, lowresfwhm, pixscale):
     ikfft : float array
        An image array containing the weighting for the high resolution image
        (simply 1-kfft)
-    """
-    # Construct arrays which hold the x and y coordinates (in unit of pixels)
-    # of the image
-    ygrid,xgrid = (np.indices([nax2,nax1]) -
-                   np.array([(nax2-1.)/2,(nax1-1.)/2.])[:,None,None])
 
+    Notes
+    -----
+    The kernel is evaluated analytically: the fourier transform of a
+    Gaussian with width ``sigma`` (in pixels) is a Gaussian with width
+    ``1 / (2 pi sigma)`` in frequency space. The kernel is separable, so it is
+    formed from the outer product of the 1D kernels along each axis on the
+    `~numpy.fft.fftfreq` grid, avoiding a 2D FFT of an image-space Gaussian.
+    """
     # constant converting "resolution" in fwhm to sigma
     fwhm = np.sqrt(8*np.log(2))
 
@@ -275,30 +298,47 @@ def feather_kernel(nax2, nax1, lowresfwhm, pixscale):
     sigma = ((lowresfwhm/fwhm/(pixscale)).decompose().value)
     # log.info(f"sigma: {sigma}, lowresfwhm: {lowresfwhm}, pixscale: {pixscale}")
 
-    # not used, just noted that these are the theoretical values (...maybe...)
-    #sigma_fftspace = (1/(4*np.pi**2*sigma**2))**0.5
-    #sigma_fftspace = (2*np.pi*sigma)**-1
-    #log.debug('sigma = {0}, sigma_fftspace={1}'.format(sigma, sigma_fftspace))
+    if np.isnan(sigma):
+        raise ValueError("NaN value encountered in kernel")
 
-    # technically, the fftshift here does nothing since we're using the
-    # absolute value of the kernel below, so the phase is irrelevant
-    kernel = np.fft.fftshift(np.exp(-(xgrid**2+ygrid**2)/(2*sigma**2)))
-    # convert the kernel, which is just a gaussian in image space,
-    # to its corresponding kernel in fourier space
-    kfft = np.abs(np.fft.fft2(kernel)) # should be mostly real
+    dtype = np.dtype(dtype)
 
-    if np.any(np.isnan(kfft)):
-        raise ValueError("NaN value encountered in kernel")
+    if use_cache:
+        # The kernel only depends on the beam width in pixels
+        key = ('feather_kernel', nax2, nax1, float(sigma), bool(use_rfft),
+               dtype.str)
+        kfft, = kernel_cache.get(key,
+                                 lambda: (_feather_kernel(nax2, nax1, sigma,
+                                                          use_rfft, dtype),))
+        # ikfft is derived rather than cached, halving the cached bytes
+        ikfft = 1 - kfft
+        ikfft.setflags(write=False)
+
+        return kfft, ikfft
+
+    kfft = _feather_kernel(nax2, nax1, sigma, use_rfft, dtype)
 
-    # normalize the kernel
-    kfft/=kfft.max()
-    ikfft = 1-kfft
+    return kfft, 1 - kfft
 
-    return kfft, ikfft
+
+def _feather_kernel(nax2, nax1, sigma, use_rfft, dtype):
+
+    # Frequencies in cycles per pixel, in the same (unshifted) order as the
+    # output of np.fft.fft2
+    # The kernel is normalized to a peak of 1 at the zero frequency.
+    kfft_y = np.exp(-2 * (np.pi * sigma * np.fft.fftfreq(nax2))**2)
+    if use_rfft:
+        freq_x = np.fft.rfftfreq(nax1)
+    else:
+        freq_x = np.fft.fftfreq(nax1)
+    kfft_x = np.exp(-2 * (np.pi * sigma * freq_x)**2)
+
+    return np.outer(kfft_y, kfft_x).astype(dtype, copy=False)
 
 
 def fftmerge(kfft, ikfft, im_hi, im_lo,  lowpassfilterSD=False,
-             replace_hires=False, deconvSD=False, min_beam_fraction=0.1):
+             replace_hires=False, deconvSD=False, min_beam_fraction=0.1,
+             use_rfft=False, dtype=None, fft_backend=None, fft_workers=None):
     """
     Combine images in the fourier domain, and then output the combined image
     both in fourier domain and the image domain.
@@ -326,6 +366,26 @@ def fftmerge(kfft, ikfft, im_hi, im_lo,  lowpassfilterSD=False,
     min_beam_fraction : float
         The minimum fraction of the beam to include; values below this fraction
         will be discarded when deconvolving
+    use_rfft : bool
+        Use the real-input transforms `~numpy.fft.rfft2` and
+        `~numpy.fft.irfft2`. The kernels must be the half-plane kernels from
+        `feather_kernel` with ``use_rfft=True``. ``combo`` is then returned as
+        a real array, and ``fftsum`` only contains the non-negative
+        frequencies along the last axis. This roughly halves the time and
+        memory used by the FFTs.
+    dtype : `~numpy.dtype`, optional
+        Real data type the images and kernels are converted to before the
+        transforms. With ``np.float32``, the transforms are computed in single
+        precision (complex64) and ``combo`` is float32 (complex64 without
+        ``use_rfft``), halving the memory used. The result then agrees with
+        the double-precision one to about ``1e-6`` of the peak of the image.
+        By default, the inputs are not converted.
+    fft_backend : str, optional
+        FFT backend used for these transforms (see
+        `~uvcombine.fft_backend`). Defaults to the backend set with
+        `~uvcombine.fft_backend.set_fft_backend`.
+    fft_workers : int, optional
+        Number of threads used by each transform with ``fft_backend``.
 
     Returns
     -------
@@ -333,20 +393,171 @@ def fftmerge(kfft, ikfft, im_hi, im_lo,  lowpassfilterSD=False,
        Combined image in fourier domain.
     combo  : float array
        Combined image in image domain.
+
+    Notes
+    -----
+    Without ``fft_backend``, the transforms use the backend set with
+    `~uvcombine.fft_backend.set_fft_backend`. Passing ``fft_backend``
+    does not change that global setting, so it is safe when several
+    feathering runs use different backends at the same time.
     """
 
-    fft_hi = np.fft.fft2(np.nan_to_num(im_hi))
-    fft_lo = np.fft.fft2(np.nan_to_num(im_lo))
+    if dtype is not None:
+        im_hi = np.asarray(im_hi, dtype=dtype)
+        im_lo = np.asarray(im_lo, dtype=dtype)
+        kfft = np.asarray(kfft, dtype=dtype)
+        ikfft = np.asarray(ikfft, dtype=dtype)
+
+    return _fftmerge_filled(kfft, ikfft,
+                            np.nan_to_num(im_hi), np.nan_to_num(im_lo),
+                            lowpassfilterSD=lowpassfilterSD,
+                            replace_hires=replace_hires,
+                            deconvSD=deconvSD,
+                            min_beam_fraction=min_beam_fraction,
+                            use_rfft=use_rfft,
+                            fft_backend=fft_backend,
+                            fft_workers=fft_workers)
+
+
+def _fftmerge_filled(kfft, ikfft, im_hi, im_lo, lowpassfilterSD=False,
+                     replace_hires=False, deconvSD=False,
+                     min_beam_fraction=0.1, use_rfft=False,
+                     fft_backend=None, fft_workers=None):
+    '''
+    `fftmerge` for images without NaNs. The spectra are combined in place,
+    so only the two forward transforms and the inverse are allocated.
+    '''
+
+    fft_kwargs = dict(backend=fft_backend, workers=fft_workers)
+
+    if use_rfft:
+        fft_hi = rfft2(im_hi, **fft_kwargs)
+        fft_lo = rfft2(im_lo, **fft_kwargs)
+    else:
+        fft_hi = fft2(im_hi, **fft_kwargs)
+        fft_lo = fft2(im_lo, **fft_kwargs)
+
+    _check_kernel_shape(kfft, fft_hi)
 
     # Combine and inverse fourier transform the images
-    if lowpassfilterSD:
-        lo_conv = kfft*fft_lo
-    elif deconvSD:
-        lo_conv = fft_lo / kfft
-        lo_conv[kfft < min_beam_fraction] = 0
+    fftsum = _combine_spectra(kfft, ikfft, fft_hi, fft_lo,
+                              lowpassfilterSD=lowpassfilterSD,
+                              replace_hires=replace_hires,
+                              deconvSD=deconvSD,
+                              min_beam_fraction=min_beam_fraction)
+
+    if use_rfft:
+        combo = irfft2(fftsum, s=np.shape(im_hi)[-2:], **fft_kwargs)
+    else:
+        combo = ifft2(fftsum, **fft_kwargs)
+
+    return fftsum, combo
+
+
+def _check_kernel_shape(kfft, fft_hi):
+    # The images can be a stack of planes, which all share the same kernel
+    if kfft.shape != fft_hi.shape[-2:]:
+        raise ValueError("The kernel shape {0} does not match the shape of the"
+                         " fourier transformed images {1}. Check that"
+                         " `use_rfft` is the same in `feather_kernel` and"
+                         " `fftmerge`.".format(kfft.shape, fft_hi.shape[-2:]))
+
+
+def fftmerge_variants(kfft, ikfft, im_hi, im_lo, variants,
+                      min_beam_fraction=0.1, use_rfft=False, dtype=None):
+    """
+    Combine images in the fourier domain with `fftmerge` for several
+    combinations of ``lowpassfilterSD``, ``replace_hires`` and ``deconvSD``.
+
+    The forward transforms are computed once and shared by all of the
+    variants, and the combined spectra are inverse transformed together in a
+    single multi-plane FFT.
+
+    Parameters
+    ----------
+    kfft, ikfft : float array
+       Weighting images (see `feather_kernel`).
+    im_hi, im_lo : float array
+       Input images.
+    variants : list of dict
+        The options of each variant. Each dictionary can set
+        ``lowpassfilterSD``, ``replace_hires`` and ``deconvSD``, as in
+        `fftmerge`; options that are not given take the `fftmerge` defaults.
+    min_beam_fraction : float
+        See `fftmerge`.
+    use_rfft : bool
+        See `fftmerge`.
+    dtype : `~numpy.dtype`, optional
+        See `fftmerge`.
+
+    Returns
+    -------
+    fftsums : array
+       Combined images in fourier domain, stacked along the first axis in
+       the order of ``variants``.
+    combos : array
+       Combined images in image domain, stacked in the same way.
+    """
+
+    merge_options = ('lowpassfilterSD', 'replace_hires', 'deconvSD')
+    for variant in variants:
+        unknown = set(variant) - set(merge_options)
+        if unknown:
+            raise ValueError("Unknown fftmerge options {0}. Variants can set"
+                             " {1}.".format(sorted(unknown), merge_options))
+
+    if dtype is not None:
+        im_hi = np.asarray(im_hi, dtype=dtype)
+        im_lo = np.asarray(im_lo, dtype=dtype)
+        kfft = np.asarray(kfft, dtype=dtype)
+        ikfft = np.asarray(ikfft, dtype=dtype)
+
+    if use_rfft:
+        fft_hi = rfft2(np.nan_to_num(im_hi))
+        fft_lo = rfft2(np.nan_to_num(im_lo))
+    else:
+        fft_hi = fft2(np.nan_to_num(im_hi))
+        fft_lo = fft2(np.nan_to_num(im_lo))
+
+    _check_kernel_shape(kfft, fft_hi)
+
+    fftsums = np.empty((len(variants),) + fft_hi.shape, dtype=fft_hi.dtype)
+    work_lo = np.empty_like(fft_lo)
+
+    # Each variant is combined in place in a copy of the spectra
+    for fftsum, variant in zip(fftsums, variants):
+        np.copyto(fftsum, fft_hi)
+        np.copyto(work_lo, fft_lo)
+
+        combined = _combine_spectra(kfft, ikfft, fftsum, work_lo,
+                                    min_beam_fraction=min_beam_fraction,
+                                    **variant)
+        if combined is not fftsum:
+            np.copyto(fftsum, combined)
+
+    if use_rfft:
+        combos = irfft2(fftsums, s=np.shape(im_hi)[-2:])
     else:
-        lo_conv = fft_lo
+        combos = ifft2(fftsums)
 
+    return fftsums, combos
+
+
+def _combine_spectra(kfft, ikfft, fft_hi, fft_lo, lowpassfilterSD=False,
+                     replace_hires=False, deconvSD=False,
+                     min_beam_fraction=0.1):
+    '''
+    Weight and sum the forward transforms of the high- and low-resolution
+    images, as in `fftmerge`. Both spectra are overwritten; the combined
+    spectrum is returned in one of them.
+    '''
+
+    lo_conv = fft_lo
+    if lowpassfilterSD:
+        lo_conv *= kfft
+    elif deconvSD:
+        lo_conv /= kfft
+        lo_conv[..., kfft < min_beam_fraction] = 0
 
     if replace_hires:
         if replace_hires is True:
@@ -355,18 +566,137 @@ def fftmerge(kfft, ikfft, im_hi, im_lo,  lowpassfilterSD=False,
                              "corresponding to the beam-fraction of the "
                              "single-dish image below which the "
                              "high-resolution data will be used.")
-        fftsum = lo_conv.copy()
+        fftsum = lo_conv
 
         # mask where the hires data is above a threshold
         mask = ikfft > replace_hires
 
-        fftsum[mask] = fft_hi[mask]
+        fftsum[..., mask] = fft_hi[..., mask]
     else:
-        fftsum = lo_conv + ikfft*fft_hi
+        fftsum = fft_hi
+        fftsum *= ikfft
+        fftsum += lo_conv
 
-    combo = np.fft.ifft2(fftsum)
+    return fftsum
 
-    return fftsum, combo
+
+def _prepare_planes(image, out, *scales):
+    '''
+    Write ``image`` times each of ``scales`` into ``out``, with NaNs replaced
+    by zero, as in the input preparation of `fftmerge`.
+
+    The scaling, weighting and NaN replacement are done in place in ``out``,
+    so no image-sized temporaries are created.
+
+    Returns
+    -------
+    out : `~numpy.ndarray`
+        The prepared planes.
+    empty : `~numpy.ndarray`
+        Whether each plane of ``image`` (along the last two axes) was
+        entirely NaN.
+    '''
+
+    if scales:
+        np.multiply(image, scales[0], out=out)
+    else:
+        np.copyto(out, image)
+
+    for scale in scales[1:]:
+        if np.isscalar(scale) and scale == 1:
+            continue
+        out *= scale
+
+    nan_mask = np.isnan(out)
+    empty = nan_mask.all(axis=(-2, -1))
+    np.copyto(out, 0, where=nan_mask)
+    del nan_mask
+
+    # As np.nan_to_num, replace infinities by the largest finite values
+    np.nan_to_num(out, copy=False)
+
+    return out, empty
+
+
+def _fftmerge_planes(kfft, ikfft, im_hi, im_lo, empty=None,
+                     lowpassfilterSD=False, replace_hires=False,
+                     deconvSD=False, min_beam_fraction=0.1, use_rfft=False,
+                     fft_backend=None, fft_workers=None):
+    '''
+    Feather a stack of planes without NaNs (see `_prepare_planes`) with
+    `fftmerge`, skipping the FFTs of planes that are trivial in both images.
+
+    A plane is trivial when it is constant (including all zero). Its
+    transform only has a zero-frequency term, so the feathered plane is the
+    constant given by the kernels at zero frequency. Planes flagged in
+    ``empty`` (i.e., entirely NaN in both images) are returned as NaN.
+
+    Returns
+    -------
+    combo : `~numpy.ndarray`
+        The real feathered planes, with the shape of ``im_hi``.
+    nskipped : int
+        The number of planes that were not transformed.
+    '''
+
+    single_plane = im_hi.ndim == 2
+    if single_plane:
+        im_hi = im_hi[np.newaxis]
+        im_lo = im_lo[np.newaxis]
+        if empty is not None:
+            empty = np.atleast_1d(empty)
+
+    merge_kwargs = dict(lowpassfilterSD=lowpassfilterSD,
+                        replace_hires=replace_hires,
+                        deconvSD=deconvSD,
+                        min_beam_fraction=min_beam_fraction,
+                        use_rfft=use_rfft,
+                        fft_backend=fft_backend,
+                        fft_workers=fft_workers)
+
+    # Per-plane statistics are cheap compared to the FFTs
+    const_hi = im_hi.min(axis=(-2, -1)) == im_hi.max(axis=(-2, -1))
+    const_lo = im_lo.min(axis=(-2, -1)) == im_lo.max(axis=(-2, -1))
+    trivial = const_hi & const_lo
+
+    if not trivial.any():
+        combo = _fftmerge_filled(kfft, ikfft, im_hi, im_lo, **merge_kwargs)[1].real
+    else:
+        combo = np.empty(im_hi.shape, dtype=im_hi.dtype)
+        value_hi = im_hi[trivial, 0, 0]
+        value_lo = im_lo[trivial, 0, 0]
+
+        # The zero-frequency terms of the kernels
+        kfft0 = kfft[0, 0]
+        ikfft0 = ikfft[0, 0]
+
+        if lowpassfilterSD:
+            value_lo = value_lo * kfft0
+        elif deconvSD:
+            value_lo = value_lo / kfft0 if kfft0 >= min_beam_fraction else 0. * value_lo
+
+        if replace_hires and ikfft0 > replace_hires:
+            values = value_hi
+        elif replace_hires:
+            values = value_lo
+        else:
+            values = value_lo + ikfft0 * value_hi
+
+        # Planes without any data stay blank
+        if empty is not None:
+            values = np.where(empty[trivial], np.nan, values)
+
+        combo[trivial] = values[:, np.newaxis, np.newaxis]
+
+        if not trivial.all():
+            combo[~trivial] = _fftmerge_filled(kfft, ikfft, im_hi[~trivial],
+                                               im_lo[~trivial],
+                                               **merge_kwargs)[1].real
+
+    if single_plane:
+        combo = combo[0]
+
+    return combo, int(trivial.sum())
 
 
 def simple_deconvolve_sdim(hdu, lowresfwhm, minval=1e-1):
@@ -384,12 +714,12 @@ def simple_deconvolve_sdim(hdu, lowresfwhm, minval=1e-1):
 
     kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale)
 
-    fft_lo = (np.fft.fft2(np.nan_to_num(proj.value)))
+    fft_lo = (fft2(np.nan_to_num(proj.value)))
 
     # Divide by the SD beam in Fourier space.
     decfft_lo = fft_lo.copy()
     decfft_lo[kfft > minval] = (fft_lo / kfft)[kfft > minval]
-    dec_lo = np.fft.ifft2(decfft_lo)
+    dec_lo = ifft2(decfft_lo)
 
     return dec_lo
 
@@ -406,14 +736,97 @@ def simple_fourier_unsharpmask(hdu, lowresfwhm, minval=1e-1):
 
     kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale)
 
-    fft_hi = (np.fft.fft2(np.nan_to_num(proj.value)))
+    fft_hi = (fft2(np.nan_to_num(proj.value)))
     #umaskfft_hi = fft_hi.copy()
     #umaskfft_hi[ikfft < minval] = (fft_hi * ikfft)[ikfft < minval]
     umaskfft_hi = fft_hi * ikfft
-    umask_hi = np.fft.ifft2(umaskfft_hi)
+    umask_hi = ifft2(umaskfft_hi)
 
     return umask_hi
 
+def _feather_inputs(hires, lores, highresextnum=0, lowresextnum=0,
+                    lowresfwhm=None, weights=None, pbresponse=None,
+                    match_units=True):
+    """
+    Load the images feathered by `feather_simple`, match their units and
+    regrid the low-resolution image onto the high-resolution grid.
+
+    Returns
+    -------
+    proj_hi, proj_lo, proj_lo_regrid : `~spectral_cube.Projection`
+        The high-resolution image, and the low-resolution image before and
+        after regridding.
+    lowresfwhm : `~astropy.units.Quantity`
+        The FWHM of the low-resolution beam.
+    weights : `~numpy.ndarray` or float
+        The weights, or 1 when none are given.
+    """
+
+    if isinstance(hires, str):
+        hdu_hi = fits.open(hires)[highresextnum]
+        proj_hi = Projection.from_hdu(hdu_hi)
+    elif isinstance(hires, fits.PrimaryHDU):
+        proj_hi = Projection.from_hdu(hires)
+    else:
+        proj_hi = hires
+
+    if isinstance(lores, str):
+        hdu_lo = fits.open(lores)[lowresextnum]
+        proj_lo = Projection.from_hdu(hdu_lo)
+    elif isinstance(lores, fits.PrimaryHDU):
+        proj_lo = Projection.from_hdu(lores)
+    else:
+        proj_lo = lores
+
+    if lowresfwhm is None:
+        beam_low = proj_lo.beam
+        lowresfwhm = beam_low.major
+        # log.info("Low-res FWHM: {0}".format(lowresfwhm))
+
+    # If weights are given, they must match the shape of the hires data
+    if weights is not None:
+        if not weights.shape == proj_hi.shape:
+            raise ValueError("weights must be an array with the same shape as"
+                             " the high-res data.")
+    else:
+        weights = 1.
+
+    if pbresponse is not None:
+        if not pbresponse.shape == proj_hi.shape:
+            raise ValueError("pbresponse must be an array with the same"
+                             " shape as the high-res data.")
+
+    if match_units:
+        # After this step, the units of im_hi are some sort of surface brightness
+        # unit equivalent to that specified in the high-resolution header's units
+        # Note that this step does NOT preserve the values of im_lowraw and
+        # header_lowraw from above
+
+        proj_lo = proj_lo.to(proj_hi.unit)
+
+        # When in a per-beam unit, we need to scale the low res to the
+        # Jy / beam for the HIRES beam.
+        jybm_unit = u.Jy / u.beam
+        if proj_hi.unit.is_equivalent(jybm_unit):
+            proj_lo *= (proj_hi.beam.sr / proj_lo.beam.sr).decompose().value
+
+    # Add check that the units are compatible
+    equiv_units = proj_lo.unit.is_equivalent(proj_hi.unit)
+    if not equiv_units:
+        raise ValueError("Brightness units are not equivalent: "
+                         f"hires: {proj_hi.unit}; lowres: {proj_lo.unit}")
+
+    is_wcs_eq = proj_lo.wcs.wcs.compare(proj_lo.wcs.wcs)
+    is_eq_shape = proj_lo.shape == proj_hi.shape
+
+    if not is_wcs_eq or not is_eq_shape:
+        proj_lo_regrid = proj_lo.reproject(proj_hi.header)
+    else:
+        proj_lo_regrid = proj_lo
+
+    return proj_hi, proj_lo, proj_lo_regrid, lowresfwhm, weights
+
+
 def feather_simple(hires, lores,
                    highresextnum=0,
                    lowresextnum=0,
@@ -428,6 +841,10 @@ def feather_simple(hires, lores,
                    return_regridded_lores=False,
                    match_units=True,
                    weights=None,
+                   use_rfft=False,
+                   dtype=float,
+                   fft_backend=None,
+                   fft_workers=None,
                    ):
     """
     Fourier combine two single-plane images.  This follows the CASA approach,
@@ -511,6 +928,17 @@ def feather_simple(hires, lores,
         array can be provided to smoothly taper the edges of each map to avoid
         this issue. **This will be applied to both the low and high resolution
         images!**
+    use_rfft : bool
+        Use the real-input FFTs to combine the images (see `fftmerge`). The
+        combined image is then returned as a real array instead of a complex
+        array.
+    dtype : `~numpy.dtype`
+        Precision used to combine the images. ``np.float32`` keeps the
+        transforms and the output in single precision (see `fftmerge`).
+    fft_backend : str, optional
+        FFT backend of the transforms. See `fftmerge`.
+    fft_workers : int, optional
+        Number of threads used by each transform. See `fftmerge`.
 
     Returns
     -------
@@ -520,83 +948,40 @@ def feather_simple(hires, lores,
         (optional) the image encased in a FITS HDU with the relevant header
     """
 
-    if isinstance(hires, str):
-        hdu_hi = fits.open(hires)[highresextnum]
-        proj_hi = Projection.from_hdu(hdu_hi)
-    elif isinstance(hires, fits.PrimaryHDU):
-        proj_hi = Projection.from_hdu(hires)
-    else:
-        proj_hi = hires
-
-    if isinstance(lores, str):
-        hdu_lo = fits.open(lores)[lowresextnum]
-        proj_lo = Projection.from_hdu(hdu_lo)
-    elif isinstance(lores, fits.PrimaryHDU):
-        proj_lo = Projection.from_hdu(lores)
-    else:
-        proj_lo = lores
-
-    if lowresfwhm is None:
-        beam_low = proj_lo.beam
-        lowresfwhm = beam_low.major
-        # log.info("Low-res FWHM: {0}".format(lowresfwhm))
-
-    # If weights are given, they must match the shape of the hires data
-    if weights is not None:
-        if not weights.shape == proj_hi.shape:
-            raise ValueError("weights must be an array with the same shape as"
-                             " the high-res data.")
-    else:
-        weights = 1.
-
-    if pbresponse is not None:
-        if not pbresponse.shape == proj_hi.shape:
-            raise ValueError("pbresponse must be an array with the same"
-                             " shape as the high-res data.")
-
-    if match_units:
-        # After this step, the units of im_hi are some sort of surface brightness
-        # unit equivalent to that specified in the high-resolution header's units
-        # Note that this step does NOT preserve the values of im_lowraw and
-        # header_lowraw from above
-
-        proj_lo = proj_lo.to(proj_hi.unit)
-
-        # When in a per-beam unit, we need to scale the low res to the
-        # Jy / beam for the HIRES beam.
-        jybm_unit = u.Jy / u.beam
-        if proj_hi.unit.is_equivalent(jybm_unit):
-            proj_lo *= (proj_hi.beam.sr / proj_lo.beam.sr).decompose().value
-
-    # Add check that the units are compatible
-    equiv_units = proj_lo.unit.is_equivalent(proj_hi.unit)
-    if not equiv_units:
-        raise ValueError("Brightness units are not equivalent: "
-                         f"hires: {proj_hi.unit}; lowres: {proj_lo.unit}")
-
-    is_wcs_eq = proj_lo.wcs.wcs.compare(proj_lo.wcs.wcs)
-    is_eq_shape = proj_lo.shape == proj_hi.shape
-
-    if not is_wcs_eq or not is_eq_shape:
-        proj_lo_regrid = proj_lo.reproject(proj_hi.header)
-    else:
-        proj_lo_regrid = proj_lo
-
-    # Apply the pbresponse to the regridded low-resolution data
-    if pbresponse is not None:
-        proj_lo_regrid *= pbresponse
+    proj_hi, proj_lo, proj_lo_regrid, lowresfwhm, weights = \
+        _feather_inputs(hires, lores,
+                        highresextnum=highresextnum,
+                        lowresextnum=lowresextnum,
+                        lowresfwhm=lowresfwhm,
+                        weights=weights,
+                        pbresponse=pbresponse,
+                        match_units=match_units)
 
     pixscale = wcs.utils.proj_plane_pixel_scales(proj_hi.wcs.celestial)[0]
     nax2, nax1 = proj_hi.shape
-    kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale,)
+    kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale,
+                                 use_rfft=use_rfft, dtype=dtype)
 
-    fftsum, combo = fftmerge(kfft, ikfft,
-                             proj_hi.value * highresscalefactor * weights,
-                             proj_lo_regrid.value * lowresscalefactor * weights,
-                             replace_hires=replace_hires,
-                             lowpassfilterSD=lowpassfilterSD,
-                             deconvSD=deconvSD,
-                             )
+    # Scale, weight and fill the NaNs of each image in one pass. The
+    # pbresponse is applied to the regridded low-resolution data.
+    scale_lo = lowresscalefactor * weights
+    if pbresponse is not None:
+        scale_lo = scale_lo * pbresponse
+
+    im_hi = _prepare_planes(proj_hi.value, np.empty(proj_hi.shape, dtype=dtype),
+                            highresscalefactor * weights)[0]
+    im_lo = _prepare_planes(proj_lo_regrid.value, np.empty(proj_hi.shape, dtype=dtype),
+                            scale_lo)[0]
+
+    fftsum, combo = _fftmerge_filled(kfft, ikfft, im_hi, im_lo,
+                                     replace_hires=replace_hires,
+                                     lowpassfilterSD=lowpassfilterSD,
+                                     deconvSD=deconvSD,
+                                     use_rfft=use_rfft,
+                                     fft_backend=fft_backend,
+                                     fft_workers=fft_workers,
+                                     )
+    del fftsum, im_hi, im_lo
 
     # Divide by the PB response
     if pbresponse is not None:
@@ -659,14 +1044,18 @@ def feather_plot(hires, lores,
 
     Returns
     -------
-    combo : image
-        The image of the combined low and high resolution data sets
-    combo_hdu : fits.PrimaryHDU
-        (optional) the image encased in a FITS HDU with the relevant header
+    spectra : dict
+        The azimuthally averaged kernels and power spectra, and their
+        spatial frequencies:
+
+        * ``'radius'``: the spatial frequency of each annulus in cycles per
+          pixel.
+        * ``'radius_as'``: the angular scale of each annulus, as a
+          `~astropy.units.Quantity` in arcsec. Earlier versions returned
+          this as plain values in degrees.
+        * ``'azimuthally_averaged_*'``: the averages of the kernels, of the
+          transformed images and of the images weighted by their kernels.
     """
-    # import image_tools
-    from turbustat.statistics.psds import pspec
-
     if isinstance(hires, str):
         hdu_hi = fits.open(hires)[highresextnum]
         proj_hi = Projection.from_hdu(hdu_hi)
@@ -683,7 +1072,7 @@ def feather_plot(hires, lores,
     else:
         proj_lo = lores
 
-    print("featherplot")
+    log.debug("Computing the power spectra for feather_plot")
     pb = tqdm(13)
 
     if match_units:
@@ -714,7 +1103,6 @@ def feather_plot(hires, lores,
     kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale)
 
     log.debug("bottom-left pixel before shifting: kfft={0}, ikfft={1}".format(kfft[0,0], ikfft[0,0]))
-    print("bottom-left pixel before shifting: kfft={0}, ikfft={1}".format(kfft[0,0], ikfft[0,0]))
     pb.update()
     kfft = np.fft.fftshift(kfft)
     pb.update()
@@ -722,68 +1110,52 @@ def feather_plot(hires, lores,
     pb.update()
 
     if hires_threshold is None:
-        fft_hi = np.fft.fftshift(np.fft.fft2(np.nan_to_num(proj_hi.value * highresscalefactor)))
+        fft_hi = np.fft.fftshift(fft2(np.nan_to_num(proj_hi.value * highresscalefactor)))
     else:
         hires_tofft = np.nan_to_num(proj_hi.value * highresscalefactor)
         hires_tofft[hires_tofft < hires_threshold] = 0
-        fft_hi = np.fft.fftshift(np.fft.fft2(hires_tofft))
+        fft_hi = np.fft.fftshift(fft2(hires_tofft))
     pb.update()
     if lores_threshold is None:
-        fft_lo = np.fft.fftshift(np.fft.fft2(np.nan_to_num(proj_lo_regrid.value * lowresscalefactor)))
+        fft_lo = np.fft.fftshift(fft2(np.nan_to_num(proj_lo_regrid.value * lowresscalefactor)))
     else:
         lores_tofft = np.nan_to_num(proj_lo_regrid.value * lowresscalefactor)
         lores_tofft[lores_tofft < lores_threshold] = 0
-        fft_lo = np.fft.fftshift(np.fft.fft2(lores_tofft))
+        fft_lo = np.fft.fftshift(fft2(lores_tofft))
     pb.update()
 
-    # rad,azavg_kernel = image_tools.radialprofile.azimuthalAverage(np.abs(kfft), returnradii=True)
-    # pb.update()
-    # rad,azavg_ikernel = image_tools.radialprofile.azimuthalAverage(np.abs(ikfft), returnradii=True)
-    # pb.update()
-    # rad,azavg_hi = image_tools.radialprofile.azimuthalAverage(np.abs(fft_hi), returnradii=True)
-    # pb.update()
-    # rad,azavg_lo = image_tools.radialprofile.azimuthalAverage(np.abs(fft_lo), returnradii=True)
-    # pb.update()
-    # rad,azavg_hi_scaled = image_tools.radialprofile.azimuthalAverage(np.abs(fft_hi*ikfft), returnradii=True)
-    # pb.update()
-    # rad,azavg_lo_scaled = image_tools.radialprofile.azimuthalAverage(np.abs(fft_lo*kfft), returnradii=True)
-    # pb.update()
-    # rad,azavg_lo_deconv = image_tools.radialprofile.azimuthalAverage(np.abs(fft_lo/kfft), returnradii=True)
-    # pb.update()
-
-    rad,azavg_kernel = pspec(np.abs(kfft))
-    pb.update()
-    rad,azavg_ikernel = pspec(np.abs(ikfft))
-    pb.update()
-    rad,azavg_hi = pspec(np.abs(fft_hi))
-    pb.update()
-    rad,azavg_lo = pspec(np.abs(fft_lo))
-    pb.update()
-    rad,azavg_hi_scaled = pspec(np.abs(fft_hi*ikfft))
-    pb.update()
-    rad,azavg_lo_scaled = pspec(np.abs(fft_lo*kfft))
-    pb.update()
-    rad,azavg_lo_deconv = pspec(np.abs(fft_lo/kfft))
-    pb.update()
+    # All of the azimuthal averages share the same annuli
+    annuli = AnnulusIndex((nax2, nax1), pixscale * u.deg)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radii, azavgs = annuli.azimuthal_average(np.abs(kfft),
+                                               np.abs(ikfft),
+                                               np.abs(fft_hi),
+                                               np.abs(fft_lo),
+                                               np.abs(fft_hi*ikfft),
+                                               np.abs(fft_lo*kfft),
+                                               np.abs(fft_lo/kfft))
+    (azavg_kernel, azavg_ikernel, azavg_hi, azavg_lo, azavg_hi_scaled,
+     azavg_lo_scaled, azavg_lo_deconv) = azavgs
+    pb.update(7)
 
     # use the same "OK" mask for everything because it should just be an artifact
     # of the averaging
     OK = np.isfinite(azavg_kernel)
 
-    # 1/min(rad) ~ number of pixels from center to corner of image
-    # pixscale in degrees.  Convert # pixels to arcseconds
-    # 2 pixels = where rad is 1/2 the image (square) dimensions
-    # (nax1) pixels = where rad is 1
+    # Spatial frequency of each annulus in cycles per pixel. The annulus
+    # radii are in pixels of the Fourier plane, and 1/rad is the angular
+    # scale in pixels.
     # *** ASSUMES SQUARE ***
-    rad_pix = nax1/rad
-    rad_as = pixscale * rad_pix
+    rad = radii / nax1
+    rad_pix = 1./rad
+    rad_as = (pixscale * u.deg * rad_pix).to(u.arcsec)
     log.debug("pixscale={0} nax1={1}".format(pixscale, nax1))
     if xaxisunit == 'lambda':
         #restfrq = (wcs.WCS(hd1).wcs.restfrq*u.Hz)
-        lam = 1./(rad_as*u.arcsec).to(u.rad).value
+        lam = 1./rad_as.to(u.rad).value
         xaxis = lam
     elif xaxisunit == 'arcsec':
-        xaxis = rad_as
+        xaxis = rad_as.value
     else:
         raise ValueError("xaxisunit must be in (arcsec, lambda)")
 
@@ -800,7 +1172,7 @@ def feather_plot(hires, lores,
     ax1.set_ylim(1e-5, 1.1)
 
     arg_xmin = np.nanargmin(np.abs((azavg_ikernel)-(1-1e-5)))
-    xlim = xaxis[arg_xmin].value / 1.1, xaxis[1].value * 1.1
+    xlim = xaxis[arg_xmin] / 1.1, xaxis[1] * 1.1
     log.debug("Xlim: {0}".format(xlim))
     assert np.isfinite(xlim[0])
     assert np.isfinite(xlim[1])
@@ -990,6 +1362,45 @@ if HAS_DASK:
     import dask.array as da
     from spectral_cube.dask_spectral_cube import add_save_to_tmp_dir_option
 
+    def _dask_reproject_celestial(cube_lo, cube_hi):
+        '''
+        Reproject the celestial axes of ``cube_lo`` onto the pixel grid of
+        ``cube_hi``. The spectral axes must already match.
+
+        The bilinear interpolation weights are computed once (see
+        `~uvcombine.reproject_map.ReprojectionMap`) in a single task that
+        all of the spectral chunks depend on. The output has the spectral
+        chunks of ``cube_hi`` and one chunk along the spatial axes.
+        '''
+
+        shape_lo = cube_lo.shape[1:]
+        shape_hi = cube_hi.shape[1:]
+
+        repmap = dask.delayed(ReprojectionMap, pure=True)(cube_lo.wcs.celestial,
+                                                          shape_lo,
+                                                          cube_hi.wcs.celestial,
+                                                          shape_hi)
+
+        spec_chunks = cube_hi._data.chunks[0]
+        data_lo = cube_lo._get_filled_data(fill=np.nan).rechunk((spec_chunks, -1, -1))
+
+        out_dtype = np.result_type(float, data_lo.dtype)
+
+        def reproject_block(block, repmap):
+            return repmap(block).astype(out_dtype, copy=False)
+
+        data_reproj = da.map_blocks(reproject_block, data_lo, repmap,
+                                    chunks=(spec_chunks, (shape_hi[0],),
+                                            (shape_hi[1],)),
+                                    dtype=out_dtype,
+                                    meta=np.array((), dtype=out_dtype))
+
+        return cube_lo._new_cube_with(data=data_reproj,
+                                      wcs=cube_hi.wcs,
+                                      mask=BooleanArrayMask(da.isfinite(data_reproj),
+                                                            cube_hi.wcs),
+                                      meta=cube_lo.meta)
+
     @add_save_to_tmp_dir_option
     def _dask_feather_cubes(cube_hi, cube_lo,
                             highresscalefactor=1.0,
@@ -997,38 +1408,129 @@ if HAS_DASK:
                             weights=1.0,
                             replace_hires=False,
                             lowpassfilterSD=False,
-                            deconvSD=False):
-
-        lowresfwhm = cube_lo.beam.major
+                            deconvSD=False,
+                            use_rfft=True,
+                            dtype=float,
+                            beam_tolerance=0.,
+                            rescale_jybm=False,
+                            fft_backend=None,
+                            fft_workers=None):
 
         pixscale = wcs.utils.proj_plane_pixel_scales(cube_hi.wcs.celestial)[0]
         nax2, nax1 = cube_hi.shape[1:]
 
-        # Do we need this wrapper here?
-        def feather_wrapper(img_hi, img_lo, **kwargs):
+        if hasattr(cube_lo, 'beams'):
+            from .feather_plan import group_channels_by_beam
+
+            group_beams, group_ids = group_channels_by_beam(cube_lo.beams,
+                                                            tolerance=beam_tolerance)
+        else:
+            group_beams = [cube_lo.beam]
+            group_ids = np.zeros(cube_lo.shape[0], dtype=int)
+
+        # Scale the low res to the Jy / beam of the HIRES beam, using the
+        # beam of each channel's group.
+        if rescale_jybm:
+            group_factors = np.array([(cube_hi.beam.sr / beam.sr).decompose().value
+                                      for beam in group_beams])
+            lowres_factors = group_factors[group_ids]
+        else:
+            lowres_factors = np.ones(cube_lo.shape[0])
+
+        # Build the kernels once per distinct beam, as single tasks that
+        # every block depends on, rather than in each block.
+        kernels = [dask.delayed(feather_kernel, pure=True)(nax2, nax1,
+                                                           beam.major, pixscale,
+                                                           use_rfft=use_rfft,
+                                                           dtype=dtype,
+                                                           use_cache=False)
+                   for beam in group_beams]
+
+        scale_hi = highresscalefactor * weights
+        scale_lo = lowresscalefactor * weights
+
+        def feather_wrapper(img_hi, img_lo, kernels, block_info=None):
+
+            chan_start, chan_stop = block_info[0]['array-location'][0]
+            block_groups = group_ids[chan_start:chan_stop]
+            block_factors = lowres_factors[chan_start:chan_stop, np.newaxis, np.newaxis]
+
+            # Scale, weight and fill the NaNs in one pass over each block
+            img_hi, empty_hi = _prepare_planes(img_hi, np.empty(img_hi.shape, dtype=dtype),
+                                               scale_hi)
+            img_lo, empty_lo = _prepare_planes(img_lo, np.empty(img_lo.shape, dtype=dtype),
+                                               block_factors, scale_lo)
+            empty = empty_hi & empty_lo
+
+            merge_kwargs = dict(replace_hires=replace_hires,
+                                lowpassfilterSD=lowpassfilterSD,
+                                deconvSD=deconvSD,
+                                use_rfft=use_rfft,
+                                fft_backend=fft_backend,
+                                fft_workers=fft_workers)
+
+            groups = np.unique(block_groups)
+
+            # Constant and empty channels are not transformed
+            if groups.size == 1:
+                kfft, ikfft = kernels[groups[0]]
+                return _fftmerge_planes(kfft, ikfft, img_hi, img_lo, empty=empty,
+                                        **merge_kwargs)[0]
+
+            combo = np.empty(img_hi.shape, dtype=dtype)
+
+            for group in groups:
+                kfft, ikfft = kernels[group]
+
+                chans = block_groups == group
 
-            kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale,)
+                combo[chans] = _fftmerge_planes(kfft, ikfft,
+                                                img_hi[chans], img_lo[chans],
+                                                empty=empty[chans],
+                                                **merge_kwargs)[0]
 
-            fftsum, combo = fftmerge(kfft, ikfft,
-                                    img_hi * highresscalefactor * weights,
-                                    img_lo * lowresscalefactor * weights,
-                                    replace_hires=replace_hires,
-                                    lowpassfilterSD=lowpassfilterSD,
-                                    deconvSD=deconvSD,
-                                    )
+            return combo
 
-            return combo.real
+        data_hi = cube_hi._get_filled_data(fill=np.nan)
+        data_lo = cube_lo._get_filled_data(fill=np.nan).rechunk(data_hi.chunksize)
 
-        data_lo = cube_lo._get_filled_data(fill=np.nan)
+        feath_data = da.map_blocks(feather_wrapper, data_hi, data_lo, kernels,
+                                   dtype=dtype,
+                                   meta=np.array((), dtype=dtype))
 
-        feath_cube = cube_hi._map_blocks_to_cube(feather_wrapper,
-                                                 additional_arrays=[data_lo])
+        feath_cube = cube_hi._new_cube_with(data=feath_data,
+                                            wcs=cube_hi.wcs,
+                                            mask=cube_hi.mask,
+                                            meta=cube_hi.meta,
+                                            fill_value=cube_hi.fill_value)
 
         return feath_cube
 
 
 
 
+def _match_spectral_axes(cube_hi, cube_lo, allow_spectral_resample=True,
+                         **save_kwargs):
+    """
+    Return ``cube_lo`` interpolated onto the spectral axis of ``cube_hi``
+    when the spectral axes differ.
+    """
+
+    if cube_lo.shape[0] == cube_hi.shape[0]:
+        is_spec_matched = np.isclose(cube_lo.spectral_axis, cube_hi.spectral_axis).all()
+    else:
+        is_spec_matched = False
+
+    if not is_spec_matched:
+        if allow_spectral_resample:
+            cube_lo = cube_lo.spectral_interpolate(cube_hi.spectral_axis, **save_kwargs)
+        else:
+            raise ValueError("Spectral axes do not match. Enable `allow_spectrum_resample` to "
+                             "spectrally match the low resolution to high resolution data.")
+
+    return cube_lo
+
+
 def feather_simple_cube(cube_hi, cube_lo,
                         allow_spectral_resample=True,
                         allow_huge_operations=False,
@@ -1038,6 +1540,16 @@ def feather_simple_cube(cube_hi, cube_lo,
                         force_spatial_rechunk=True,
                         channels_per_chunk='auto',
                         allow_lo_reproj=True,
+                        memory_limit=None,
+                        n_workers=1,
+                        use_processes=False,
+                        dtype=float,
+                        beam_tolerance=0.,
+                        output=None,
+                        overwrite=False,
+                        resume=False,
+                        zarr_chunks='spectral',
+                        compressor='default',
                         **kwargs):
     """
     Parameters
@@ -1077,8 +1589,67 @@ def feather_simple_cube(cube_hi, cube_lo,
     allow_lo_reproj : bool
         With `use_dask` enabled, `cube_lo` will be reprojected to match
         `cube_hi`. This step can otherwise be performed prior to feathering
-        but is needed to force alignment of the chunks in both cubes.
-    kwargs : Passed to `~feather_simple`.
+        but is needed to force alignment of the chunks in both cubes. The
+        reprojection is done one spectral chunk at a time, with output chunks
+        that match `cube_hi`.
+    memory_limit : int, str or `~astropy.units.Quantity`, optional
+        Memory budget, in bytes or as a quantity (e.g., ``'2 GB'``), used to
+        choose the number of channels feathered at once and to limit the
+        number of workers. Without `use_dask`, channels are feathered in slabs
+        of this size. With `use_dask` and ``channels_per_chunk='auto'``, this
+        sets the spectral chunk size. See
+        `~uvcombine.chunk_planner.plan_feather_chunks`.
+    n_workers : int
+        Without `use_dask`, the number of threads used to feather slabs of
+        channels in parallel. Each thread writes into its own channels of the
+        (memory-mapped) output array. With `use_dask` and `memory_limit`, the
+        number of dask workers to plan the chunks for (by default, the
+        ``num_workers`` dask setting or the number of CPUs).
+    use_processes : bool
+        Without `use_dask`, use a pool of `n_workers` processes instead of
+        threads. The cubes are shared with the workers through shared memory
+        and the memory-mapped output (`use_memmap`) is written to directly.
+    dtype : `~numpy.dtype`
+        Precision of the feathering and of the output cube. Use ``np.float32``
+        to keep single precision end to end, which halves the memory and
+        disk space used. See `~uvcombine.fftmerge` for the accuracy.
+    beam_tolerance : float
+        For varying resolution `cube_lo`, channels whose beam axes differ by
+        less than this fraction are feathered with the same kernel and
+        Jy/beam rescaling. See `~uvcombine.feather_plan.group_channels_by_beam`.
+        The default of 0 only groups channels with identical beams.
+    output : str, optional
+        Name of a FITS file to write the feathered cube into. The file is
+        created with the header of `cube_hi` before feathering and each slab
+        of channels (or dask chunk) is written straight into it, so the cube
+        does not need to be written again afterwards. The returned cube is
+        backed by this file. `use_memmap` is ignored when this is given.
+        With `use_dask`, a name ending in ``.zarr`` writes a zarr store
+        instead, with the chunks written in parallel (see
+        `~uvcombine.cube_io.write_zarr_cube`).
+    overwrite : bool
+        Replace `output` if it exists.
+    resume : bool
+        Without `use_dask`, record the channels written to `output` in
+        ``<output>.progress.json`` as they are finished. If this file exists
+        when feathering with the same cubes and parameters, only the missing
+        channels are feathered, so an interrupted run can be continued.
+        A run with different inputs raises a ValueError unless `overwrite`
+        is enabled. See `~uvcombine.cube_io.FeatherCheckpoint`.
+    zarr_chunks : {'spectral', 'spatial'} or tuple
+        Chunks of a zarr `output`. 'spectral' stores whole spectra over
+        spatial tiles for fast spectral access. 'spatial' keeps the chunks
+        used for feathering, which avoids rechunking.
+    compressor : zarr codec or None
+        Compression of a zarr `output`. 'default' uses the zarr default and
+        None disables compression.
+    kwargs : Passed to `~uvcombine.FeatherPlan`, or to the per-chunk feathering
+        with dask (e.g., ``highresscalefactor``, ``lowresscalefactor``,
+        ``lowpassfilterSD``, ``replace_hires``, ``deconvSD``, ``use_rfft``,
+        ``fft_backend`` and ``fft_workers``).
+        Options of `~feather_simple` that only apply to single images
+        (``return_hdu``, ``return_regridded_lores``, ``highresextnum`` and
+        ``lowresextnum``) are not supported.
 
     Returns
     -------
@@ -1087,42 +1658,66 @@ def feather_simple_cube(cube_hi, cube_lo,
 
     """
 
+    image_only_kwargs = [key for key in ('return_hdu', 'return_regridded_lores',
+                                         'highresextnum', 'lowresextnum')
+                         if key in kwargs]
+    if image_only_kwargs:
+        raise TypeError("feather_simple_cube does not support the feather_simple"
+                        f" options: {', '.join(image_only_kwargs)}.")
+
     if not hasattr(cube_hi, 'shape'):
         cube_hi = SpectralCube.read(cube_hi, use_dask=use_dask)
     if not hasattr(cube_lo, 'shape'):
         cube_lo = SpectralCube.read(cube_lo, use_dask=use_dask)
 
-    # TODO: add VRSC dask suppoert
-    # Cannot handle varying res with dask yet
-    if isinstance(cube_lo, DaskVaryingResolutionSpectralCube):
-        raise TypeError("`feather_simple_cube` cannot yet handle varying resolution spectral cubes"
-                        " (beam size per channel). Use a non-dask for now.")
-
     if isinstance(cube_lo, DaskSpectralCube):
         save_kwargs = {"save_to_tmp_dir": use_save_to_tmp_dir}
     else:
         save_kwargs = {}
 
-    cube_hi.allow_huge_operations = allow_huge_operations
-    cube_lo.allow_huge_operations = allow_huge_operations
+    if resume and output is None:
+        raise ValueError("An output file must be given to resume feathering.")
 
-    if cube_lo.shape[0] == cube_hi.shape[0]:
-        is_spec_matched = np.isclose(cube_lo.spectral_axis, cube_hi.spectral_axis).all()
+    if output is not None:
+        from .cube_io import is_zarr_path
+        output_is_zarr = is_zarr_path(output)
     else:
-        is_spec_matched = False
+        output_is_zarr = False
 
-    if not is_spec_matched:
-        if allow_spectral_resample:
-            cube_lo = cube_lo.spectral_interpolate(cube_hi.spectral_axis, **save_kwargs)
-        else:
-            raise ValueError("Spectral axes do not match. Enable `allow_spectrum_resample` to "
-                             "spectrally match the low resolution to high resolution data.")
+    cube_hi.allow_huge_operations = allow_huge_operations
+    cube_lo.allow_huge_operations = allow_huge_operations
+
+    cube_lo = _match_spectral_axes(cube_hi, cube_lo,
+                                   allow_spectral_resample=allow_spectral_resample,
+                                   **save_kwargs)
 
     # If cubes are DaskSpectralCubes, use the dask implementation
     if isinstance(cube_hi, DaskSpectralCube) and isinstance(cube_lo, DaskSpectralCube):
 
+        if resume:
+            raise ValueError("Resuming is only supported without dask.")
+
+        # Choose the chunk size from the memory budget
+        if memory_limit is not None and channels_per_chunk == 'auto':
+            from .chunk_planner import plan_feather_chunks
+
+            if n_workers > 1:
+                dask_workers = n_workers
+            else:
+                dask_workers = dask.config.get('num_workers', None)
+
+            chunk_plan = plan_feather_chunks(cube_hi.shape, dtype=dtype,
+                                             memory_limit=memory_limit,
+                                             n_workers=dask_workers,
+                                             use_rfft=kwargs.get('use_rfft', True))
+            log.info(chunk_plan.summary())
+
+            channels_per_chunk = chunk_plan.channels_per_chunk
+
         # The block mapping has to be the same. Set here whether to
         # allow a prior reproject operation for the SD to match.
+        hi_rechunked = False
+
         if allow_lo_reproj:
             # Add a check to see if we can avoid reprojecting as it's expensive
             # for whole cubes.
@@ -1132,10 +1727,13 @@ def feather_simple_cube(cube_hi, cube_lo,
             if is_wcs_eq and is_eq_shape:
                 cube_lo_reproj = cube_lo
             else:
-                # NOTE: is this memory friendly? We don't have a dedicated
-                # dask reprojection task, so this COULD break things.
-                cube_lo = cube_lo.rechunk((channels_per_chunk, -1, -1), **save_kwargs)
-                cube_lo_reproj = cube_lo.reproject(cube_hi.header, use_memmap=use_memmap)
+                # Set the chunks of cube_hi first so the reprojected cube_lo
+                # is created with matching chunks.
+                if force_spatial_rechunk:
+                    cube_hi = cube_hi.rechunk((channels_per_chunk, -1, -1), **save_kwargs)
+                    hi_rechunked = True
+
+                cube_lo_reproj = _dask_reproject_celestial(cube_lo, cube_hi)
         else:
             cube_lo_reproj = cube_lo
 
@@ -1149,7 +1747,10 @@ def feather_simple_cube(cube_hi, cube_lo,
         # Ensure spatial chunk sizes are matched.
         if force_spatial_rechunk:
             chunksize = (channels_per_chunk, -1, -1)
-            cube_hi = cube_hi.rechunk(chunksize, **save_kwargs)
+            # Avoid writing cube_hi out again when it was rechunked
+            # before the reprojection.
+            if not hi_rechunked:
+                cube_hi = cube_hi.rechunk(chunksize, **save_kwargs)
             cube_lo_reproj = cube_lo_reproj.rechunk(chunksize, **save_kwargs)
 
             if cube_hi._data.chunksize != cube_lo_reproj._data.chunksize:
@@ -1171,6 +1772,7 @@ def feather_simple_cube(cube_hi, cube_lo,
 
         # Check kwargs for feather_simple kwarg to allow matching units
         match_units = kwargs.pop('match_units', True)
+        rescale_jybm = False
 
         # Check for units consistency
         if match_units:
@@ -1181,10 +1783,14 @@ def feather_simple_cube(cube_hi, cube_lo,
             cube_lo_reproj = cube_lo_reproj.to(cube_hi.unit)
 
             # When in a per-beam unit, we need to scale the low res to the
-            # Jy / beam for the HIRES beam.
+            # Jy / beam for the HIRES beam. This is done per beam group
+            # when feathering varying resolution cubes.
             jybm_unit = u.Jy / u.beam
             if cube_hi.unit.is_equivalent(jybm_unit):
-                cube_lo_reproj *= (cube_hi.beam.sr / cube_lo_reproj.beam.sr).decompose().value
+                if hasattr(cube_lo_reproj, 'beams'):
+                    rescale_jybm = True
+                else:
+                    cube_lo_reproj *= (cube_hi.beam.sr / cube_lo_reproj.beam.sr).decompose().value
 
         # Add check that the units are compatible
         equiv_units = cube_lo_reproj.unit.is_equivalent(cube_hi.unit)
@@ -1194,29 +1800,129 @@ def feather_simple_cube(cube_hi, cube_lo,
 
         feathcube = _dask_feather_cubes(cube_hi, cube_lo_reproj,
                                         save_to_tmp_dir=use_save_to_tmp_dir,
+                                        dtype=dtype,
+                                        beam_tolerance=beam_tolerance,
+                                        rescale_jybm=rescale_jybm,
                                         **kwargs)
 
+        if output_is_zarr:
+            from .cube_io import write_zarr_cube
+
+            feathcube = write_zarr_cube(feathcube, output,
+                                        header=cube_hi.header,
+                                        chunks=zarr_chunks,
+                                        compressor=compressor,
+                                        overwrite=overwrite)
+
+        elif output is not None:
+            from .cube_io import create_fits_cube
+
+            feath_array = create_fits_cube(output, cube_hi.header,
+                                           feathcube.shape, dtype=dtype,
+                                           overwrite=overwrite)
+
+            da.store(feathcube._get_filled_data(fill=np.nan), feath_array)
+            feath_array.flush()
+
+            feathcube = SpectralCube(data=feath_array,
+                                     header=cube_hi.header,
+                                     wcs=cube_hi.wcs,
+                                     meta=cube_hi.meta)
+
     else:
 
-        if use_memmap:
+        if output_is_zarr:
+            raise ValueError("Zarr output is only supported with dask. Use a"
+                             " FITS output or load the cubes with use_dask=True.")
+
+        # The imaginary part is discarded, so use the real-input FFTs
+        # by default.
+        use_rfft = kwargs.pop('use_rfft', True)
+
+        nchan = cube_hi.shape[0]
+        channels = np.arange(nchan)
+        record_progress = None
+
+        if output is not None:
+            from .cube_io import (create_fits_cube, open_fits_cube,
+                                  feather_params_hash, FeatherCheckpoint)
+
+            if resume:
+                params_hash = feather_params_hash(cube_hi, cube_lo,
+                                                  dtype=np.dtype(dtype),
+                                                  use_rfft=use_rfft,
+                                                  beam_tolerance=beam_tolerance,
+                                                  **kwargs)
+                checkpoint = FeatherCheckpoint(output, params_hash, nchan)
+
+            if resume and not overwrite and checkpoint.exists():
+                checkpoint.load()
+                feath_array = open_fits_cube(output)
+                channels = checkpoint.missing()
+            else:
+                feath_array = create_fits_cube(output, cube_hi.header,
+                                               cube_hi.shape, dtype=dtype,
+                                               overwrite=overwrite)
+                if resume:
+                    checkpoint.save()
+
+            if resume:
+                def record_progress(chans):
+                    # The channels must be on disk before they are recorded
+                    feath_array.flush()
+                    checkpoint.record(chans)
+
+        elif use_memmap:
             from tempfile import NamedTemporaryFile
             fname = NamedTemporaryFile()
-            feath_array = np.memmap(fname, shape=cube_hi.shape, dtype=float, mode='w+')
+            feath_array = np.memmap(fname, shape=cube_hi.shape, dtype=dtype, mode='w+')
         else:
-            feath_array = np.empty(cube_hi.shape)
-
-        pb = tqdm(cube_hi.shape[0])
-        for ii in range(cube_hi.shape[0]):
-
-            hslc = cube_hi[ii]
-            lslc = cube_lo[ii]
-
-            feath_array[ii] = feather_simple(hslc, lslc, **kwargs).real
+            feath_array = np.empty(cube_hi.shape, dtype=dtype)
+
+        from .feather_plan import FeatherPlan, group_channels_by_beam
+
+        if hasattr(cube_lo, 'beams'):
+            # The beam changes between channels. Channels with the same beam
+            # share the kernel and unit conversion, so feather them together.
+            group_beams, group_ids = group_channels_by_beam(cube_lo.beams,
+                                                            tolerance=beam_tolerance)
+
+            nskipped = 0
+            for ii, beam_lo in enumerate(group_beams):
+                group_channels = np.intersect1d(np.flatnonzero(group_ids == ii),
+                                                channels)
+                if group_channels.size == 0:
+                    continue
+
+                plan = FeatherPlan(cube_hi.header, cube_lo.header,
+                                   beam_hi=cube_hi.beam, beam_lo=beam_lo,
+                                   use_rfft=use_rfft, dtype=dtype, **kwargs)
+                plan.apply_cube(cube_hi, cube_lo, out=feath_array,
+                                memory_limit=memory_limit, n_workers=n_workers,
+                                use_processes=use_processes,
+                                channels=group_channels,
+                                callback=record_progress)
+                nskipped += plan.nskipped
+
+        elif channels.size > 0:
+            # Everything but the FFTs is the same for every channel.
+            plan = FeatherPlan.from_cubes(cube_hi, cube_lo, use_rfft=use_rfft,
+                                          dtype=dtype, **kwargs)
+            plan.apply_cube(cube_hi, cube_lo, out=feath_array,
+                            memory_limit=memory_limit, n_workers=n_workers,
+                            use_processes=use_processes,
+                            channels=channels,
+                            callback=record_progress)
+            nskipped = plan.nskipped
+        else:
+            nskipped = 0
 
-            pb.update()
+        if nskipped > 0:
+            log.info("Skipped the FFTs of {0} of {1} channels that are constant"
+                     " or empty in both cubes.".format(nskipped, channels.size))
 
-            if use_memmap:
-                feath_array.flush()
+        if use_memmap or output is not None:
+            feath_array.flush()
 
         feathcube = SpectralCube(data=feath_array,
                                 header=cube_hi.header,
@@ -1312,7 +2018,8 @@ def fourier_combine_cubes(cube_hi, cube_lo,
     dcube_lo = fitshdu_low.data
     outcube = np.empty_like(dcube_hi)
 
-    kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale)
+    kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale,
+                                 use_rfft=True)
 
     log.info("Fourier combining each of {0} slices".format(dcube_hi.shape[0]))
     pb = tqdm(dcube_hi.shape[0])
@@ -1320,9 +2027,9 @@ def fourier_combine_cubes(cube_hi, cube_lo,
     for ii,(slc_hi,slc_lo) in enumerate(zip(dcube_hi, dcube_lo)):
 
         fftsum, combo = fftmerge(kfft, ikfft, slc_hi*highresscalefactor,
-                                 slc_lo*lowresscalefactor)
+                                 slc_lo*lowresscalefactor, use_rfft=True)
 
-        outcube[ii,:,:] = combo.real
+        outcube[ii,:,:] = combo
 
         pb.update(ii+1)
 
@@ -1337,6 +2044,67 @@ def fourier_combine_cubes(cube_hi, cube_lo,
         return outcube
 
 
+def _compare_spectra(hires, lores, highresextnum=0, lowresextnum=0,
+                     weights=None):
+    """
+    Load the images compared by `feather_compare`, regrid the low-resolution
+    image onto the high-resolution grid and Fourier transform both.
+
+    Only the kernel and the overlap region depend on the low-resolution FWHM,
+    so the spectra can be reused to compare several FWHMs (see
+    `~uvcombine.scale_factor.find_effSDbeam`).
+
+    Returns
+    -------
+    fft_hi, fft_lo : `~numpy.ndarray`
+        The (fftshifted) transforms of the high- and low-resolution images.
+    angscales : `~astropy.units.Quantity`
+        Angular scale of each point of the spectra.
+    pixscale : `~astropy.units.Quantity`
+        Pixel scale of the high-resolution image.
+    """
+
+    if not isinstance(hires, Projection):
+        if isinstance(hires, str):
+            hdu_hi = fits.open(hires)[highresextnum]
+        else:
+            hdu_hi = hires
+        proj_hi = Projection.from_hdu(hdu_hi)
+
+    else:
+        proj_hi = hires
+
+    if not isinstance(lores, Projection):
+        if isinstance(lores, str):
+            hdu_lo = fits.open(lores)[lowresextnum]
+        else:
+            hdu_lo = lores
+        proj_lo = Projection.from_hdu(hdu_lo)
+
+    else:
+        proj_lo = lores
+
+    # If weights are given, they must match the shape of the hires data
+    if weights is not None:
+        if not weights.shape == proj_hi.shape:
+            raise ValueError("weights must be an array with the same shape as"
+                             " the high-res data.")
+    else:
+        weights = 1.
+
+    proj_lo_regrid = proj_lo.reproject(proj_hi.header)
+
+    nax2, nax1 = proj_hi.shape
+    pixscale = np.abs(wcs.utils.proj_plane_pixel_scales(proj_hi.wcs.celestial)[0]) * u.deg
+
+    angscales = AnnulusIndex((nax2, nax1), pixscale).angscales
+
+    fft_hi = np.fft.fftshift(fft2(np.nan_to_num(proj_hi * weights)))
+    fft_lo = np.fft.fftshift(fft2(np.nan_to_num(proj_lo_regrid * weights)))
+
+    return fft_hi, fft_lo, angscales, pixscale
+
+
 def feather_compare(hires, lores,
                     SAS,
                     LAS,
@@ -1408,49 +2176,16 @@ def feather_compare(hires, lores,
     if LAS <= SAS:
         raise ValueError("Must have LAS > SAS. Check the input parameters.")
 
-    if not isinstance(hires, Projection):
-        if isinstance(hires, str):
-            hdu_hi = fits.open(hires)[highresextnum]
-        else:
-            hdu_hi = hires
-        proj_hi = Projection.from_hdu(hdu_hi)
+    fft_hi, fft_lo, angscales, pixscale = \
+        _compare_spectra(hires, lores, highresextnum=highresextnum,
+                         lowresextnum=lowresextnum, weights=weights)
 
-    else:
-        proj_hi = hires
-
-    if not isinstance(lores, Projection):
-        if isinstance(lores, str):
-            hdu_lo = fits.open(lores)[lowresextnum]
-        else:
-            hdu_lo = lores
-        proj_lo = Projection.from_hdu(hdu_lo)
-
-    else:
-        proj_lo = lores
-
-    # If weights are given, they must match the shape of the hires data
-    if weights is not None:
-        if not weights.shape == proj_hi.shape:
-            raise ValueError("weights must be an array with the same shape as"
-                             " the high-res data.")
-    else:
-        weights = 1.
-
-    proj_lo_regrid = proj_lo.reproject(proj_hi.header)
-
-    nax2, nax1 = proj_hi.shape
-    pixscale = np.abs(wcs.utils.proj_plane_pixel_scales(proj_hi.wcs.celestial)[0]) * u.deg
+    nax2, nax1 = fft_hi.shape
 
     kfft, ikfft = feather_kernel(nax2, nax1, lowresfwhm, pixscale)
     kfft = np.fft.fftshift(kfft)
     ikfft = np.fft.fftshift(ikfft)
 
-    yy,xx = np.indices([nax2, nax1])
-    rr = ((xx-(nax1-1)/2.)**2 + (yy-(nax2-1)/2.)**2)**0.5
-    angscales = nax1/rr * pixscale
-
-    fft_hi = np.fft.fftshift(np.fft.fft2(np.nan_to_num(proj_hi * weights)))
-    fft_lo = np.fft.fftshift(np.fft.fft2(np.nan_to_num(proj_lo_regrid * weights)))
     if beam_divide_lores:
         fft_lo_deconvolved = fft_lo / kfft
     else:
@@ -1509,6 +2244,191 @@ def feather_compare(hires, lores,
            }
 
 
+def feather_compare_cube(cube_hi, cube_lo,
+                         SAS,
+                         LAS,
+                         lowresfwhm=None,
+                         beam_divide_lores=True,
+                         min_beam_fraction=0.1,
+                         match_units=True,
+                         weights=None,
+                         allow_spectral_resample=True,
+                         return_samples=False,
+                         memory_limit=None,
+                         progressbar=True,
+                        ):
+    """
+    Compare the single-dish and interferometer cubes over the region where
+    they should agree, channel by channel, as in `feather_compare`.
+
+    The cubes are read in slabs of channels in one pass. The overlap region,
+    the angular scales and the kernel are computed once and shared by every
+    channel, and the low-resolution channels are regridded with the
+    precomputed interpolation of `~uvcombine.feather_plan.FeatherPlan`. The
+    statistics of the ratios give the scale factor as a function of channel.
+
+    Parameters
+    ----------
+    cube_hi : `~spectral_cube.SpectralCube` or str
+        The high-resolution cube or name of FITS file.
+    cube_lo : `~spectral_cube.SpectralCube` or str
+        The low-resolution cube or name of FITS file.
+    SAS : `astropy.units.Quantity`
+        The smallest angular scale to compare.
+    LAS : `astropy.units.Quantity`
+        The largest angular scale to compare (probably the LAS of the high
+        resolution data).
+    lowresfwhm : `astropy.units.Quantity`, optional
+        The FWHM of the low-resolution beam. Defaults to the major axis of
+        the beam of ``cube_lo``.
+    beam_divide_lores : bool, optional
+        Divide the low-resolution data by the beam weight. See
+        `feather_compare`.
+    min_beam_fraction : float, optional
+        The minimum fraction of the beam to include.
+    match_units : bool, optional
+        Convert the low-resolution cube to the units of the high-resolution
+        cube first, as in `feather_simple_cube`. The ratios are then the
+        scale factor to apply on top of the unit conversion.
+    weights : `~numpy.ndarray`, optional
+        Weights applied to both cubes. See `feather_compare`.
+    allow_spectral_resample : bool, optional
+        Interpolate ``cube_lo`` onto the spectral axis of ``cube_hi`` when
+        they differ.
+    return_samples : bool, optional
+        Also return the samples in the overlap region for every channel.
+    memory_limit : int, str or `~astropy.units.Quantity`, optional
+        Memory budget used to choose the number of channels read at once.
+        See `~uvcombine.feather_plan.FeatherPlan.slab_size`.
+    progressbar : bool, optional
+        Show a progress bar.
+
+    Returns
+    -------
+    stats : dict
+        Statistics of the ratio of the high-resolution FFT data to the
+        low-resolution FFT data over the range SAS < x < LAS, with the same
+        keys as `feather_compare`. Each is an array with one value per
+        channel, and ``nsamples`` holds the number of finite ratios in each
+        channel. Channels without data are NaN.
+    samples : tuple
+        Returned with ``return_samples``. The angular scale of each point of
+        the overlap region, and arrays of shape ``(nchan, npoints)`` with the
+        ratios, the high-res values and the low-res values. The pooled
+        samples of all channels are these arrays flattened.
+    """
+    from .feather_plan import FeatherPlan
+
+    if LAS <= SAS:
+        raise ValueError("Must have LAS > SAS. Check the input parameters.")
+
+    if not hasattr(cube_hi, 'shape'):
+        cube_hi = SpectralCube.read(cube_hi)
+    if not hasattr(cube_lo, 'shape'):
+        cube_lo = SpectralCube.read(cube_lo)
+
+    cube_lo = _match_spectral_axes(cube_hi, cube_lo,
+                                   allow_spectral_resample=allow_spectral_resample)
+
+    plan = FeatherPlan.from_cubes(cube_hi, cube_lo, lowresfwhm=lowresfwhm,
+                                  match_units=match_units, weights=weights,
+                                  use_rfft=True)
+
+    nchan = cube_hi.shape[0]
+    nax2, nax1 = plan.shape
+    pixscale = np.abs(plan.pixscale) * u.deg
+
+    # The overlap region is the same for every channel
+    angscales = AnnulusIndex((nax2, nax1), pixscale).angscales
+
+    kfft = np.fft.fftshift(feather_kernel(nax2, nax1, plan.lowresfwhm, pixscale)[0])
+
+    mask = (angscales > SAS) & (angscales < LAS) & (kfft >= min_beam_fraction)
+
+    if mask.sum() == 0:
+        raise ValueError("No valid uv-overlap region found. Check the inputs for "
+                         "SAS and LAS.")
+
+    kfft = kfft[mask]
+
+    # Locate the points of the (fftshifted) overlap region in the half-plane
+    # transforms of the real planes, using |F(-k)| = |F(k)|.
+    iy, ix = np.nonzero(mask)
+    ky = (iy - nax2 // 2) % nax2
+    kx = (ix - nax1 // 2) % nax1
+    mirror = kx > nax1 // 2
+    ky[mirror] = -ky[mirror] % nax2
+    kx[mirror] = -kx[mirror] % nax1
+    half_index = ky * (nax1 // 2 + 1) + kx
+
+    data_hi = cube_hi.unitless_filled_data
+    data_lo = cube_lo.unitless_filled_data
+
+    ratios = np.empty((nchan, half_index.size))
+    if return_samples:
+        abs_his = np.empty((nchan, half_index.size))
+        abs_los = np.empty((nchan, half_index.size))
+
+    if progressbar:
+        pb = tqdm(total=nchan)
+
+    nslab = plan.slab_size(memory_limit)
+
+    for start in range(0, nchan, nslab):
+        chans = slice(start, min(start + nslab, nchan))
+
+        im_hi, im_lo, _ = plan.prepare(np.asarray(data_hi[chans]),
+                                       np.asarray(data_lo[chans]),
+                                       channel=chans)
+
+        nplanes = im_hi.shape[0]
+        abs_hi = np.abs(rfft2(im_hi).reshape(nplanes, -1)[:, half_index])
+        abs_lo = np.abs(rfft2(im_lo).reshape(nplanes, -1)[:, half_index])
+
+        if beam_divide_lores:
+            abs_lo /= kfft
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios[chans] = abs_hi / abs_lo
+
+        if return_samples:
+            abs_his[chans] = abs_hi
+            abs_los[chans] = abs_lo
+
+        if progressbar:
+            pb.update(nplanes)
+
+    if progressbar:
+        pb.close()
+
+    finite = np.isfinite(ratios)
+    nsamples = finite.sum(axis=1)
+
+    out = {key: np.full(nchan, np.nan) for key in
+           ('median', 'mean', 'std', 'mean_sc', 'median_sc', 'std_sc')}
+    out['nsamples'] = nsamples
+
+    # Channels without finite ratios (e.g., blank channels) are left as NaN
+    valid = nsamples > 0
+    if valid.any():
+        valid_ratios = np.where(finite[valid], ratios[valid], np.nan)
+
+        out['median'][valid] = np.nanmedian(valid_ratios, axis=1)
+        out['mean'][valid] = np.nanmean(valid_ratios, axis=1)
+        out['std'][valid] = np.nanstd(valid_ratios, axis=1)
+
+        sclip = stats.sigma_clipped_stats(valid_ratios, sigma=3, maxiters=5,
+                                          axis=1)
+        out['mean_sc'][valid] = sclip[0]
+        out['median_sc'][valid] = sclip[1]
+        out['std_sc'][valid] = sclip[2]
+
+    if return_samples:
+        return out, (angscales.to(u.arcsec)[mask], ratios, abs_his, abs_los)
+
+    return out
+
+
 def angular_range_image_comparison(hires, lores, SAS, LAS, lowresfwhm,
                                    beam_divide_lores=True,
                                    lowpassfilterSD=False,
@@ -1576,12 +2496,10 @@ def angular_range_image_comparison(hires, lores, SAS, LAS, lowresfwhm,
     kfft = np.fft.fftshift(kfft)
     ikfft = np.fft.fftshift(ikfft)
 
-    yy,xx = np.indices([nax2, nax1])
-    rr = ((xx-(nax1-1)/2.)**2 + (yy-(nax2-1)/2.)**2)**0.5
-    angscales = nax1/rr * pixscale*u.deg
+    angscales = AnnulusIndex((nax2, nax1), pixscale*u.deg).angscales
 
-    fft_hi = np.fft.fftshift(np.fft.fft2(np.nan_to_num(proj_hi)))
-    fft_lo = np.fft.fftshift(np.fft.fft2(np.nan_to_num(proj_lo_regrid)))
+    fft_hi = np.fft.fftshift(fft2(np.nan_to_num(proj_hi)))
+    fft_lo = np.fft.fftshift(fft2(np.nan_to_num(proj_lo_regrid)))
     if beam_divide_lores:
         fft_lo_deconvolved = fft_lo / kfft
     else:
@@ -1596,9 +2514,9 @@ def angular_range_image_comparison(hires, lores, SAS, LAS, lowresfwhm,
         raise ValueError("No valid uv-overlap region found. Check the inputs for "
                          "SAS and LAS.")
 
-    hi_img_ring = (np.fft.ifft2(np.fft.fftshift(fft_hi*mask)))
-    lo_img_ring = (np.fft.ifft2(np.fft.fftshift(fft_lo*mask)))
-    lo_img_ring_deconv = (np.fft.ifft2(np.fft.fftshift(np.nan_to_num(fft_lo_deconvolved*mask))))
+    hi_img_ring = (ifft2(np.fft.fftshift(fft_hi*mask)))
+    lo_img_ring = (ifft2(np.fft.fftshift(fft_lo*mask)))
+    lo_img_ring_deconv = (ifft2(np.fft.fftshift(np.nan_to_num(fft_lo_deconvolved*mask))))
 
     lo_img = lo_img_ring_deconv if beam_divide_lores else lo_img_ring
 